@@ -1,17 +1,46 @@
-from fastapi import FastAPI, Query, UploadFile, File
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+
+from fastapi import FastAPI, HTTPException, Query, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from fastapi.responses import RedirectResponse
-from typing import List
+from pydantic import BaseModel, Field
+from fastapi.responses import PlainTextResponse, RedirectResponse, Response
+from typing import Dict, List
 from pathlib import Path
 
-from ..utils import config
-from .indexer import Indexer
+from ..utils import config, metrics
+from .extraction import extract_files
+from .indexer import Indexer, current_generation
+from .jobs import JobQueue, rebuild_in_subprocess
 from .query_engine import QueryEngine
+from .sharding import ShardedEngine, add_to_shards, ensure_shards, refresh_shard_suggestions, shards_generation
 
 
 class SearchResponse(BaseModel):
     results: list
+    timing: Dict[str, float] | None = None  # milliseconds per stage, with debug=timing
+    did_you_mean: str | None = None  # the query with unknown words corrected (fuzzy or no results)
+
+
+class SuggestResponse(BaseModel):
+    suggestions: List[Dict]  # {text, term, doc_freq}, most documents first
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., max_length=100)
+    k: int = Field(config.MAX_RESULTS, ge=1, le=100)
+    ranking: str | None = None
+    k1: float | None = Field(None, gt=0)
+    b: float | None = Field(None, ge=0, le=1)
+    fuzzy: bool = False
+
+
+class BatchSearchResponse(BaseModel):
+    results: List[list]  # one result list per query, in request order
 
 
 app = FastAPI(title="Mini Google Search")
@@ -27,19 +56,64 @@ app.add_middleware(
 @app.on_event("startup")
 def _startup():
     global _engine
-    # Ensure an index exists; if not, attempt to build
-    try:
-        _ = Indexer().load_index()
-    except AssertionError:
-        idx = Indexer()
-        idx.build_index(config.DATA_DIR)
-        idx.save_index()
-    _engine = QueryEngine()
+    # Ensure an index exists; if not, attempt to build (once, when several workers start)
+    if config.SHARDS > 1:
+        ensure_shards(config.DATA_DIR)
+    else:
+        Indexer().ensure_index(config.DATA_DIR)
+    _engine = _new_engine()
+    if config.RELOAD_INTERVAL > 0:
+        threading.Thread(target=_watch_generation, name="index-watch", daemon=True).start()
+
+
+# Reindex/upload jobs run one at a time in the background; their state is shared by workers
+_jobs = JobQueue(state_dir=Path(config.INDEX_DIR) / "jobs")
+_SWAP_LOCK = threading.Lock()
+_UPLOAD_CHUNK = 1024 * 1024
+
+
+def _watch_generation():
+    # Each uvicorn worker maps the same segment files; when any worker (or a job in this one)
+    # publishes a new manifest generation, the others load it here
+    meta = Path(config.INDEX_DIR) / ("shards.json" if config.SHARDS > 1 else "meta.json")
+    last = None
+    while True:
+        time.sleep(config.RELOAD_INTERVAL)
+        try:
+            mtime = meta.stat().st_mtime_ns
+        except OSError:
+            continue
+        if mtime == last:
+            continue
+        last = mtime
+        try:
+            if _published_generation() != _engine.indexer.index.generation:
+                _reload_engine()
+        except Exception:
+            traceback.print_exc()
+
+
+def _new_engine() -> QueryEngine:
+    return ShardedEngine() if config.SHARDS > 1 else QueryEngine()
+
+
+def _published_generation():
+    return shards_generation() if config.SHARDS > 1 else current_generation()
+
+
+def _reload_engine():
+    # Load and warm the new engine first, then swap the reference: requests already holding
+    # the old engine finish on it (its mmaps stay valid after its segments are deleted)
+    global _engine
+    with _SWAP_LOCK:
+        engine = _new_engine()
+        engine.warm(_engine.recent)
+        _engine = engine
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "ranking": config.RANKING_MODE}
+    return {"status": "ok", "ranking": config.RANKING_MODE, "generation": _engine.indexer.index.generation}
 
 
 @app.get("/")
@@ -47,100 +121,156 @@ def root():
     return RedirectResponse(url="/docs", status_code=302)
 
 
-@app.post("/index")
-def rebuild_index():
-    idx = Indexer()
-    idx.build_index(config.DATA_DIR)
-    idx.save_index()
-    # reload engine
-    global _engine
-    _engine = QueryEngine()
-    return {"indexed": idx.index.N}
+@app.post("/index", status_code=202)
+def rebuild_index(response: Response, workers: int | None = Query(None, ge=0), wait: bool = Query(False)):
+    # Queues a full rebuild (202); poll GET /jobs/{id}, or pass wait=true to block until it
+    # is done and get 200, or 500 if the rebuild failed
+    def run():
+        indexed = rebuild_in_subprocess(config.DATA_DIR, config.INDEX_DIR, workers, config.SHARDS)
+        _reload_engine()
+        return {"indexed": indexed}
+
+    job = _jobs.submit("reindex", run)
+    if wait:
+        job = _jobs.wait(job.id)
+        response.status_code = 500 if job.status == "failed" else 200
+    return job.to_dict()
+
+
+@app.get("/jobs")
+def list_jobs():
+    return {"jobs": [job.to_dict() for job in _jobs.list()]}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
 
 
 @app.get("/search", response_model=SearchResponse)
-def search(q: str = Query("", min_length=1), k: int = Query(config.MAX_RESULTS, ge=1, le=100), ranking: str | None = Query(None)):
-    results = _engine.search(q, k, ranking=ranking)
+def search(
+    q: str = Query("", min_length=1),
+    k: int = Query(config.MAX_RESULTS, ge=1, le=100),
+    ranking: str | None = Query(None),
+    k1: float | None = Query(None, gt=0),
+    b: float | None = Query(None, ge=0, le=1),
+    fuzzy: bool = Query(False),
+    debug: str | None = Query(None, pattern="^timing$"),
+):
+    # fuzzy=true searches for the corrected terms; did_you_mean is reported with fuzzy=true or
+    # when nothing matched
+    engine = _engine
+    if debug != "timing":
+        results = engine.search(q, k, ranking=ranking, k1=k1, b=b, fuzzy=fuzzy)
+        return {"results": results, "did_you_mean": engine.did_you_mean(q) if fuzzy or not results else None}
+    with metrics.trace() as spans:
+        results = engine.search(q, k, ranking=ranking, k1=k1, b=b, fuzzy=fuzzy)
+        did_you_mean = engine.did_you_mean(q) if fuzzy or not results else None
+    timing = {stage: round(s * 1e3, 3) for stage, s in spans.items()}
+    return {"results": results, "timing": timing, "did_you_mean": did_you_mean}
+
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+def search_batch(req: BatchSearchRequest):
+    results = _engine.search_many(req.queries, req.k, ranking=req.ranking, k1=req.k1, b=req.b, fuzzy=req.fuzzy)
     return {"results": results}
 
 
+@app.get("/suggest", response_model=SuggestResponse)
+def suggest(prefix: str = Query("", max_length=200), k: int = Query(10, ge=1, le=50)):
+    return {"suggestions": _engine.suggest(prefix, k)}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    # coalesced: searches in this worker that waited on an identical in-flight query instead
+    # of running it, across engine reloads (also in /metrics)
+    return {**_engine.cache.stats(), "coalesced": metrics.counter("mgs_search_coalesced_total")}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # Prometheus text exposition; per worker process, like /cache/stats
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/settings")
 def get_settings():
     return {"ranking": config.RANKING_MODE}
 
 
-def _extract_pdf_text_bytes(data: bytes) -> str:
-    # Try pdfminer first, fallback to PyPDF2
-    try:
-        from io import BytesIO
-        try:
-            from pdfminer.high_level import extract_text as pdfminer_extract
-
-            t = pdfminer_extract(BytesIO(data))
-            if t:
-                return t.strip()
-        except Exception:
-            pass
-        try:
-            from PyPDF2 import PdfReader
-
-            reader = PdfReader(BytesIO(data))
-            parts = []
-            for p in reader.pages:
-                parts.append((p.extract_text() or ""))
-            return "\n".join(parts).strip()
-        except Exception:
-            return ""
-    except Exception:
-        return ""
+def _spool(f: UploadFile, dest: Path) -> None:
+    with dest.open("wb") as out:
+        shutil.copyfileobj(f.file, out, _UPLOAD_CHUNK)
 
 
 @app.post("/upload")
-async def upload(files: List[UploadFile] = File(...)):
+async def upload(files: List[UploadFile] = File(...), wait: bool = Query(False)):
     data_dir = Path(config.DATA_DIR)
     data_dir.mkdir(parents=True, exist_ok=True)
-    saved = 0
-    saved_paths: list[str] = []
-    for f in files:
-        name = Path(f.filename or "upload").name
-        stem = Path(name).stem
-        suffix = Path(name).suffix.lower()
-        target = data_dir / f"{stem}.txt"
-        if target.exists():
-            i = 1
-            while (data_dir / f"{stem}_{i}.txt").exists():
-                i += 1
-            target = data_dir / f"{stem}_{i}.txt"
-
-        data = await f.read()
-        content = ""
-        if suffix == ".txt" or (f.content_type or "").endswith("plain"):
-            try:
-                content = data.decode("utf-8", errors="ignore")
-            except Exception:
-                content = ""
-        elif suffix == ".pdf" or (f.content_type or "").endswith("pdf"):
-            content = _extract_pdf_text_bytes(data)
-        else:
-            # skip unsupported types silently
-            content = ""
-
-        if not content:
-            continue
-        if not content.startswith(stem):
-            content = f"{stem}\n" + content
-        target.write_text(content, encoding="utf-8", errors="ignore")
-        saved += 1
-        saved_paths.append(str(target))
-
-    # rebuild index if we saved anything
-    if saved:
+    reports: list[dict] = []
+    pending = []  # (report, (source, kind, target, stem) for the extraction pool)
+    reserved: set[Path] = set()
+    with tempfile.TemporaryDirectory(prefix="mgs-upload-") as tmp:
+        for i, f in enumerate(files):
+            name = Path(f.filename or "upload").name
+            stem = Path(name).stem
+            suffix = Path(name).suffix.lower()
+            report = {"name": name, "status": "unsupported", "path": None, "chars": 0, "seconds": 0.0}
+            reports.append(report)
+            if suffix == ".txt" or (f.content_type or "").endswith("plain"):
+                kind = "text"
+            elif suffix == ".pdf" or (f.content_type or "").endswith("pdf"):
+                kind = "pdf"
+            else:
+                continue  # unsupported types are skipped
+            target = data_dir / f"{stem}.txt"
+            n = 0
+            while target.exists() or target in reserved:
+                n += 1
+                target = data_dir / f"{stem}_{n}.txt"
+            reserved.add(target)
+            # Streamed to disk in chunks off the event loop, never held in memory whole
+            src = Path(tmp) / f"{i}{suffix}"
+            await run_in_threadpool(_spool, f, src)
+            pending.append((report, (src, kind, target, stem)))
+        extracted = await run_in_threadpool(extract_files, [item for _, item in pending])
+    for (report, _), result in zip(pending, extracted):
+        report.update(result)
+    saved_paths = [r["path"] for r in reports if r["status"] == "saved"]
+    saved = len(saved_paths)
+
+    # index the new files as a segment in a background job; small segments are then
+    # compacted in the background as well
+    if not saved:
+        return {"saved": 0, "indexed": _engine.indexer.index.N, "paths": [], "files": reports, "job": None}
+
+    def run():
         idx = Indexer()
-        idx.build_index(data_dir)
-        idx.save_index()
-        global _engine
-        _engine = QueryEngine()
-        total = idx.index.N
-    else:
-        total = 0
-    return {"saved": saved, "indexed": total, "paths": saved_paths}
+        if config.SHARDS > 1:
+            # Appended to the last shard; its segments are merged within that shard
+            added, shard_dir = add_to_shards(saved_paths, data_dir)
+            _reload_engine()
+
+            def refresh():
+                # The shard's own suggest.bin is unused; the top-level one catches up instead
+                idx.merge_in_background(shard_dir, suggestions=False).join()
+                if refresh_shard_suggestions():
+                    _reload_engine()
+
+            threading.Thread(target=refresh, name="shard-refresh", daemon=True).start()
+            return {"added": added, "indexed": _engine.indexer.index.N}
+        added = idx.add_documents(saved_paths, data_dir)
+        _reload_engine()
+        idx.merge_in_background(on_merged=_reload_engine)
+        return {"added": added, "indexed": idx.index.N}
+
+    job = _jobs.submit("upload", run)
+    if wait:
+        job = await run_in_threadpool(_jobs.wait, job.id)
+    # indexed: documents searchable now (includes this upload only once its job has finished)
+    indexed = (job.result or {}).get("indexed", _engine.indexer.index.N)
+    return {"saved": saved, "indexed": indexed, "paths": saved_paths, "files": reports, "job": job.to_dict()}
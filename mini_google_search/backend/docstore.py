@@ -0,0 +1,121 @@
+import json
+import mmap
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+# Per segment: docs.json keeps paths, titles and urls (small, loaded into memory);
+# docstore.bin holds each document's content zlib-compressed on its own, and
+# docstore.idx the N+1 uint64 offsets of those blobs.
+DOCS_FILE = "docs.json"
+STORE_FILE = "docstore.bin"
+STORE_INDEX_FILE = "docstore.idx"
+
+_LITTLE = sys.byteorder == "little"
+
+
+def write_docstore(documents: Sequence, doc_paths: Sequence[str], out_dir: Path) -> None:
+    titles: List[str] = []
+    urls: List[str] = []
+    offsets = array("Q", [0])
+    with (out_dir / STORE_FILE).open("wb") as f:
+        for doc_id in range(len(doc_paths)):
+            if isinstance(documents, DocumentStore):
+                # Segment merges copy compressed blobs without recompressing
+                title, url = documents.header(doc_id)
+                blob = documents.compressed(doc_id)
+            else:
+                doc = documents[doc_id]
+                title, url = doc["title"], doc.get("url") or ""
+                blob = zlib.compress(doc["content"].encode("utf-8"))
+            titles.append(title)
+            urls.append(url)
+            f.write(blob)
+            offsets.append(offsets[-1] + len(blob))
+    if not _LITTLE:
+        offsets.byteswap()
+    with (out_dir / STORE_INDEX_FILE).open("wb") as f:
+        offsets.tofile(f)
+    docs = {"paths": list(doc_paths), "titles": titles, "urls": urls}
+    (out_dir / DOCS_FILE).write_text(json.dumps(docs), encoding="utf-8")
+
+
+class _SegmentDocs:
+    def __init__(self, seg_dir: Path, docs: Dict):
+        self.titles: List[str] = docs["titles"]
+        self.urls: List[str] = docs["urls"]
+        with (seg_dir / STORE_INDEX_FILE).open("rb") as f:
+            offsets = array("Q")
+            offsets.frombytes(f.read())
+        if not _LITTLE:
+            offsets.byteswap()
+        self.offsets = offsets
+        store = seg_dir / STORE_FILE
+        with store.open("rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if store.stat().st_size else b""
+
+    def compressed(self, i: int) -> bytes:
+        return self.data[self.offsets[i] : self.offsets[i + 1]]
+
+    def content(self, i: int) -> str:
+        return zlib.decompress(self.compressed(i)).decode("utf-8")
+
+
+class _LegacySegmentDocs:
+    # docs.json from before the document store, with contents inline
+    def __init__(self, docs: Dict):
+        self.documents: List[Dict[str, str]] = docs["documents"]
+        self.titles = [d["title"] for d in self.documents]
+        self.urls = [d.get("url") or "" for d in self.documents]
+
+    def compressed(self, i: int) -> bytes:
+        return zlib.compress(self.content(i).encode("utf-8"))
+
+    def content(self, i: int) -> str:
+        return self.documents[i]["content"]
+
+
+class DocumentStore(Sequence):
+    # docid -> {title, content, url} across segments; titles and urls are in memory,
+    # content is read from the mmap'd store and decompressed only when a doc is accessed
+    def __init__(self):
+        self._bases: List[int] = []
+        self._parts: List = []
+        self.doc_paths: List[str] = []
+        self._n = 0
+
+    def add_segment(self, seg_dir: Path) -> int:
+        docs = json.loads((seg_dir / DOCS_FILE).read_text(encoding="utf-8"))
+        part = _LegacySegmentDocs(docs) if "documents" in docs else _SegmentDocs(seg_dir, docs)
+        self._bases.append(self._n)
+        self._parts.append(part)
+        self.doc_paths.extend(docs["paths"])
+        self._n += len(docs["paths"])
+        return len(docs["paths"])
+
+    def _locate(self, doc_id: int) -> Tuple[object, int]:
+        if not 0 <= doc_id < self._n:
+            raise IndexError(doc_id)
+        i = bisect_right(self._bases, doc_id) - 1
+        return self._parts[i], doc_id - self._bases[i]
+
+    def header(self, doc_id: int) -> Tuple[str, str]:
+        part, i = self._locate(doc_id)
+        return part.titles[i], part.urls[i]
+
+    def title(self, doc_id: int) -> str:
+        return self.header(doc_id)[0]
+
+    def compressed(self, doc_id: int) -> bytes:
+        part, i = self._locate(doc_id)
+        return part.compressed(i)
+
+    def __getitem__(self, doc_id: int) -> Dict[str, str]:
+        part, i = self._locate(doc_id)
+        return {"title": part.titles[i], "content": part.content(i), "url": part.urls[i]}
+
+    def __len__(self) -> int:
+        return self._n
@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ..utils import config
+
+
+class ExtractionTimeout(BaseException):
+    # BaseException so the extractors' broad `except Exception` fallbacks cannot swallow it
+    pass
+
+
+@contextmanager
+def _deadline(seconds: float):
+    # SIGALRM in the pool process interrupts a runaway (pure-Python) extractor; without
+    # SIGALRM (Windows) the limit is not enforced
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise ExtractionTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _pdf_text(path: str) -> str:
+    # Try pdfminer first, fallback to PyPDF2
+    try:
+        from pdfminer.high_level import extract_text as pdfminer_extract
+
+        t = pdfminer_extract(path)
+        if t:
+            return t.strip()
+    except Exception:
+        pass
+    try:
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(path)
+        return "\n".join((p.extract_text() or "") for p in reader.pages).strip()
+    except Exception:
+        return ""
+
+
+def _extract_file(src: str, kind: str, target: str, stem: str, timeout: float) -> Tuple[str, int, float]:
+    # Runs in a pool process: writes the text of src to target with the stem as its first
+    # line; returns (status, chars, seconds spent extracting)
+    start = time.perf_counter()
+    try:
+        with _deadline(timeout):
+            if kind == "pdf":
+                content = _pdf_text(src)
+            else:
+                content = Path(src).read_bytes().decode("utf-8", errors="ignore")
+    except ExtractionTimeout:
+        return "timeout", 0, time.perf_counter() - start
+    if not content:
+        return "empty", 0, time.perf_counter() - start
+    if not content.startswith(stem):
+        content = f"{stem}\n" + content
+    Path(target).write_text(content, encoding="utf-8", errors="ignore")
+    return "saved", len(content), time.perf_counter() - start
+
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    # Shared by all uploads in this process, so concurrent uploads queue for the same
+    # MGS_EXTRACT_WORKERS processes instead of each starting their own
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            workers = config.EXTRACT_WORKERS or os.cpu_count() or 1
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _POOL
+
+
+def _reset_pool(broken: ProcessPoolExecutor) -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is broken:
+            _POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_files(files: List[Tuple[Path, str, Path, str]], timeout: float | None = None) -> List[Dict]:
+    # files: (source, kind "text"|"pdf", target .txt, stem). All files are extracted in
+    # parallel, each under its own timeout; blocks until every one has finished.
+    timeout = config.EXTRACT_TIMEOUT if timeout is None else timeout
+    pool = _pool()
+    futures: List[Future] = []
+    for src, kind, target, stem in files:
+        futures.append(pool.submit(_extract_file, str(src), kind, str(target), stem, timeout))
+    out: List[Dict] = []
+    for (_, _, target, _), future in zip(files, futures):
+        try:
+            status, chars, seconds = future.result()
+        except BrokenProcessPool:
+            # A worker died (e.g. a crash in a PDF library): start a fresh pool next time
+            _reset_pool(pool)
+            status, chars, seconds = "error", 0, 0.0
+        except Exception:
+            status, chars, seconds = "error", 0, 0.0
+        path = str(target) if status == "saved" else None
+        out.append({"status": status, "path": path, "chars": chars, "seconds": round(seconds, 4)})
+    return out
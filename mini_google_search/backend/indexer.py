@@ -1,95 +1,580 @@
+import hashlib
 import json
 import math
+import os
 import pickle
+import threading
+import uuid
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
 
-from ..utils import config
-from ..utils.text_cleaning import preprocess
+from ..utils import config, metrics
+from ..utils.text_cleaning import preprocess, preprocess_with_positions
+from . import segment
+from .segment import ImpactIndex, Postings
+from .suggest import build as build_suggestions, save_suggestions, segment_doc_freqs, write_suggestions
+
+
+LEGACY_FORMAT = "pickle"
+# A sharded index dir holds shards.json plus one ordinary index dir per shard
+SHARDS_FILE = "shards.json"
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialised within one process
+    fcntl = None
+
+
+class _IndexLock:
+    # A thread lock plus an flock on a file in the index root, so writers in other worker
+    # processes are excluded too; re-entrant within a thread per root. A shard dir locks
+    # its sharded root, so rebuilds, uploads and merges of any shard exclude each other.
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.RLock()
+        self._held: Dict[Path, List] = {}  # root -> [flock fd or None, depth]
+
+    @contextmanager
+    def hold(self, index_dir: Path):
+        root = _lock_root(index_dir)
+        with self._lock:
+            held = self._held.get(root)
+            if held is None:
+                fd = None
+                if fcntl is not None:
+                    root.mkdir(parents=True, exist_ok=True)
+                    fd = os.open(root / self.name, os.O_RDWR | os.O_CREAT, 0o644)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                held = self._held[root] = [fd, 0]
+            held[1] += 1
+            try:
+                yield
+            finally:
+                held[1] -= 1
+                if held[1] == 0:
+                    del self._held[root]
+                    if held[0] is not None:
+                        fcntl.flock(held[0], fcntl.LOCK_UN)
+                        os.close(held[0])
+
+
+def _lock_root(index_dir: Path) -> Path:
+    index_dir = Path(index_dir).resolve()
+    return index_dir.parent if (index_dir.parent / SHARDS_FILE).exists() else index_dir
+
+
+# Serialises manifest read-modify-write cycles and keeps one merge running per index
+_META_LOCK = _IndexLock(".meta.lock")
+_MERGE_LOCK = _IndexLock(".merge.lock")
 
 
 @dataclass
 class Index:
-    inverted_index: Dict[str, Dict[str, int]] = field(default_factory=dict)
-    doc_lengths: Dict[str, int] = field(default_factory=dict)
-    documents: Dict[str, Dict[str, str]] = field(default_factory=dict)  # id -> {title, content, url}
-    doc_freq: Dict[str, int] = field(default_factory=dict)
-    idf: Dict[str, float] = field(default_factory=dict)
+    # Plain dicts/arrays after build_index; mmap-backed views after load_index
+    inverted_index: Mapping[str, Postings] = field(default_factory=dict)
+    doc_lengths: array = field(default_factory=lambda: array("I"))  # docid -> length
+    documents: Sequence[Dict[str, str]] = field(default_factory=list)  # docid -> {title, content, url}; DocumentStore when loaded
+    doc_paths: List[str] = field(default_factory=list)  # docid -> relative path
+    doc_freq: Mapping[str, int] = field(default_factory=dict)
+    idf: Mapping[str, float] = field(default_factory=dict)
     N: int = 0
     avgdl: float = 0.0
+    impacts: Optional[ImpactIndex] = None  # quantized BM25 impacts, only when loaded from disk
+    generation: str = field(default_factory=lambda: uuid.uuid4().hex)  # changes whenever the contents do
+    vectors: Optional[str] = None  # dense vectors file in the index dir, when one was written
 
 
 class Indexer:
     def __init__(self):
         self.index = Index()
 
-    def build_index(self, data_dir: str | Path) -> None:
+    def build_index(
+        self, data_dir: str | Path, workers: int | None = None, paths: List[Path] | None = None
+    ) -> None:
+        # paths: index only these files under data_dir (default: every .txt, sorted)
         data_dir = Path(data_dir)
         assert data_dir.exists(), f"Data directory not found: {data_dir}"
+        paths = sorted(data_dir.glob("**/*.txt")) if paths is None else paths
+        workers = config.INDEX_WORKERS if workers is None else workers
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(paths) > 1:
+            self.index = self._build_parallel(paths, data_dir, workers)
+        else:
+            self.index = self._build(paths, data_dir)
 
-        documents: Dict[str, Dict[str, str]] = {}
-        inverted: Dict[str, Dict[str, int]] = {}
-        doc_lengths: Dict[str, int] = {}
+    @staticmethod
+    def _build(paths: Iterable[Path], data_dir: Path) -> Index:
+        part = _index_files(paths, data_dir)
+        with metrics.stage("index", "stats"):
+            return _with_stats(part)
 
-        for path in sorted(data_dir.glob("**/*.txt")):
-            doc_id = str(path.relative_to(data_dir))
-            content = path.read_text(encoding="utf-8", errors="ignore")
-            if not content.strip():
-                continue
-            lines = content.splitlines()
-            title = lines[0].strip() if lines else path.stem
-            url = ""
-            documents[doc_id] = {"title": title, "content": content, "url": url}
+    @staticmethod
+    def _build_parallel(paths: List[Path], data_dir: Path, workers: int) -> Index:
+        # Contiguous chunks in path order, so concatenating the partial indexes with
+        # docid offsets reproduces the serial build exactly (including term order)
+        n_chunks = min(len(paths), workers * 4)
+        size = -(-len(paths) // n_chunks)
+        chunks = [paths[i : i + size] for i in range(0, len(paths), size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = []
+            for part, drained in pool.map(_index_chunk, chunks, [data_dir] * len(chunks)):
+                parts.append(part)
+                metrics.merge(drained)
+        with metrics.stage("index", "merge"):
+            merged = _merge_partials(parts)
+        with metrics.stage("index", "stats"):
+            return _with_stats(merged)
 
-            tokens = preprocess(content)
-            doc_lengths[doc_id] = len(tokens)
-            tf: Dict[str, int] = {}
-            for t in tokens:
-                tf[t] = tf.get(t, 0) + 1
-            for term, freq in tf.items():
-                postings = inverted.setdefault(term, {})
-                postings[doc_id] = freq
+    def rebuild_index(
+        self, data_dir: str | Path, index_dir: str | Path | None = None, workers: int | None = None
+    ) -> Path:
+        # build_index + save_index holding the index lock from the glob through the publish,
+        # so an upload either lands in the glob or is added on top of the new index afterwards
+        index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        with _META_LOCK.hold(index_dir):
+            self.build_index(data_dir, workers=workers)
+            return self.save_index(index_dir)
+
+    def save_index(self, index_dir: str | Path | None = None, impacts: bool | None = None) -> Path:
+        # Replaces whatever is on disk with self.index as a single segment
+        index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        with _META_LOCK.hold(index_dir):
+            old = _read_meta(index_dir)
+            name = _next_segment_name(old)
+            with metrics.stage("index", "write"):
+                written = segment.write_segment(self.index, index_dir / name, _impact_params(impacts))
+            entry = {"name": name, **written}
+            meta = _manifest([entry], old)
+            meta["epoch"] = uuid.uuid4().hex
+            write_suggestions(index_dir, [index_dir / name])
+            meta["suggest_docs"] = self.index.N
+            meta["vectors"] = _write_vectors(index_dir, self.index)
+            _write_meta(index_dir, meta)
+            self.index.generation = meta["generation"]
+            self.index.vectors = meta["vectors"]
+        for stale in _segment_entries(old):
+            segment.delete_segment(index_dir / stale["name"])
+        _delete_vectors(index_dir, old, meta)
+        legacy = index_dir / "index.pkl"
+        if legacy.exists():
+            legacy.unlink()
+        return index_dir
 
-        N = len(documents)
-        avgdl = sum(doc_lengths.values()) / N if N else 0.0
+    def add_documents(self, paths: Iterable[str | Path], data_dir: str | Path, index_dir: str | Path | None = None) -> int:
+        # Indexes only the given files as a new segment; returns how many documents were added
+        data_dir = Path(data_dir)
+        index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        with _META_LOCK.hold(index_dir):
+            meta = _read_meta(index_dir)
+            if meta.get("format", LEGACY_FORMAT) == LEGACY_FORMAT and (index_dir / "index.pkl").exists():
+                self.migrate_index(index_dir)
+                meta = _read_meta(index_dir)
+            if meta:
+                self.load_index(index_dir)
+            known = set(self.index.doc_paths) if meta else set()
+            new = sorted({Path(p) for p in paths if str(Path(p).relative_to(data_dir)) not in known})
+            part = self._build(new, data_dir)
+            if not part.N:
+                return 0
+            name = _next_segment_name(meta)
+            entry = {"name": name, **segment.write_segment(part, index_dir / name)}
+            entries = _segment_entries(meta) + [entry]
+            # suggest.bin and the vectors keep covering the older docs until the background
+            # refresh after the merges (refresh_suggestions, refresh_vectors)
+            _write_meta(index_dir, _manifest(entries, meta))
+        self.load_index(index_dir)
+        return part.N
 
-        # Compute document frequency and idf (BM25-style)
-        doc_freq = {term: len(postings) for term, postings in inverted.items()}
-        idf = {}
-        for term, df in doc_freq.items():
-            idf_val = math.log((N - df + 0.5) / (df + 0.5) + 1)
-            idf[term] = idf_val
+    def maybe_merge(self, index_dir: str | Path | None = None, factor: int | None = None) -> bool:
+        # Applies one step of the merge policy; returns True if segments were merged
+        index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        factor = config.MERGE_FACTOR if factor is None else factor
+        with _MERGE_LOCK.hold(index_dir):
+            entries = _segment_entries(_read_meta(index_dir))
+            span = segment.merge_candidates([e["N"] for e in entries], factor)
+            if span is None:
+                return False
+            merging = entries[span[0] : span[1]]
+            fields = segment.open_segments([index_dir / e["name"] for e in merging], [e["N"] for e in merging])
+            with _META_LOCK.hold(index_dir):
+                meta = _read_meta(index_dir)
+                name = _next_segment_name(meta)
+                # Reserve the name before writing outside the manifest lock
+                meta["next_segment"] = int(name.split("_")[1]) + 1
+                _write_meta(index_dir, meta)
+            # A merge of every segment covers the whole collection, so its impacts are valid
+            impacts = _impact_params(None if len(merging) == len(entries) else False)
+            entry = {"name": name, **segment.write_segment(Index(**fields), index_dir / name, impacts)}
+            merged_names = {e["name"] for e in merging}
+            with _META_LOCK.hold(index_dir):
+                meta = _read_meta(index_dir)
+                current = _segment_entries(meta)
+                if not merged_names <= {e["name"] for e in current}:
+                    # A full rebuild replaced the segments meanwhile; drop the merged copy
+                    segment.delete_segment(index_dir / name)
+                    return False
+                # Segments only ever get appended while a merge runs, so the span is still contiguous
+                first = next(i for i, e in enumerate(current) if e["name"] in merged_names)
+                kept = [e for e in current if e["name"] not in merged_names]
+                _write_meta(index_dir, _manifest(kept[:first] + [entry] + kept[first:], meta))
+        for e in merging:
+            segment.delete_segment(index_dir / e["name"])
+        return True
 
-        self.index = Index(
-            inverted_index=inverted,
-            doc_lengths=doc_lengths,
-            documents=documents,
-            doc_freq=doc_freq,
-            idf=idf,
-            N=N,
-            avgdl=avgdl,
-        )
+    def refresh_suggestions(self, index_dir: str | Path | None = None) -> bool:
+        # Rebuilds suggest.bin (prefix table and deletion index) once uploads have added docs
+        # it does not cover; returns True if a new one was published. Merges keep every doc
+        # freq, so only uploads make it stale.
+        index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        with _MERGE_LOCK.hold(index_dir):
+            meta = _read_meta(index_dir)
+            entries = _segment_entries(meta)
+            if not entries or meta.get("suggest_docs") == meta["N"]:
+                return False
+            buf = build_suggestions(segment_doc_freqs([index_dir / e["name"] for e in entries]))
+            with _META_LOCK.hold(index_dir):
+                current = _read_meta(index_dir)
+                if current.get("epoch") != meta.get("epoch"):
+                    return False  # replaced by a full rebuild meanwhile
+                save_suggestions(index_dir, buf)
+                _write_meta(index_dir, {**current, "suggest_docs": meta["N"], "generation": uuid.uuid4().hex})
+        return True
 
-    def save_index(self, index_dir: str | Path | None = None) -> Path:
+    def refresh_vectors(self, index_dir: str | Path | None = None) -> bool:
+        # Rebuilds the dense vectors once uploads have added docs they do not cover; returns
+        # True if new ones were published. Runs after merges, never in the upload path.
         index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
-        index_dir.mkdir(parents=True, exist_ok=True)
-        out_path = index_dir / "index.pkl"
-        with out_path.open("wb") as f:
-            pickle.dump(self.index, f)
-        # Save compact metadata for debugging
-        meta = {
-            "N": self.index.N,
-            "avgdl": self.index.avgdl,
-            "terms": len(self.index.inverted_index),
-        }
-        (index_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
-        return out_path
+        if not config.VECTOR_DIM:
+            return False
+        with _MERGE_LOCK.hold(index_dir):
+            meta = _read_meta(index_dir)
+            entries = _segment_entries(meta)
+            if not entries or not _vectors_stale(index_dir, meta):
+                return False
+            fields = segment.open_segments([index_dir / e["name"] for e in entries], [e["N"] for e in entries])
+            name = _write_vectors(index_dir, Index(**fields))
+            if name is None:
+                return False
+            with _META_LOCK.hold(index_dir):
+                current = _read_meta(index_dir)
+                # A full rebuild meanwhile renumbered the docs; uploads only append, so the
+                # new vectors still cover a prefix of the docids
+                if current.get("epoch") != meta.get("epoch") or current.get("vectors") != meta.get("vectors"):
+                    (index_dir / name).unlink(missing_ok=True)
+                    return False
+                new = {**current, "vectors": name, "generation": uuid.uuid4().hex}
+                _write_meta(index_dir, new)
+        _delete_vectors(index_dir, meta, new)
+        return True
+
+    def merge_in_background(
+        self,
+        index_dir: str | Path | None = None,
+        on_merged: Optional[Callable[[], None]] = None,
+        suggestions: bool = True,
+    ) -> threading.Thread:
+        # Merges, then brings suggest.bin (unless suggestions=False) and the vectors up to date;
+        # on_merged runs if anything was published
+        def run():
+            changed = False
+            while self.maybe_merge(index_dir):
+                changed = True
+            if suggestions and self.refresh_suggestions(index_dir):
+                changed = True
+            if self.refresh_vectors(index_dir):
+                changed = True
+            if changed and on_merged is not None:
+                on_merged()
+
+        thread = threading.Thread(target=run, name="segment-merge", daemon=True)
+        thread.start()
+        return thread
 
     def load_index(self, index_dir: str | Path | None = None) -> None:
         index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        meta_path = index_dir / "meta.json"
+        for attempt in range(3):
+            meta = _read_meta(index_dir)
+            fmt = meta.get("format", LEGACY_FORMAT)
+            if fmt == LEGACY_FORMAT:
+                self.index = self._load_pickle(index_dir)
+                return
+            if fmt != segment.FORMAT:
+                raise ValueError(f"Unknown index format {fmt!r} in {meta_path}")
+            if meta.get("version") not in (1, segment.FORMAT_VERSION):
+                raise ValueError(f"Unsupported {fmt} version {meta.get('version')} in {meta_path}")
+            entries = _segment_entries(meta)
+            impacts = entries[0].get("impacts") if len(entries) == 1 else None
+            try:
+                fields = segment.open_segments(
+                    [index_dir / e["name"] for e in entries], [e["N"] for e in entries], impacts
+                )
+            except FileNotFoundError:
+                # A merge replaced segments between reading the manifest and opening them
+                if attempt == 2:
+                    raise
+                continue
+            self.index = Index(**fields, generation=_generation(meta), vectors=meta.get("vectors"))
+            return
+
+    def ensure_index(self, data_dir: str | Path, index_dir: str | Path | None = None) -> None:
+        # Loads the index, building it first if there is none; with several workers starting
+        # at once only the first builds, the rest wait on the lock and load its result
+        index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        try:
+            self.load_index(index_dir)
+            return
+        except AssertionError:
+            pass
+        with _META_LOCK.hold(index_dir):
+            try:
+                self.load_index(index_dir)
+            except AssertionError:
+                self.build_index(data_dir)
+                self.save_index(index_dir)
+
+    def migrate_index(self, index_dir: str | Path | None = None) -> bool:
+        # Rewrites a legacy index.pkl in the segment format; returns False if already migrated
+        index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        if _read_meta(index_dir).get("format", LEGACY_FORMAT) != LEGACY_FORMAT:
+            return False
+        self.index = self._load_pickle(index_dir)
+        self.save_index(index_dir)
+        return True
+
+    @staticmethod
+    def _load_pickle(index_dir: Path) -> Index:
         pkl = index_dir / "index.pkl"
         assert pkl.exists(), f"Index not found at {pkl}. Build it first."
         with pkl.open("rb") as f:
-            self.index = pickle.load(f)
+            index = pickle.load(f)
+        generation = f"pkl-{pkl.stat().st_mtime_ns}"
+        fields = vars(index)
+        if "doc_paths" in fields:
+            index.generation = generation
+            return index
+        # Pickles from before docids: postings and lengths are dicts keyed by path
+        doc_paths = list(fields["documents"])
+        docids = {path: i for i, path in enumerate(doc_paths)}
+        inverted: Dict[str, Postings] = {}
+        for term, postings in fields["inverted_index"].items():
+            pairs = sorted((docids[path], tf) for path, tf in postings.items())
+            inverted[term] = Postings(array("I", (d for d, _ in pairs)), array("I", (tf for _, tf in pairs)))
+        return Index(
+            inverted_index=inverted,
+            doc_lengths=array("I", (fields["doc_lengths"].get(path, 0) for path in doc_paths)),
+            documents=[fields["documents"][path] for path in doc_paths],
+            doc_paths=doc_paths,
+            doc_freq=fields["doc_freq"],
+            idf=fields["idf"],
+            N=fields["N"],
+            avgdl=fields["avgdl"],
+            generation=generation,
+        )
+
+
+def _index_files(paths: Iterable[Path], data_dir: Path) -> Index:
+    # Postings, lengths and documents only; collection stats are added by _with_stats
+    documents: List[Dict[str, str]] = []
+    doc_paths: List[str] = []
+    inverted: Dict[str, Postings] = {}
+    doc_lengths = array("I")
+
+    for path in paths:
+        with metrics.stage("index", "read"):
+            content = path.read_text(encoding="utf-8", errors="ignore")
+        if not content.strip():
+            continue
+        # Docids are dense and assigned in path order, so appends keep postings sorted
+        doc_id = len(documents)
+        lines = content.splitlines()
+        title = lines[0].strip() if lines else path.stem
+        url = ""
+        documents.append({"title": title, "content": content, "url": url})
+        doc_paths.append(str(path.relative_to(data_dir)))
+
+        if config.POSITIONS:
+            with metrics.stage("index", "analyze"):
+                analyzed = preprocess_with_positions(content)
+            with metrics.stage("index", "invert"):
+                doc_lengths.append(len(analyzed))
+                occurrences: Dict[str, List[int]] = {}
+                for term, pos, start, end in analyzed:
+                    occ = occurrences.get(term)
+                    if occ is None:
+                        occ = occurrences[term] = []
+                    occ += (pos, start, end)
+                for term, occ in occurrences.items():
+                    postings = inverted.get(term)
+                    if postings is None:
+                        postings = inverted[term] = Postings(positions=array("I"))
+                    postings.doc_ids.append(doc_id)
+                    postings.tfs.append(len(occ) // 3)
+                    postings.positions.extend(occ)
+            continue
+
+        with metrics.stage("index", "analyze"):
+            tokens = preprocess(content)
+        with metrics.stage("index", "invert"):
+            doc_lengths.append(len(tokens))
+            tf: Dict[str, int] = {}
+            for t in tokens:
+                tf[t] = tf.get(t, 0) + 1
+            for term, freq in tf.items():
+                postings = inverted.get(term)
+                if postings is None:
+                    postings = inverted[term] = Postings()
+                postings.doc_ids.append(doc_id)
+                postings.tfs.append(freq)
+
+    return Index(
+        inverted_index=inverted,
+        doc_lengths=doc_lengths,
+        documents=documents,
+        doc_paths=doc_paths,
+        N=len(documents),
+    )
+
+
+def _index_chunk(paths: List[Path], data_dir: Path) -> Tuple[Index, Tuple]:
+    # Pool worker for _build_parallel: the partial index plus the metrics it recorded
+    return _index_files(paths, data_dir), metrics.drain()
+
+
+def _merge_partials(parts: List[Index]) -> Index:
+    merged = Index()
+    inverted: Dict[str, Postings] = {}
+    base = 0
+    for part in parts:
+        for term, postings in part.inverted_index.items():
+            target = inverted.get(term)
+            if target is None:
+                target = inverted[term] = Postings()
+            target.doc_ids.extend(d + base for d in postings.doc_ids)
+            target.tfs.extend(postings.tfs)
+            if postings.positions is not None:
+                if target.positions is None:
+                    target.positions = array("I")
+                target.positions.extend(postings.positions)
+        merged.doc_lengths.extend(part.doc_lengths)
+        merged.documents.extend(part.documents)
+        merged.doc_paths.extend(part.doc_paths)
+        base += part.N
+    merged.inverted_index = inverted
+    merged.N = base
+    return merged
+
+
+def _with_stats(index: Index) -> Index:
+    N = index.N
+    index.avgdl = sum(index.doc_lengths) / N if N else 0.0
+
+    # Compute document frequency and idf (BM25-style)
+    doc_freq = {term: len(postings) for term, postings in index.inverted_index.items()}
+    for postings in index.inverted_index.values():
+        postings.max_tf, postings.min_dl = segment.term_bounds(postings, index.doc_lengths)
+    idf = {}
+    for term, df in doc_freq.items():
+        idf_val = math.log((N - df + 0.5) / (df + 0.5) + 1)
+        idf[term] = idf_val
+    index.doc_freq = doc_freq
+    index.idf = idf
+    return index
+
+
+def _impact_params(enabled: bool | None) -> Optional[Tuple[float, float]]:
+    enabled = config.IMPACT_INDEX if enabled is None else enabled
+    return (config.BM25_K1, config.BM25_B) if enabled else None
+
+
+def _write_vectors(index_dir: Path, index: Index) -> Optional[str]:
+    # Dense vectors for ranking=hybrid, when enabled and NumPy is installed
+    if not config.VECTOR_DIM:
+        return None
+    try:
+        from .vectors import write_vectors
+    except ImportError:
+        return None
+    with metrics.stage("index", "vectors"):
+        return write_vectors(index_dir, index)
+
+
+def _vectors_stale(index_dir: Path, meta: Dict) -> bool:
+    if not meta.get("vectors"):
+        return True
+    try:
+        from .vectors import doc_count
+
+        return doc_count(index_dir / meta["vectors"]) < meta["N"]
+    except (ImportError, OSError, ValueError):
+        return True
+
+
+def _delete_vectors(index_dir: Path, old: Dict, new: Dict) -> None:
+    # Engines still serving the old manifest keep their mmap of the file
+    name = old.get("vectors")
+    if name and name != new.get("vectors"):
+        (index_dir / name).unlink(missing_ok=True)
+
+
+def _read_meta(index_dir: Path) -> Dict:
+    meta_path = index_dir / "meta.json"
+    return json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {}
+
+
+def _write_meta(index_dir: Path, meta: Dict) -> None:
+    # meta.json is the commit point: readers only ever see a complete manifest
+    tmp = index_dir / "meta.json.tmp"
+    tmp.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    os.replace(tmp, index_dir / "meta.json")
+
+
+def _segment_entries(meta: Dict) -> List[Dict]:
+    if meta.get("format") != segment.FORMAT:
+        return []
+    if meta.get("version") == 1:
+        # Single segment stored directly in the index dir
+        return [{"name": "", "N": meta["N"], "total_length": meta["total_length"], "terms": meta["terms"]}]
+    return list(meta.get("segments", []))
+
+
+def current_generation(index_dir: str | Path | None = None) -> Optional[str]:
+    # Generation id of the published manifest, without opening any segment
+    meta = _read_meta(Path(index_dir) if index_dir else Path(config.INDEX_DIR))
+    return _generation(meta) if meta.get("format") == segment.FORMAT else None
+
+
+def _generation(meta: Dict) -> str:
+    # Manifests written before generation ids get one derived from their contents
+    if "generation" in meta:
+        return meta["generation"]
+    return hashlib.sha1(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def _next_segment_name(meta: Dict) -> str:
+    return f"seg_{int(meta.get('next_segment', 1)):06d}"
+
 
+def _manifest(entries: List[Dict], previous: Dict) -> Dict:
+    N = sum(e["N"] for e in entries)
+    total = sum(e["total_length"] for e in entries)
+    names = [int(e["name"].split("_")[1]) for e in entries if e["name"]]
+    return {
+        "format": segment.FORMAT,
+        "version": segment.FORMAT_VERSION,
+        "N": N,
+        "avgdl": total / N if N else 0.0,
+        "segments": entries,
+        "next_segment": max(names + [int(previous.get("next_segment", 1)) - 1]) + 1,
+        "generation": uuid.uuid4().hex,
+        # Merges and uploads keep every docid, so the vectors stay valid for the docs they cover
+        "vectors": previous.get("vectors"),
+        "epoch": previous.get("epoch"),  # new with every full rebuild, which renumbers the docs
+        "suggest_docs": previous.get("suggest_docs"),  # docs whose terms suggest.bin holds
+    }
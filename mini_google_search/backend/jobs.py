@@ -0,0 +1,139 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..utils import metrics
+from .indexer import Indexer
+from .sharding import build_shards
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = "queued"  # queued -> running -> succeeded | failed
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class JobQueue:
+    # Runs jobs one at a time on a background thread, so index writers never overlap, and
+    # remembers the most recent `keep` jobs for status queries. With a state_dir every status
+    # change is also written there, so any worker process can answer for any job.
+    def __init__(self, keep: int = 100, state_dir: str | Path | None = None):
+        self.keep = keep
+        self.state_dir = Path(state_dir) if state_dir else None
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._futures: Dict[str, Future] = {}
+
+    def submit(self, kind: str, fn: Callable[[], Dict[str, Any]]) -> Job:
+        job = Job(id=uuid.uuid4().hex, kind=kind)
+
+        def run():
+            job.started = time.time()
+            job.status = "running"
+            self._persist(job)
+            try:
+                job.result = fn()
+                job.status = "succeeded"
+            except Exception as exc:
+                job.error = f"{type(exc).__name__}: {exc}"
+                job.status = "failed"
+                traceback.print_exc()
+            finally:
+                job.finished = time.time()
+                self._persist(job)
+
+        self._persist(job)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._futures[job.id] = self._pool.submit(run)
+            while len(self._jobs) > self.keep:
+                old_id, old = next(iter(self._jobs.items()))
+                if old.status in ("queued", "running"):
+                    break
+                del self._jobs[old_id]
+                self._futures.pop(old_id, None)
+                if self.state_dir is not None:
+                    (self.state_dir / f"{old_id}.json").unlink(missing_ok=True)
+        return job
+
+    def _persist(self, job: Job) -> None:
+        if self.state_dir is None:
+            return
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_dir / f".{job.id}.tmp"
+        tmp.write_text(json.dumps(job.to_dict()), encoding="utf-8")
+        os.replace(tmp, self.state_dir / f"{job.id}.json")
+
+    def _load(self, path: Path) -> Optional[Job]:
+        try:
+            return Job(**json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.state_dir is not None and job_id.isalnum():
+            job = self._load(self.state_dir / f"{job_id}.json")
+        return job
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            jobs = dict(self._jobs)
+        if self.state_dir is not None and self.state_dir.exists():
+            for path in self.state_dir.glob("*.json"):
+                if path.stem not in jobs and (job := self._load(path)) is not None:
+                    jobs[job.id] = job
+        return sorted(jobs.values(), key=lambda j: j.created)
+
+    def wait(self, job_id: str, timeout: float | None = None) -> Optional[Job]:
+        # Only jobs submitted by this process can be waited on; others return their last state
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            wait_futures([future], timeout=timeout)
+        return self.get(job_id)
+
+
+def _rebuild(data_dir: str, index_dir: str, workers: Optional[int], shards: int) -> Tuple[int, Tuple]:
+    # Returns the document count and the build's metrics, for the serving process to merge
+    if shards > 1:
+        n = build_shards(data_dir, index_dir, shards, workers)
+    else:
+        idx = Indexer()
+        idx.rebuild_index(data_dir, index_dir, workers)
+        n = idx.index.N
+    return n, metrics.drain()
+
+
+def rebuild_in_subprocess(
+    data_dir: str | Path, index_dir: str | Path, workers: int | None = None, shards: int = 1
+) -> int:
+    # The build runs in its own interpreter so it never holds the serving process's GIL;
+    # it publishes through save_index (segment dir renamed into place, then manifest swap),
+    # or shards.json when sharded
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        n, drained = pool.submit(_rebuild, str(data_dir), str(index_dir), workers, shards).result()
+    metrics.merge(drained)
+    return n
@@ -0,0 +1,73 @@
+import math
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+
+class NumpyScorer:
+    # Vectorized exhaustive BM25/TF-IDF over one loaded index: each term's contribution is
+    # scatter-added into a dense accumulator in query-term order, so per-doc sums match the
+    # pure-Python scorers bit for bit, and argpartition picks the top k.
+    def __init__(self, index):
+        self.index = index
+        self.doc_lengths = np.frombuffer(index.doc_lengths, dtype=np.uint32).astype(np.float64)
+        self._norms: Dict[Tuple[float, float], np.ndarray] = {}
+
+    def _postings(self, term: str, lookup: Optional[Mapping] = None):
+        postings = (self.index.inverted_index if lookup is None else lookup).get(term)
+        if not postings:
+            return None
+        doc_ids = np.frombuffer(postings.doc_ids, dtype=np.uint32)
+        tfs = np.frombuffer(postings.tfs, dtype=np.uint32).astype(np.float64)
+        return doc_ids, tfs
+
+    def _denom_norm(self, k1: float, b: float) -> np.ndarray:
+        norm = self._norms.get((k1, b))
+        if norm is None:
+            avgdl = self.index.avgdl + 1e-9
+            norm = self._norms[(k1, b)] = k1 * (1 - b + b * self.doc_lengths / avgdl)
+        return norm
+
+    def bm25_top_k(
+        self, query_terms: List[str], k: int, k1: float, b: float, lookup: Optional[Mapping] = None
+    ) -> List[Tuple[int, float]]:
+        idx = self.index
+        scores = np.zeros(idx.N, dtype=np.float64)
+        norm = self._denom_norm(k1, b)
+        for term in query_terms:
+            found = self._postings(term, lookup)
+            if found is None:
+                continue
+            doc_ids, tfs = found
+            idf = idx.idf.get(term, 0.0)
+            # docids are unique within a posting list, so fancy-index += is a true scatter-add
+            scores[doc_ids] += idf * (tfs * (k1 + 1)) / (tfs + norm[doc_ids])
+        return self._top_k(scores, k)
+
+    def tfidf_top_k(self, query_terms: List[str], k: int, lookup: Optional[Mapping] = None) -> List[Tuple[int, float]]:
+        idx = self.index
+        scores = np.zeros(idx.N, dtype=np.float64)
+        q_tf: Dict[str, int] = {}
+        for t in query_terms:
+            q_tf[t] = q_tf.get(t, 0) + 1
+        for term, qf in q_tf.items():
+            found = self._postings(term, lookup)
+            if found is None:
+                continue
+            doc_ids, tfs = found
+            df = idx.doc_freq.get(term, 1)
+            idf = math.log((idx.N + 1) / df) + 1.0
+            scores[doc_ids] += (tfs * idf) * (qf * idf)
+        return self._top_k(scores, k)
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        # Same order as QueryEngine._top_k: score descending, ties to the lower docid
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            part = np.argpartition(-scores[candidates], k - 1)[:k]
+            kth = scores[candidates[part]].min()
+            # Keep every doc tied with the k-th score so the docid tie-break is exact
+            candidates = candidates[scores[candidates] >= kth]
+        order = np.lexsort((candidates, -scores[candidates]))[:k]
+        return [(int(d), float(scores[d])) for d in candidates[order]]
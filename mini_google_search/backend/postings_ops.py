@@ -0,0 +1,140 @@
+import heapq
+from bisect import bisect_left
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from .segment import Postings
+
+
+def gallop(seq: Sequence[int], target: int, lo: int = 0) -> int:
+    # First index >= lo whose value is >= target: exponential probe from lo, then bisect
+    n = len(seq)
+    if lo >= n or seq[lo] >= target:
+        return lo
+    step = 1
+    hi = lo + 1
+    while hi < n and seq[hi] < target:
+        lo = hi
+        step *= 2
+        hi = lo + step
+    return bisect_left(seq, target, lo + 1, min(hi, n))
+
+
+def intersect(lists: List[Sequence[int]]) -> List[int]:
+    # Rarest first: walk the shortest list and gallop through the others
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    cursors = [0] * len(lists)
+    out: List[int] = []
+    for doc_id in lists[0]:
+        for j in range(1, len(lists)):
+            seq = lists[j]
+            c = cursors[j] = gallop(seq, doc_id, cursors[j])
+            if c >= len(seq):
+                return out
+            if seq[c] != doc_id:
+                break
+        else:
+            out.append(doc_id)
+    return out
+
+
+def matching(postings: Postings, candidates: Optional[Sequence[int]]) -> Iterator[Tuple[int, int]]:
+    # (doc_id, tf) pairs, restricted to the sorted candidate docids when given
+    if candidates is None:
+        return zip(postings.doc_ids, postings.tfs)
+    return _matching(postings, candidates)
+
+
+def _matching(postings: Postings, candidates: Sequence[int]) -> Iterator[Tuple[int, int]]:
+    doc_ids = postings.doc_ids
+    c = 0
+    for doc_id in candidates:
+        c = gallop(doc_ids, doc_id, c)
+        if c >= len(doc_ids):
+            return
+        if doc_ids[c] == doc_id:
+            yield doc_id, postings.tfs[c]
+
+
+class PositionCursor:
+    # Forward-only cursor over a positional posting list; tracks the running occurrence
+    # offset so seeking costs the tfs skipped rather than a prefix sum per doc
+    def __init__(self, postings: Postings):
+        self.postings = postings
+        self.i = 0
+        self.occ = 0
+
+    def seek(self, doc_id: int) -> bool:
+        p = self.postings
+        i = gallop(p.doc_ids, doc_id, self.i)
+        if i > self.i:
+            self.occ += sum(p.tfs[self.i : i])
+            self.i = i
+        return i < len(p.doc_ids) and p.doc_ids[i] == doc_id
+
+    def positions(self) -> Sequence[int]:
+        # Token positions of the current doc, ascending
+        tf = self.postings.tfs[self.i]
+        return self.postings.positions[3 * self.occ : 3 * (self.occ + tf) : 3]
+
+
+def phrase_docs(postings: List[Postings], offsets: List[int]) -> List[int]:
+    # Docs where term i occurs at (start + offsets[i]) for some start
+    docs = intersect([p.doc_ids for p in postings])
+    if any(p.positions is None for p in postings):
+        return docs  # no positional data: fall back to co-occurrence
+    cursors = [PositionCursor(p) for p in postings]
+    out: List[int] = []
+    for doc_id in docs:
+        for c in cursors:
+            c.seek(doc_id)
+        rest = [(off - offsets[0], set(c.positions())) for off, c in zip(offsets[1:], cursors[1:])]
+        if any(all(pos + delta in s for delta, s in rest) for pos in cursors[0].positions()):
+            out.append(doc_id)
+    return out
+
+
+def near_docs(a: Postings, b: Postings, distance: int) -> List[int]:
+    # Docs where the two terms occur within `distance` token positions, in either order
+    docs = intersect([a.doc_ids, b.doc_ids])
+    if a.positions is None or b.positions is None:
+        return docs
+    ca, cb = PositionCursor(a), PositionCursor(b)
+    out: List[int] = []
+    for doc_id in docs:
+        ca.seek(doc_id)
+        cb.seek(doc_id)
+        pa, pb = ca.positions(), cb.positions()
+        i = j = 0
+        while i < len(pa) and j < len(pb):
+            if abs(pa[i] - pb[j]) <= distance:
+                out.append(doc_id)
+                break
+            if pa[i] < pb[j]:
+                i += 1
+            else:
+                j += 1
+    return out
+
+
+def union(lists: List[Sequence[int]]) -> List[int]:
+    out: List[int] = []
+    for doc_id in heapq.merge(*lists):
+        if not out or out[-1] != doc_id:
+            out.append(doc_id)
+    return out
+
+
+def difference(docs: Sequence[int], excluded: List[Sequence[int]]) -> List[int]:
+    # docs minus every excluded list, galloping through each exclusion
+    cursors = [0] * len(excluded)
+    out: List[int] = []
+    for doc_id in docs:
+        for j, seq in enumerate(excluded):
+            c = cursors[j] = gallop(seq, doc_id, cursors[j])
+            if c < len(seq) and seq[c] == doc_id:
+                break
+        else:
+            out.append(doc_id)
+    return out
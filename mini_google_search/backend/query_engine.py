@@ -1,111 +1,714 @@
+import heapq
 import math
-from typing import Dict, List, Tuple
+import re
+import threading
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
 
-from ..utils import config
-from ..utils.caching import get_cache_backend
-from ..utils.text_cleaning import preprocess
+from ..utils import config, metrics
+from ..utils.caching import LRUCache, SingleFlight, get_cache_backend
+from ..utils.text_cleaning import ANALYZER
 from .indexer import Indexer
+from .postings_ops import difference, intersect, matching, near_docs, phrase_docs, union
+from .query_parser import Near, Node, ParsedQuery, Phrase, Term, parse_query
+from .segment import Postings, quantize, term_bounds
+from .suggest import Suggester, build as build_suggestions
+
+try:
+    from . import vectors as dense
+except ImportError:  # NumPy not installed: ranking=hybrid is plain BM25
+    dense = None
+
+# Slack on upper-bound comparisons so float rounding can never prune a true top-k doc
+_PRUNE_EPS = 1e-9
+
+_LAST_TOKEN_RE = re.compile(r"[a-z0-9]+$")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_OPERATORS = {"AND", "OR", "NOT", "NEAR"}
+# Query terms whose correction (or lack of one) each engine remembers
+_SPELL_MEMO = 4096
+
+_BATCH_POOL: Optional[ThreadPoolExecutor] = None
+_BATCH_POOL_LOCK = threading.Lock()
+
+
+def _batch_pool() -> ThreadPoolExecutor:
+    # Shared by every engine and batch in this process: engines are swapped on reload and a
+    # pool per batch paid thread start-up on every request
+    global _BATCH_POOL
+    with _BATCH_POOL_LOCK:
+        if _BATCH_POOL is None:
+            _BATCH_POOL = ThreadPoolExecutor(max_workers=config.BATCH_WORKERS, thread_name_prefix="search-batch")
+        return _BATCH_POOL
 
 
 class QueryEngine:
-    def __init__(self):
-        self.indexer = Indexer()
-        self.indexer.load_index()
+    def __init__(self, index_dir: str | Path | None = None):
+        self.indexer = self._load(index_dir)
+        self.index_dir = Path(index_dir or config.INDEX_DIR)
+        # Persisted next to the index by the indexer; None = built from the index on first use
+        self.suggester = Suggester.open(self.index_dir)
+        self.vectors = self._open_vectors()
+        self.spelled = LRUCache(maxsize=_SPELL_MEMO, max_bytes=0, ttl=0)  # term -> correction, "" = none
         self.cache = get_cache_backend()
+        self.flights = SingleFlight()
+        self.recent: Deque[str] = deque(maxlen=config.WARM_QUERIES)  # raw queries, replayed by warm()
+        # False = score every candidate (exhaustive); True = MaxScore top-k for BM25
+        self.pruning = config.TOPK_PRUNING
+        self.scorer = None
+        if config.SCORING_BACKEND == "numpy":
+            try:
+                from .numpy_scoring import NumpyScorer
+
+                self.scorer = NumpyScorer(self.indexer.index)
+            except ImportError:
+                pass  # NumPy not installed: pure-Python scoring
+
+    def _load(self, index_dir: str | Path | None) -> Indexer:
+        indexer = Indexer()
+        indexer.load_index(index_dir)
+        return indexer
 
     # ----- Ranking functions -----
-    def _bm25_scores(self, query_terms: List[str]) -> Dict[str, float]:
+    # Term-at-a-time over the postings arrays; per-doc sums are accumulated in
+    # query-term order so scores are identical to the doc-at-a-time formulation.
+    # `candidates` (sorted docids) restricts scoring to those docs.
+    def _bm25_scores(
+        self,
+        query_terms: List[str],
+        k1: float | None = None,
+        b: float | None = None,
+        candidates: Optional[Sequence[int]] = None,
+        lookup: Optional[Mapping[str, Postings]] = None,
+    ) -> Dict[int, float]:
         idx = self.indexer.index
-        scores: Dict[str, float] = {}
-        k1 = config.BM25_K1
-        b = config.BM25_B
-
-        candidate_docs = set()
-        for term in set(query_terms):
-            postings = idx.inverted_index.get(term)
-            if postings:
-                candidate_docs.update(postings.keys())
-
-        for doc_id in candidate_docs:
-            dl = idx.doc_lengths.get(doc_id, 0)
-            denom_norm = k1 * (1 - b + b * dl / (idx.avgdl + 1e-9))
-            s = 0.0
-            for term in query_terms:
-                postings = idx.inverted_index.get(term)
-                if not postings or doc_id not in postings:
-                    continue
-                tf = postings[doc_id]
-                idf = idx.idf.get(term, 0.0)
-                s += idf * (tf * (k1 + 1)) / (tf + denom_norm)
-            if s != 0.0:
-                scores[doc_id] = s
-        return scores
-
-    def _tfidf_scores(self, query_terms: List[str]) -> Dict[str, float]:
+        lookup = idx.inverted_index if lookup is None else lookup
+        scores: Dict[int, float] = {}
+        k1 = config.BM25_K1 if k1 is None else k1
+        b = config.BM25_B if b is None else b
+        doc_lengths = idx.doc_lengths
+        avgdl = idx.avgdl + 1e-9
+
+        for term in query_terms:
+            postings = lookup.get(term)
+            if not postings:
+                continue
+            idf = idx.idf.get(term, 0.0)
+            for doc_id, tf in matching(postings, candidates):
+                denom_norm = k1 * (1 - b + b * doc_lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * (tf * (k1 + 1)) / (tf + denom_norm)
+        return {doc_id: s for doc_id, s in scores.items() if s != 0.0}
+
+    def _tfidf_scores(
+        self,
+        query_terms: List[str],
+        candidates: Optional[Sequence[int]] = None,
+        lookup: Optional[Mapping[str, Postings]] = None,
+    ) -> Dict[int, float]:
         idx = self.indexer.index
-        scores: Dict[str, float] = {}
+        lookup = idx.inverted_index if lookup is None else lookup
+        scores: Dict[int, float] = {}
         # Query tf
         q_tf: Dict[str, int] = {}
         for t in query_terms:
             q_tf[t] = q_tf.get(t, 0) + 1
 
-        candidate_docs = set()
-        for term in set(query_terms):
-            postings = idx.inverted_index.get(term)
-            if postings:
-                candidate_docs.update(postings.keys())
+        for term, qf in q_tf.items():
+            postings = lookup.get(term)
+            if not postings:
+                continue
+            df = idx.doc_freq.get(term, 1)
+            idf = math.log((idx.N + 1) / df) + 1.0
+            for doc_id, tf_d in matching(postings, candidates):
+                scores[doc_id] = scores.get(doc_id, 0.0) + (tf_d * idf) * (qf * idf)
+        return {doc_id: s for doc_id, s in scores.items() if s != 0.0}
+
+    def _bm25_top_k(
+        self,
+        query_terms: List[str],
+        k: int,
+        k1: float | None = None,
+        b: float | None = None,
+        lookup: Optional[Mapping[str, Postings]] = None,
+    ) -> List[Tuple[int, float]]:
+        # MaxScore: terms sorted by score upper bound; once the heap is full, terms whose
+        # cumulative bound cannot beat the k-th score become non-essential and are only
+        # probed for docs reached through the essential ones.
+        idx = self.indexer.index
+        lookup = idx.inverted_index if lookup is None else lookup
+        k1 = config.BM25_K1 if k1 is None else k1
+        b = config.BM25_B if b is None else b
+        doc_lengths = idx.doc_lengths
+        avgdl = idx.avgdl + 1e-9
+
+        q_tf: Dict[str, int] = {}
+        for t in query_terms:
+            q_tf[t] = q_tf.get(t, 0) + 1
+        terms = []  # (upper bound, term, doc_ids, tfs, idf, query multiplicity)
+        for term, qf in q_tf.items():
+            postings = lookup.get(term)
+            if not postings:
+                continue
+            idf = idx.idf.get(term, 0.0)
+            max_tf, min_dl = term_bounds(postings, doc_lengths)
+            ub = qf * idf * (max_tf * (k1 + 1)) / (max_tf + k1 * (1 - b + b * min_dl / avgdl))
+            terms.append((ub, term, postings.doc_ids, postings.tfs, idf, qf))
+        if not terms:
+            return []
+        if len(terms) == 1:
+            return self._bm25_single_top_k(terms[0][2:], k, k1, b)
+        terms.sort(key=lambda x: x[0])
+        prefix_ub = []
+        total = 0.0
+        for ub, *_ in terms:
+            total += ub
+            prefix_ub.append(total)
+
+        n = len(terms)
+        # Each term's contribution to the current doc goes in its slot; the exact score adds
+        # the slots in query-term order (absent terms add 0.0), exactly like _bm25_scores
+        slot = {term: i for i, (_, term, *_) in enumerate(terms)}
+        order = [slot[t] for t in query_terms if t in slot]
+        contrib = [0.0] * n
+        zeros = [0.0] * n
+        cursors = [0] * n
+        end = len(doc_lengths)  # past every docid
+        heads = [ids[0] for _, _, ids, *_ in terms]  # docid under each cursor, end when exhausted
+        heap: List[Tuple[float, int]] = []  # (score, -doc_id); min-heap holds the current top k
+        threshold = -1.0
+        first_essential = 0
+
+        while True:
+            doc_id = min(heads[first_essential:])
+            if doc_id >= end:
+                break
+
+            denom_norm = k1 * (1 - b + b * doc_lengths[doc_id] / avgdl)
+            contrib[:] = zeros
+            partial = 0.0
+            for i in range(first_essential, n):
+                if heads[i] == doc_id:
+                    _, _, ids, tf_col, idf, qf = terms[i]
+                    c = cursors[i]
+                    tf = tf_col[c]
+                    contrib[i] = w = idf * (tf * (k1 + 1)) / (tf + denom_norm)
+                    partial += qf * w
+                    c += 1
+                    cursors[i] = c
+                    heads[i] = ids[c] if c < len(ids) else end
+
+            # Docids arrive in increasing order, so a new doc must strictly beat the k-th score
+            pruned = False
+            for i in range(first_essential - 1, -1, -1):
+                if partial + prefix_ub[i] + _PRUNE_EPS <= threshold:
+                    pruned = True
+                    break
+                _, _, ids, tf_col, idf, qf = terms[i]
+                c = bisect_left(ids, doc_id, cursors[i])
+                cursors[i] = c
+                if c < len(ids) and ids[c] == doc_id:
+                    tf = tf_col[c]
+                    contrib[i] = w = idf * (tf * (k1 + 1)) / (tf + denom_norm)
+                    partial += qf * w
+            if pruned or partial + _PRUNE_EPS <= threshold:
+                continue
+
+            s = 0.0
+            for i in order:
+                s += contrib[i]
+            if s == 0.0:
+                continue
+            entry = (s, -doc_id)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            else:
+                continue
+            if len(heap) == k:
+                threshold = heap[0][0]
+                if total + _PRUNE_EPS <= threshold:
+                    break  # no other doc can reach the top k
+                while prefix_ub[first_essential] + _PRUNE_EPS <= threshold:
+                    first_essential += 1
+
+        return [(-neg_id, s) for s, neg_id in sorted(heap, reverse=True)]
+
+    def _bm25_single_top_k(self, term, k: int, k1: float, b: float) -> List[Tuple[int, float]]:
+        # One distinct query term leaves nothing to prune: its contributions are computed in
+        # one pass (added qf times, as _bm25_scores does) and the top k selected
+        doc_ids, tfs, idf, qf = term
+        idx = self.indexer.index
+        doc_lengths = idx.doc_lengths
+        avgdl = idx.avgdl + 1e-9
+        k1_plus = k1 + 1
+        base = [idf * (tf * k1_plus) / (tf + k1 * (1 - b + b * doc_lengths[d] / avgdl)) for d, tf in zip(doc_ids, tfs)]
+        scores = base
+        for _ in range(qf - 1):
+            scores = [s + w for s, w in zip(scores, base)]
+        # The k-th largest score from the bare floats, then only the docs reaching it are sorted
+        kth = heapq.nlargest(k, scores)[-1] if 0 < k < len(scores) else 0.0
+        hits = [(d, s) for d, s in zip(doc_ids, scores) if s >= kth and s != 0.0]
+        hits.sort(key=lambda x: (-x[1], x[0]))
+        return hits[:k]
+
+    def _impacts_for(self, k1: float, b: float):
+        # Impacts are only usable if built for these parameters and the current collection
+        idx = self.indexer.index
+        impacts = idx.impacts
+        if impacts is None:
+            return None
+        p = impacts.params
+        if p["k1"] != k1 or p["b"] != b or p["N"] != idx.N or p["avgdl"] != idx.avgdl:
+            return None
+        return impacts
+
+    def _bm25_impact_top_k(
+        self, query_terms: List[str], k: int, impacts, lookup: Optional[Mapping[str, Postings]] = None
+    ) -> List[Tuple[int, float]]:
+        # Score-at-a-time: runs of equal impact are consumed across all query terms in
+        # descending order of their weight (impact * the term's quantization step). We stop
+        # once no unseen contribution can change top-k membership (or after IMPACT_BUDGET
+        # postings), then complete the members' sums from the docid-ordered postings.
+        idx = self.indexer.index
+        q_tf: Dict[str, int] = {}
+        for t in query_terms:
+            q_tf[t] = q_tf.get(t, 0) + 1
+        lists = []  # [doc_ids, impacts, query multiplicity * step, cursor]
+        steps: Dict[str, float] = {}
+        for term, qf in q_tf.items():
+            found = impacts.get(term)
+            if found is not None and len(found[0]):
+                lists.append([found[0], found[1], qf * found[2], 0])
+                steps[term] = found[2]
+        if not lists:
+            return []
+
+        acc: Dict[int, float] = {}
+        heap = [(-w * imps[0], i) for i, (_, imps, w, _) in enumerate(lists)]
+        heapq.heapify(heap)
+        remaining = sum(-h for h, _ in heap)  # bound on what any doc can still gain
+        processed = 0
+        budget = config.IMPACT_BUDGET
+        complete = True
+        while heap:
+            neg, i = heapq.heappop(heap)
+            doc_ids, imps, w, c = lists[i]
+            level = imps[c]
+            end = c
+            while end < len(doc_ids) and imps[end] == level:
+                d = doc_ids[end]
+                acc[d] = acc.get(d, 0.0) - neg
+                end += 1
+            lists[i][3] = end
+            remaining += neg
+            if end < len(doc_ids):
+                head = w * imps[end]
+                remaining += head
+                heapq.heappush(heap, (-head, i))
+            processed += end - c
+            if not heap:
+                break
+            if budget and processed >= budget:
+                complete = False
+                break
+            if len(acc) >= k:
+                top = heapq.nlargest(k + 1, acc.values())
+                kth = top[k - 1]
+                nxt = top[k] if len(top) > k else 0.0
+                if kth > nxt + remaining and kth > remaining:
+                    complete = False
+                    break
+
+        members = heapq.nsmallest(k, acc.items(), key=lambda x: (-x[1], x[0]))
+        if complete:
+            return members
 
-        for doc_id in candidate_docs:
+        k1 = impacts.params["k1"]
+        b = impacts.params["b"]
+        avgdl = idx.avgdl + 1e-9
+        scored = []
+        for doc_id, _ in members:
+            denom_norm = k1 * (1 - b + b * idx.doc_lengths[doc_id] / avgdl)
             s = 0.0
-            for term, qf in q_tf.items():
-                postings = idx.inverted_index.get(term)
-                if not postings or doc_id not in postings:
+            for term in query_terms:
+                postings = (idx.inverted_index if lookup is None else lookup).get(term)
+                if not postings or term not in steps:
                     continue
-                df = idx.doc_freq.get(term, 1)
-                idf = math.log((idx.N + 1) / df) + 1.0
-                tf_d = postings[doc_id]
-                s += (tf_d * idf) * (qf * idf)
-            if s != 0.0:
-                scores[doc_id] = s
-        return scores
+                c = bisect_left(postings.doc_ids, doc_id)
+                if c < len(postings) and postings.doc_ids[c] == doc_id:
+                    tf = postings.tfs[c]
+                    step = steps[term]
+                    s += quantize(idx.idf.get(term, 0.0) * (tf * (k1 + 1)) / (tf + denom_norm), step) * step
+            scored.append((doc_id, s))
+        scored.sort(key=lambda x: (-x[1], x[0]))
+        return scored
+
+    def _match_docs(self, node: Node, lookup: Optional[Mapping[str, Postings]] = None) -> Sequence[int]:
+        # Sorted docids matching a query node: conjunctions intersect rarest-first with
+        # galloping, disjunctions merge, exclusions filter the survivors
+        index = self.indexer.index.inverted_index if lookup is None else lookup
+        if isinstance(node, Term):
+            postings = index.get(node.term)
+            return postings.doc_ids if postings else []
+        if isinstance(node, Phrase):
+            postings = [index.get(t) for t, _ in node.terms]
+            if not all(postings):
+                return []
+            return phrase_docs(postings, [off for _, off in node.terms])
+        if isinstance(node, Near):
+            pa, pb = index.get(node.left), index.get(node.right)
+            if not pa or not pb:
+                return []
+            return near_docs(pa, pb, node.distance)
+        if node.must:
+            lists = []
+            for child in node.must:
+                docs = self._match_docs(child, lookup)
+                if not len(docs):
+                    return []
+                lists.append(docs)
+            docs = intersect(lists)
+        elif node.should:
+            docs = union([self._match_docs(child, lookup) for child in node.should])
+        else:
+            return []  # only exclusions: nothing to rank
+        if node.must_not and docs:
+            docs = difference(docs, [self._match_docs(child, lookup) for child in node.must_not])
+        return docs
+
+    @staticmethod
+    def _top_k(scores: Dict[int, float], k: int) -> List[Tuple[int, float]]:
+        # Highest scores first; ties go to the lower docid
+        return heapq.nsmallest(k, scores.items(), key=lambda x: (-x[1], x[0]))
 
     # ----- Public API -----
-    def search(self, query: str, k: int = None, ranking: str | None = None) -> List[Dict]:
-        if not query or not query.strip():
-            return []
+    def search(
+        self,
+        query: str,
+        k: int = None,
+        ranking: str | None = None,
+        k1: float | None = None,
+        b: float | None = None,
+        fuzzy: bool = False,
+    ) -> List[Dict]:
+        return self.search_many([query], k, ranking, k1, b, fuzzy)[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = None,
+        ranking: str | None = None,
+        k1: float | None = None,
+        b: float | None = None,
+        fuzzy: bool = False,
+    ) -> List[List[Dict]]:
+        # Results per query, in input order. Equivalent queries are computed once, the cache
+        # is read with one multi-get and the misses are computed together (_compute).
+        # fuzzy=True searches for the closest indexed term in place of each unknown one.
+        with metrics.stage("query", "search"):
+            k, mode, k1, b = self._options(k, ranking, k1, b)
+            parsed: Dict[str, ParsedQuery] = {}
+            keys: List[Optional[str]] = []
+            for query in queries:
+                if not query or not query.strip():
+                    keys.append(None)
+                    continue
+                self.recent.append(query)
+                with metrics.stage("query", "analyze"):
+                    p = parse_query(query)
+                if fuzzy:
+                    fixes = self.corrections(p.lookup_terms())
+                    if fixes:
+                        p = p.rewrite(fixes)
+                key = self._cache_key(p, mode, k, k1, b)
+                parsed.setdefault(key, p)
+                keys.append(key)
+            unique = list(parsed)
+            with metrics.stage("query", "cache"):
+                found = dict(zip(unique, self.cache.get_many(unique)))
+            misses = [key for key in unique if found[key] is None]
+            metrics.inc("mgs_cache_hits_total", len(unique) - len(misses))
+            metrics.inc("mgs_cache_misses_total", len(misses))
+            if misses:
+                computed = self._compute(misses, parsed, mode, k, k1, b)
+                with metrics.stage("query", "cache"):
+                    self.cache.set_many(list(zip(misses, computed)))
+                found.update(zip(misses, computed))
+            return [found[key] if key is not None else [] for key in keys]
+
+    @staticmethod
+    def _options(
+        k: int | None, ranking: str | None, k1: float | None, b: float | None
+    ) -> Tuple[int, str, float, float]:
         k = k or config.MAX_RESULTS
         mode = (ranking or config.RANKING_MODE).lower()
-        if mode not in {"bm25", "tfidf"}:
+        if mode not in {"bm25", "tfidf", "hybrid"}:
             mode = config.RANKING_MODE
-        key = f"q:{mode}:{k}:{query.strip().lower()}"
-        cached = self.cache.get(key)
-        if cached is not None:
-            return cached
-
-        terms = preprocess(query)
-        if mode == "tfidf":
-            scores = self._tfidf_scores(terms)
+        if mode == "hybrid" and (dense is None or not config.VECTOR_DIM):
+            mode = "bm25"
+        k1 = config.BM25_K1 if k1 is None else k1
+        b = config.BM25_B if b is None else b
+        return k, mode, k1, b
+
+    def _compute(
+        self, misses: List[str], parsed: Dict[str, ParsedQuery], mode: str, k: int, k1: float, b: float
+    ) -> List[List[Dict]]:
+        # Each posting list is fetched once for the whole batch; misses are scored on a thread pool
+        index = self.indexer.index.inverted_index
+        lookup = {t: index.get(t) for key in misses for t in parsed[key].lookup_terms()}
+
+        def run(key: str) -> List[Dict]:
+            # Concurrent misses on the same key wait for one computation instead of repeating it
+            return self.flights.do(key, lambda: self._execute(parsed[key], mode, k, k1, b, lookup))
+
+        if len(misses) == 1 or config.BATCH_WORKERS <= 1:
+            return [run(key) for key in misses]
+        return list(_batch_pool().map(run, misses))
+
+    def suggest(self, prefix: str, k: int = 10) -> List[Dict]:
+        # Completions of the last word of prefix (unless it ends in a space) to index terms,
+        # most documents first. Terms are stemmed, so a complete word that only matches as a
+        # stem ("running") is completed from its stem.
+        with metrics.stage("query", "suggest"):
+            text = prefix.lower()
+            match = _LAST_TOKEN_RE.search(text)
+            if not match or k <= 0:
+                return []
+            token = match.group()
+            found = self._dictionary().suggest(token, k)
+            if not found:
+                stem = ANALYZER.stem(token)
+                if stem != token:
+                    found = self._dictionary().suggest(stem, k)
+            head = text[: match.start()]
+            return [{"text": head + term, "term": term, "doc_freq": df} for term, df in found]
+
+    def corrections(self, terms: Iterable[str]) -> Dict[str, str]:
+        # Unknown term -> closest indexed term (edit distance up to MGS_SPELL_DISTANCE, then
+        # most documents), from the deletion index in suggest.bin. Known means in the index,
+        # which may hold uploads suggest.bin does not cover yet. Memoised per engine (so per
+        # index generation): a fuzzy search and its did_you_mean look each term up once.
+        with metrics.stage("query", "spell"):
+            out: Dict[str, str] = {}
+            todo: List[str] = []
+            for term in dict.fromkeys(terms):
+                fixed = self.spelled.get(term)
+                if fixed is None:
+                    todo.append(term)
+                elif fixed:
+                    out[term] = fixed
+            if todo:
+                doc_freq = self._doc_freqs(todo)
+                dictionary = self._dictionary()
+                for term in todo:
+                    found = None if doc_freq.get(term) else dictionary.correct(term)
+                    self.spelled.set(term, found[0] if found else "")
+                    if found:
+                        out[term] = found[0]
+            return out
+
+    def did_you_mean(self, query: str) -> Optional[str]:
+        # The query with its unknown words replaced by their corrections, or None when every
+        # word is known or has no close match
+        fixes = self.corrections(parse_query(query).lookup_terms())
+        if not fixes:
+            return None
+
+        def fix(m: re.Match) -> str:
+            word = m.group()
+            if word in _OPERATORS:
+                return word
+            low = word.lower()
+            fixed = fixes.get(ANALYZER.term(low))
+            return word if fixed is None else _surface(low, fixed)
+
+        return _WORD_RE.sub(fix, query)
+
+    def _doc_freqs(self, terms: List[str]) -> Dict[str, int]:
+        doc_freq = self.indexer.index.doc_freq
+        return {t: df for t in terms if (df := doc_freq.get(t))}
+
+    def _dictionary(self) -> Suggester:
+        if self.suggester is None:
+            # Index saved before suggest.bin existed (or a pickled one)
+            doc_freq = self.indexer.index.doc_freq
+            items = sorted((t.encode("utf-8"), doc_freq[t]) for t in doc_freq)
+            self.suggester = Suggester(build_suggestions(items))
+        return self.suggester
+
+    def warm(self, queries: Iterable[str] = ()) -> None:
+        # Replays queries (typically the previous engine's recent ones) before this engine takes
+        # traffic: faults in the hot postings and documents and fills the cache for this generation
+        queries = list(dict.fromkeys(queries))
+        if queries:
+            self.search_many(queries)
+
+    def _execute(
+        self, parsed: ParsedQuery, mode: str, k: int, k1: float, b: float, lookup: Mapping[str, Postings]
+    ) -> List[Dict]:
+        ranked = self._rank(parsed, mode, k, k1, b, lookup)
+        with metrics.stage("query", "snippet"):
+            return self._render(ranked, parsed.terms, lookup)
+
+    def _rank(
+        self, parsed: ParsedQuery, mode: str, k: int, k1: float, b: float, lookup: Mapping[str, Postings]
+    ) -> List[Tuple[int, float]]:
+        if mode == "hybrid":
+            depth = max(k, config.HYBRID_DEPTH)
+            lexical = self._rank(parsed, "bm25", depth, k1, b, lookup)
+            with metrics.stage("query", "dense"):
+                vector = self._dense_rank(parsed, depth, lookup)
+            with metrics.stage("query", "fuse"):
+                return fuse_rankings([lexical, vector], k)
+        terms = parsed.terms
+        if metrics.ENABLED:
+            postings = sum(len(p) for t in set(terms) if (p := lookup.get(t)))
+            metrics.observe("mgs_query_postings", postings, metrics.COUNT_BUCKETS)
+        scores: Optional[Dict[int, float]] = None  # set by the scorers that leave selection to _top_k
+        if parsed.constrained:
+            # Boolean/phrase/NEAR structure filters; only the surviving docs are scored
+            with metrics.stage("query", "candidates"):
+                candidates = self._match_docs(parsed.root, lookup)
+            metrics.observe("mgs_query_candidates", len(candidates), metrics.COUNT_BUCKETS)
+            with metrics.stage("query", "score"):
+                if mode == "tfidf":
+                    scores = self._tfidf_scores(terms, candidates, lookup)
+                else:
+                    scores = self._bm25_scores(terms, k1, b, candidates, lookup)
         else:
-            scores = self._bm25_scores(terms)
+            with metrics.stage("query", "score"):
+                if mode == "tfidf":
+                    if self.scorer is not None:
+                        ranked = self.scorer.tfidf_top_k(terms, k, lookup)
+                    else:
+                        scores = self._tfidf_scores(terms, lookup=lookup)
+                elif (impacts := self._impacts_for(k1, b)) is not None:
+                    ranked = self._bm25_impact_top_k(terms, k, impacts, lookup)
+                elif self.scorer is not None:
+                    ranked = self.scorer.bm25_top_k(terms, k, k1, b, lookup)
+                elif self.pruning:
+                    ranked = self._bm25_top_k(terms, k, k1, b, lookup)
+                else:
+                    scores = self._bm25_scores(terms, k1, b, lookup=lookup)
+            if scores is not None:
+                metrics.observe("mgs_query_candidates", len(scores), metrics.COUNT_BUCKETS)
+        if scores is not None:
+            with metrics.stage("query", "sort"):
+                ranked = self._top_k(scores, k)
+        return ranked
 
-        ranked: List[Tuple[str, float]] = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+    def _open_vectors(self):
+        name = self.indexer.index.vectors
+        if dense is None or not name:
+            return None
+        try:
+            found = dense.VectorIndex.open(self.index_dir / name)
+        except FileNotFoundError:
+            return None  # replaced by a newer build since the manifest was read
+        # Docs uploaded since the vectors were built are only found lexically until refresh_vectors
+        return found if found.N <= self.indexer.index.N else None
+
+    def _ensure_vectors(self) -> None:
+        if self.vectors is None:
+            # Index saved without vectors (MGS_VECTOR_DIM=0, older or pickled index)
+            self.vectors = dense.VectorIndex(dense.build(self.indexer.index))
+
+    def _dense_rank(self, parsed: ParsedQuery, k: int, lookup: Mapping[str, Postings]) -> List[Tuple[int, float]]:
+        # Nearest docs to the query's vector; the boolean/phrase structure filters them as it
+        # does the lexical candidates
+        self._ensure_vectors()
+        idx = self.indexer.index
+        q = dense.query_vector(parsed.terms, idx.doc_freq, idx.N, self.vectors.dim)
+        if q is None:
+            return []
+        allowed = self._match_docs(parsed.root, lookup) if parsed.constrained else None
+        return self.vectors.search(q, k, allowed=allowed)
+
+    def _render(
+        self, ranked: List[Tuple[int, float]], terms: List[str], lookup: Mapping[str, Postings]
+    ) -> List[Dict]:
+        idx = self.indexer.index
+        postings = {t: lookup.get(t) for t in set(terms)} if ranked else {}
         results: List[Dict] = []
         for doc_id, score in ranked:
-            doc = self.indexer.index.documents[doc_id]
-            snippet = self._build_snippet(doc["content"], terms)
+            doc = idx.documents[doc_id]
+            hits = self._doc_hits(doc_id, postings)
+            if hits is not None:
+                snippet = self._positional_snippet(doc["content"], hits)
+            else:
+                snippet = self._build_snippet(doc["content"], terms)
             results.append(
                 {
-                    "doc_id": doc_id,
+                    "doc_id": idx.doc_paths[doc_id],
                     "title": doc["title"],
                     "url": doc.get("url") or "",
                     "score": round(float(score), 4),
                     "snippet": snippet,
                 }
             )
-
-        self.cache.set(key, results)
         return results
 
+    def _cache_key(self, parsed: ParsedQuery, mode: str, k: int, k1: float, b: float) -> str:
+        # Keyed on the index generation and the analyzed query, so equivalent spellings share
+        # an entry and results from an older index are never served
+        params = f"{k1}:{b}:" if mode in {"bm25", "hybrid"} and (k1, b) != (config.BM25_K1, config.BM25_B) else ""
+        text = repr(parsed.root) if parsed.constrained else " ".join(parsed.terms)
+        return f"q:{self.indexer.index.generation}:{mode}:{k}:{params}{text}"
+
+    @staticmethod
+    def _doc_hits(doc_id: int, postings: Dict) -> List[Tuple[int, int]] | None:
+        # Sorted (start, end) char spans of the query terms in the doc, from the positional
+        # postings; None if the index has no positions
+        hits: List[Tuple[int, int]] = []
+        for p in postings.values():
+            if not p:
+                continue
+            if p.positions is None:
+                return None
+            i = bisect_left(p.doc_ids, doc_id)
+            if i < len(p.doc_ids) and p.doc_ids[i] == doc_id:
+                occ = p.occurrences(i)
+                hits.extend(zip(occ[1::3], occ[2::3]))
+        hits.sort()
+        return hits
+
+    @staticmethod
+    def _positional_snippet(text: str, hits: List[Tuple[int, int]], window: int = 160) -> str:
+        # Densest window of hits (two pointers over the sorted spans), highlighted by offset
+        if not hits:
+            return (text[:window] + "...") if len(text) > window else text
+        best_i, best_n = 0, 0
+        j = 0
+        for i in range(len(hits)):
+            j = max(j, i)
+            while j < len(hits) and hits[j][1] - hits[i][0] <= window:
+                j += 1
+            if j - i > best_n:
+                best_i, best_n = i, j - i
+        span_start = hits[best_i][0]
+        span_end = max(hits[best_i + best_n - 1][1], hits[best_i][1])
+        start = max(0, span_start - max(0, window - (span_end - span_start)) // 2)
+        end = min(len(text), start + window)
+        start = max(0, min(start, end - window))
+
+        out = ["..."] if start > 0 else []
+        cur = start
+        for s, e in hits:
+            if s < cur or e > end:
+                continue
+            out.append(text[cur:s])
+            out.append(f"<mark>{text[s:e]}</mark>")
+            cur = e
+        out.append(text[cur:end])
+        if end < len(text):
+            out.append("...")
+        return "".join(out)
+
     @staticmethod
     def _build_snippet(text: str, terms: List[str], window: int = 160) -> str:
         low = text.lower()
@@ -125,13 +728,39 @@ class QueryEngine:
 
     @staticmethod
     def _highlight(snippet: str, terms: List[str]) -> str:
-        import re
-
         if not terms:
             return snippet
-        # Escape and sort by length desc to avoid overlapping replacements
-        parts = sorted({re.escape(t) for t in terms if t}, key=len, reverse=True)
-        if not parts:
+        pattern = _highlight_pattern(frozenset(t for t in terms if t))
+        if pattern is None:
             return snippet
-        pattern = re.compile(r"(" + "|".join(parts) + r")", re.IGNORECASE)
         return pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", snippet)
+
+
+def _surface(word: str, term: str) -> str:
+    # A correction is an index term, so stemmed ("learn"); the user's ending goes back on
+    # ("lerning" -> "learning") when the result still analyzes to that term
+    stem = ANALYZER.stem(word)
+    if word.startswith(stem):
+        candidate = term + word[len(stem) :]
+        if ANALYZER.term(candidate) == term:
+            return candidate
+    return term
+
+
+def fuse_rankings(rankings: List[List[Tuple[int, float]]], k: int, rrf_k: int | None = None) -> List[Tuple[int, float]]:
+    # Reciprocal rank fusion: a doc scores the sum of 1 / (rrf_k + rank) over the lists it is in
+    rrf_k = config.RRF_K if rrf_k is None else rrf_k
+    scores: Dict[int, float] = {}
+    for ranked in rankings:
+        for rank, (doc_id, _) in enumerate(ranked, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return heapq.nsmallest(k, scores.items(), key=lambda x: (-x[1], x[0]))
+
+
+@lru_cache(maxsize=1024)
+def _highlight_pattern(terms: frozenset):
+    # Escape and sort by length desc to avoid overlapping replacements
+    parts = sorted((re.escape(t) for t in terms), key=lambda p: (-len(p), p))
+    if not parts:
+        return None
+    return re.compile(r"(" + "|".join(parts) + r")", re.IGNORECASE)
@@ -0,0 +1,223 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Union
+
+from ..utils.text_cleaning import preprocess, preprocess_with_positions
+
+# Proximity when NEAR is written without /n
+DEFAULT_NEAR = 10
+
+# Signs and operators only count at the start of a whitespace/paren-delimited unit
+_TOKEN_RE = re.compile(
+    r'(?<![^\s(])([+-])(?=[^\s+-])'
+    r'|"([^"]*)"?'
+    r"|([()])"
+    r"|(?<![^\s(])(AND|OR|NOT|NEAR(?:/\d+)?)(?![^\s()])"
+    r'|([^\s()"]+)'
+)
+
+
+@dataclass
+class Term:
+    term: str
+
+
+@dataclass
+class Phrase:
+    terms: List[Tuple[str, int]]  # (term, offset from the first)
+
+
+@dataclass
+class Near:
+    left: str
+    right: str
+    distance: int
+
+
+@dataclass
+class Bool:
+    # Lucene-style clauses: must = intersect, should = union (only when there is no must),
+    # must_not = filtered out
+    must: List["Node"] = field(default_factory=list)
+    should: List["Node"] = field(default_factory=list)
+    must_not: List["Node"] = field(default_factory=list)
+
+
+Node = Union[Term, Phrase, Near, Bool]
+
+
+@dataclass
+class ParsedQuery:
+    root: Bool
+    terms: List[str]  # every scoring (non-negated) term, in query order
+
+    @property
+    def constrained(self) -> bool:
+        # False for a plain bag of terms, which is scored over the union of postings
+        r = self.root
+        return bool(r.must or r.must_not) or not all(isinstance(n, Term) for n in r.should)
+
+    def lookup_terms(self) -> List[str]:
+        # Every term whose postings evaluation may read, negated ones included
+        out: List[str] = list(self.terms)
+        stack: List[Node] = [self.root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Term):
+                out.append(node.term)
+            elif isinstance(node, Phrase):
+                out.extend(t for t, _ in node.terms)
+            elif isinstance(node, Near):
+                out.extend((node.left, node.right))
+            else:
+                stack.extend(node.must + node.should + node.must_not)
+        return list(dict.fromkeys(out))
+
+    def rewrite(self, mapping: Dict[str, str]) -> "ParsedQuery":
+        # The same query with terms replaced (spelling corrections)
+        def term(t: str) -> str:
+            return mapping.get(t, t)
+
+        def node(n: Node) -> Node:
+            if isinstance(n, Term):
+                return Term(term(n.term))
+            if isinstance(n, Phrase):
+                return Phrase([(term(t), offset) for t, offset in n.terms])
+            if isinstance(n, Near):
+                return Near(term(n.left), term(n.right), n.distance)
+            return Bool([node(c) for c in n.must], [node(c) for c in n.should], [node(c) for c in n.must_not])
+
+        return ParsedQuery(root=node(self.root), terms=[term(t) for t in self.terms])
+
+
+def parse_query(query: str) -> ParsedQuery:
+    # Grammar (AND binds tighter than OR; juxtaposition is optional, like Lucene's SHOULD):
+    #   or    := and (OR and)*
+    #   and   := clause ((AND)? clause)*
+    #   clause:= [+|-|NOT] atom (NEAR[/n] atom)*
+    #   atom  := "phrase" | ( or ) | word
+    # Phrase and NEAR clauses are required unless OR'd, so a plain query still parses to
+    # preprocess(query) as a bag of terms.
+    tokens = []
+    depth = 0
+    for m in _TOKEN_RE.finditer(query):
+        sign, phrase, paren, op, word = m.groups()
+        if sign:
+            tokens.append(("SIGN", sign))
+        elif phrase is not None:
+            tokens.append(("PHRASE", phrase))
+        elif paren:
+            if paren == ")" and not depth:
+                continue  # unmatched close paren
+            depth += 1 if paren == "(" else -1
+            tokens.append((paren, paren))
+        elif op:
+            tokens.append(("NEAR", op) if op.startswith("NEAR") else (op, op))
+        else:
+            tokens.append(("WORD", word))
+    parser = _Parser(tokens)
+    root = parser.parse_or(False)
+    return ParsedQuery(root=root, terms=parser.terms)
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+        self.terms: List[str] = []
+
+    def _peek(self):
+        return self.tokens[self.i][0] if self.i < len(self.tokens) else None
+
+    def _next(self):
+        tok = self.tokens[self.i]
+        self.i += 1
+        return tok
+
+    def parse_or(self, negated: bool) -> Bool:
+        groups = [self.parse_and(negated)]
+        while self._peek() == "OR":
+            self._next()
+            groups.append(self.parse_and(negated))
+        if len(groups) == 1:
+            return groups[0]
+        should: List[Node] = []
+        for g in groups:
+            if g.must or g.must_not:
+                should.append(g)
+            else:
+                should.extend(g.should)  # a pure disjunction splices into the OR
+        return Bool(should=should)
+
+    def parse_and(self, negated: bool) -> Bool:
+        node = Bool()
+        clauses: List[List] = []  # [occur, nodes]
+        required = False  # the previous token was AND
+        while self._peek() not in (None, "OR", ")"):
+            if self._peek() == "AND":
+                self._next()
+                if clauses and clauses[-1][0] == "should":
+                    clauses[-1][0] = "must"
+                required = True
+                continue
+            occur, nodes = self._clause(negated)
+            if required and occur == "should":
+                occur = "must"
+            required = False
+            clauses.append([occur, nodes])
+        for occur, nodes in clauses:
+            getattr(node, occur).extend(nodes)
+        return node
+
+    def _clause(self, negated: bool) -> Tuple[str, List[Node]]:
+        occur = None
+        if self._peek() == "SIGN":
+            occur = "must" if self._next()[1] == "+" else "must_not"
+        elif self._peek() == "NOT":
+            self._next()
+            occur = "must_not"
+        neg = negated or occur == "must_not"
+        nodes, terms, strict = self._atom(neg)
+        near = False
+        while self._peek() == "NEAR":
+            op = self._next()[1]
+            distance = int(op[5:]) if "/" in op else DEFAULT_NEAR
+            right_nodes, right_terms, _ = self._atom(neg)
+            if terms and right_terms:
+                # Phrases and earlier NEARs of the chain stay required next to the new NEAR;
+                # bare terms are implied by it
+                chain = nodes + [Near(terms[-1], right_terms[0], distance)] + right_nodes
+                nodes = [n for n in chain if not isinstance(n, Term)]
+                strict = near = True
+            else:
+                nodes = nodes + right_nodes  # a stopword operand drops the constraint
+            terms = right_terms
+        if near and occur == "must_not" and len(nodes) > 1:
+            nodes = [Bool(must=nodes)]  # excluded only where the whole chain matches
+        return occur or ("must" if strict else "should"), nodes
+
+    def _atom(self, negated: bool) -> Tuple[List[Node], List[str], bool]:
+        # (nodes, terms in order, required by default)
+        kind = self._peek()
+        if kind is None or kind in ("OR", ")", "AND", "NEAR"):
+            return [], [], False  # dangling operator
+        kind, value = self._next()
+        if kind == "(":
+            sub = self.parse_or(negated)
+            if self._peek() == ")":
+                self._next()
+            return [sub], [], False
+        if kind == "PHRASE":
+            toks = preprocess_with_positions(value)
+            terms = [t for t, _, _, _ in toks]
+            if len(toks) > 1:
+                nodes, strict = [Phrase([(t, pos - toks[0][1]) for t, pos, _, _ in toks])], True
+            else:
+                nodes, strict = [Term(t) for t in terms], False
+        else:
+            # Stray signs/operators (e.g. "- foo") are ordinary text and vanish in preprocess
+            terms = preprocess(value)
+            nodes, strict = [Term(t) for t in terms], False
+        if not negated:
+            self.terms.extend(terms)
+        return nodes, terms, strict
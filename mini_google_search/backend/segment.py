@@ -0,0 +1,558 @@
+import heapq
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import accumulate, islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+from .docstore import DOCS_FILE, STORE_FILE, STORE_INDEX_FILE, DocumentStore, write_docstore
+
+FORMAT = "mgs-segment"
+# meta.json layout: 1 = a single segment in the index dir, 2 = manifest of segment subdirs
+FORMAT_VERSION = 2
+# terms.bin: 1 = no score bounds, 2 = records carry max tf / min doc length per term,
+# 3 = records also carry the term's offset into positions.bin and its total occurrences
+SEGMENT_VERSION = 3
+
+TERMS_FILE = "terms.bin"
+POSTINGS_FILE = "postings.bin"
+DOCLENS_FILE = "doclens.bin"
+# Optional: (token position, char start, char end) uint32 triples for every occurrence,
+# per term in postings order
+POSITIONS_FILE = "positions.bin"
+# Written with positions.bin: per term in postings order, the ordinal of each posting's first
+# occurrence among the term's triples, at the same ordinals as the postings (uint32)
+OCC_OFFSETS_FILE = "occ_offsets.bin"
+# Optional impact-ordered copy of the postings: per term, docids sorted by descending
+# quantized BM25 contribution, with the 8-bit impacts alongside, and each term's
+# quantization step (float64 per term ordinal; impact * step ~ contribution)
+IMPACT_DOCS_FILE = "impact_docs.bin"
+IMPACTS_FILE = "impacts.bin"
+IMPACT_SCALES_FILE = "impact_scales.bin"
+IMPACT_BITS = 8
+
+# terms.bin: header, fixed-width records sorted by term bytes, then the term string blob.
+# Record: blob offset, blob length, postings offset (in uint32 units), doc freq,
+# then (v2) the term's max tf and min doc length, which bound its score under any k1/b/avgdl,
+# and (v3) its first triple in positions.bin plus its collection frequency (sum of tfs).
+_MAGIC = b"MGST"
+_HEADER = struct.Struct("<4sII")  # magic, version, n_terms
+_TERM_REC = struct.Struct("<QIQIIIQQ")
+_TERM_REC_V2 = struct.Struct("<QIQIII")
+_TERM_REC_V1 = struct.Struct("<QIQI")
+_RECORDS = {1: _TERM_REC_V1, 2: _TERM_REC_V2, 3: _TERM_REC}
+
+# Postings for a term with df n at offset o: docids at [o, o+n), tfs at [o+n, o+2n), uint32 LE.
+_LITTLE = sys.byteorder == "little"
+
+
+@dataclass
+class Postings:
+    # Parallel columns sorted by docid: array('I') when built in memory,
+    # uint32 memoryviews over postings.bin when opened from disk
+    doc_ids: array = field(default_factory=lambda: array("I"))
+    tfs: array = field(default_factory=lambda: array("I"))
+    # Score bounds: largest tf and shortest doc among the postings (0 = not recorded)
+    max_tf: int = 0
+    min_dl: int = 0
+    # Flattened (position, start, end) triples of every occurrence in postings order, if recorded
+    positions: Optional[array] = None
+    # First occurrence of each posting among the triples; read from occ_offsets.bin, or
+    # summed from the tfs on first use
+    occ_offsets: Optional[array] = None
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def occurrences(self, i: int):
+        # Flattened triples of the i-th posting
+        if self.occ_offsets is None:
+            self.occ_offsets = array("I", accumulate(self.tfs, initial=0))
+        first = self.occ_offsets[i]
+        return self.positions[3 * first : 3 * (first + self.tfs[i])]
+
+
+def term_bounds(postings: Postings, doc_lengths) -> Tuple[int, int]:
+    if postings.max_tf and postings.min_dl:
+        return postings.max_tf, postings.min_dl
+    if not len(postings):
+        return 0, 0
+    return max(postings.tfs), min(doc_lengths[d] for d in postings.doc_ids)
+
+
+def _u32(values) -> array:
+    arr = values if isinstance(values, array) and values.typecode == "I" else array("I", values)
+    if not _LITTLE:
+        arr = array("I", arr)
+        arr.byteswap()
+    return arr
+
+
+def quantize(contribution: float, scale: float) -> int:
+    # Every posting keeps an impact of at least 1 so matching docs are never dropped
+    return min((1 << IMPACT_BITS) - 1, max(1, int(contribution / scale + 0.5)))
+
+
+def _write_impacts(index, terms: List[str], out_dir: Path, k1: float, b: float) -> Dict:
+    N = index.N
+    avgdl = index.avgdl + 1e-9
+    lens = index.doc_lengths
+    contribs = []
+    for term in terms:
+        postings = index.inverted_index[term]
+        df = len(postings)
+        idf = math.log((N - df + 0.5) / (df + 0.5) + 1)
+        # Same arithmetic as QueryEngine._bm25_scores
+        col = [
+            idf * (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * lens[d] / avgdl))
+            for d, tf in zip(postings.doc_ids, postings.tfs)
+        ]
+        contribs.append(col)
+
+    # Each term gets its own step: one collection-wide step rounds every posting of a
+    # common (low idf) term to the floor impact, which reorders whole result lists
+    scales = array("d")
+    with (out_dir / IMPACT_DOCS_FILE).open("wb") as fd, (out_dir / IMPACTS_FILE).open("wb") as fi:
+        for term, col in zip(terms, contribs):
+            top = max(col, default=0.0)
+            scale = top / ((1 << IMPACT_BITS) - 1) if top > 0 else 1.0
+            scales.append(scale)
+            doc_ids = index.inverted_index[term].doc_ids
+            order = sorted(((quantize(c, scale), d) for c, d in zip(col, doc_ids)), key=lambda x: (-x[0], x[1]))
+            _u32(d for _, d in order).tofile(fd)
+            fi.write(bytes(q for q, _ in order))
+    if not _LITTLE:
+        scales.byteswap()
+    with (out_dir / IMPACT_SCALES_FILE).open("wb") as f:
+        scales.tofile(f)
+    return {"k1": k1, "b": b, "bits": IMPACT_BITS, "N": N, "avgdl": index.avgdl, "per_term": True}
+
+
+def write_segment(index, out_dir: Path, impacts: Optional[Tuple[float, float]] = None) -> Dict:
+    # impacts=(k1, b) also writes quantized BM25 impacts for those parameters. Files go to a
+    # temp sibling that is renamed into place, so out_dir never exists half-written.
+    tmp = out_dir.with_name(f".{out_dir.name}.tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)  # left over from an interrupted write
+    meta = _write_segment_files(index, tmp, impacts)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)  # orphan of a crash before its manifest was written; never referenced
+    os.replace(tmp, out_dir)
+    return meta
+
+
+def _write_segment_files(index, out_dir: Path, impacts: Optional[Tuple[float, float]]) -> Dict:
+    out_dir.mkdir(parents=True)
+    terms = sorted(index.inverted_index, key=lambda t: t.encode("utf-8"))
+
+    blob = bytearray()
+    records = bytearray()
+    offset = 0
+    pos_offset = 0
+    postings_list = [index.inverted_index[term] for term in terms]
+    with_positions = all(p.positions is not None for p in postings_list)
+    with (out_dir / POSTINGS_FILE).open("wb") as f:
+        for term, postings in zip(terms, postings_list):
+            raw = term.encode("utf-8")
+            df = len(postings)
+            max_tf, min_dl = term_bounds(postings, index.doc_lengths)
+            cf = sum(postings.tfs)
+            records += _TERM_REC.pack(len(blob), len(raw), offset, df, max_tf, min_dl, pos_offset, cf)
+            blob += raw
+            _u32(postings.doc_ids).tofile(f)
+            _u32(postings.tfs).tofile(f)
+            offset += 2 * df
+            pos_offset += cf
+
+    if with_positions:
+        with (out_dir / POSITIONS_FILE).open("wb") as f:
+            for postings in postings_list:
+                _u32(postings.positions).tofile(f)
+        with (out_dir / OCC_OFFSETS_FILE).open("wb") as f:
+            for postings in postings_list:
+                _u32(islice(accumulate(postings.tfs, initial=0), len(postings))).tofile(f)
+
+    with (out_dir / TERMS_FILE).open("wb") as f:
+        f.write(_HEADER.pack(_MAGIC, SEGMENT_VERSION, len(terms)))
+        f.write(records)
+        f.write(blob)
+
+    with (out_dir / DOCLENS_FILE).open("wb") as f:
+        _u32(index.doc_lengths).tofile(f)
+
+    write_docstore(index.documents, index.doc_paths, out_dir)
+
+    meta = {"N": index.N, "total_length": sum(index.doc_lengths), "terms": len(terms)}
+    if impacts is not None:
+        meta["impacts"] = _write_impacts(index, terms, out_dir, *impacts)
+    return meta
+
+
+def delete_segment(seg_dir: Path) -> None:
+    # Open readers keep their mappings on POSIX; on Windows the files may still be in use
+    names = (TERMS_FILE, POSTINGS_FILE, DOCLENS_FILE, POSITIONS_FILE, OCC_OFFSETS_FILE, DOCS_FILE, STORE_FILE, STORE_INDEX_FILE)
+    for name in names + (IMPACT_DOCS_FILE, IMPACTS_FILE, IMPACT_SCALES_FILE):
+        try:
+            (seg_dir / name).unlink()
+        except OSError:
+            pass
+    try:
+        seg_dir.rmdir()
+    except OSError:
+        pass
+
+
+def _map(path: Path):
+    # mmap cannot map empty files; an empty segment is served from an empty buffer
+    with path.open("rb") as f:
+        if path.stat().st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _u32_view(buf, start: int, count: int):
+    if not count:
+        return array("I")
+    view = memoryview(buf)[start * 4 : (start + count) * 4]
+    if _LITTLE:
+        return view.cast("I")
+    arr = array("I", view.tobytes())
+    arr.byteswap()
+    return arr
+
+
+class TermDictionary(Mapping):
+    # Read-only term -> Postings mapping; lookups binary-search the mmap'd records
+    def __init__(self, terms_path: Path, postings_path: Path, positions_path: Optional[Path] = None):
+        self._terms = _map(terms_path)
+        self._postings_buf = _map(postings_path)
+        magic, version, n_terms = _HEADER.unpack_from(self._terms, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a term dictionary: {terms_path}")
+        if version not in _RECORDS:
+            raise ValueError(f"Unsupported term dictionary version {version} in {terms_path}")
+        self._rec = _RECORDS[version]
+        has_positions = version >= 3 and positions_path is not None and positions_path.exists()
+        self._positions_buf = _map(positions_path) if has_positions else None
+        occ_path = terms_path.with_name(OCC_OFFSETS_FILE)
+        self._occ_buf = _map(occ_path) if has_positions and occ_path.exists() else None
+        self._n = n_terms
+        self._blob = _HEADER.size + n_terms * self._rec.size
+
+    def _record(self, i: int):
+        return self._rec.unpack_from(self._terms, _HEADER.size + i * self._rec.size)
+
+    def _term_bytes(self, rec) -> bytes:
+        start = self._blob + rec[0]
+        return self._terms[start : start + rec[1]]
+
+    def _search(self, term: str):
+        # (term ordinal, record), or None
+        key = term.encode("utf-8")
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            rec = self._record(mid)
+            cur = self._term_bytes(rec)
+            if cur < key:
+                lo = mid + 1
+            elif cur > key:
+                hi = mid
+            else:
+                return mid, rec
+        return None
+
+    def _find(self, term: str):
+        found = self._search(term)
+        return None if found is None else found[1]
+
+    def _postings(self, rec) -> Postings:
+        _, _, offset, df, *extra = rec
+        max_tf, min_dl = extra[:2] if extra else (0, 0)
+        positions = occ_offsets = None
+        if self._positions_buf is not None:
+            positions = _u32_view(self._positions_buf, 3 * extra[2], 3 * extra[3])
+        if self._occ_buf is not None:
+            occ_offsets = _u32_view(self._occ_buf, offset // 2, df)
+        return Postings(
+            doc_ids=_u32_view(self._postings_buf, offset, df),
+            tfs=_u32_view(self._postings_buf, offset + df, df),
+            max_tf=max_tf,
+            min_dl=min_dl,
+            positions=positions,
+            occ_offsets=occ_offsets,
+        )
+
+    def __getitem__(self, term: str):
+        rec = self._find(term)
+        if rec is None:
+            raise KeyError(term)
+        return self._postings(rec)
+
+    def get(self, term: str, default=None):
+        rec = self._find(term)
+        return default if rec is None else self._postings(rec)
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and self._find(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._n):
+            yield self._term_bytes(self._record(i)).decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._n
+
+    def items(self) -> Iterator[Tuple[str, Postings]]:
+        # In term order, walking the records instead of searching for each term
+        for i in range(self._n):
+            rec = self._record(i)
+            yield self._term_bytes(rec).decode("utf-8"), self._postings(rec)
+
+    def doc_freq(self, term: str) -> Optional[int]:
+        rec = self._find(term)
+        return None if rec is None else rec[3]
+
+    def doc_freqs(self) -> Iterator[Tuple[bytes, int]]:
+        # (utf-8 term, doc freq) in term order, without building any postings
+        for i in range(self._n):
+            rec = self._record(i)
+            yield bytes(self._term_bytes(rec)), rec[3]
+
+    def locate(self, term: str) -> Optional[Tuple[int, int, int]]:
+        # (term ordinal, posting ordinal of the term's first entry, doc freq)
+        found = self._search(term)
+        return None if found is None else (found[0], found[1][2] // 2, found[1][3])
+
+
+class ImpactIndex:
+    # Impact-ordered postings of one segment plus the parameters they were computed with
+    def __init__(self, seg_dir: Path, terms: TermDictionary, params: Dict):
+        self.params = params
+        self._terms = terms
+        self._docs = _map(seg_dir / IMPACT_DOCS_FILE)
+        self._impacts = _map(seg_dir / IMPACTS_FILE)
+        # Older segments stamp one collection-wide step instead of a per-term file
+        self._scales = _map(seg_dir / IMPACT_SCALES_FILE) if params.get("per_term") else None
+
+    def get(self, term: str):
+        # (docids, impacts, step) where impact * step approximates the BM25 contribution
+        loc = self._terms.locate(term)
+        if loc is None:
+            return None
+        i, start, df = loc
+        if self._scales is None:
+            scale = self.params["scale"]
+        else:
+            scale = struct.unpack_from("<d", self._scales, 8 * i)[0]
+        return _u32_view(self._docs, start, df), memoryview(self._impacts)[start : start + df], scale
+
+
+class DocFreqView(Mapping):
+    def __init__(self, terms: TermDictionary):
+        self._terms = terms
+
+    def __getitem__(self, term: str) -> int:
+        df = self._terms.doc_freq(term)
+        if df is None:
+            raise KeyError(term)
+        return df
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._terms)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+
+class IdfView(Mapping):
+    # Same BM25-style idf as Indexer.build_index, computed on lookup instead of stored
+    def __init__(self, doc_freq: Mapping, N: int):
+        self._doc_freq = doc_freq
+        self._N = N
+
+    def __getitem__(self, term: str) -> float:
+        df = self._doc_freq[term]
+        return math.log((self._N - df + 0.5) / (df + 0.5) + 1)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._doc_freq)
+
+    def __len__(self) -> int:
+        return len(self._doc_freq)
+
+
+# Budget for the merged postings a MultiTermDictionary keeps for repeated lookups
+_MERGED_CACHE_BYTES = 32 * 1024 * 1024
+
+
+def _merge_postings(found: List[Tuple[int, Postings]]) -> Postings:
+    # Columns of the segment at base 0 (normally the large one) are copied as bytes;
+    # only the docids of later segments are shifted one by one
+    merged = Postings()
+    for base, p in found:
+        if base:
+            merged.doc_ids.extend(d + base for d in p.doc_ids)
+        else:
+            merged.doc_ids.frombytes(_raw(p.doc_ids))
+        merged.tfs.frombytes(_raw(p.tfs))
+    if all(p.max_tf for _, p in found):
+        merged.max_tf = max(p.max_tf for _, p in found)
+        merged.min_dl = min(p.min_dl for _, p in found)
+    if all(p.positions is not None for _, p in found):
+        merged.positions = array("I")
+        for _, p in found:
+            merged.positions.frombytes(_raw(p.positions))
+    if all(p.occ_offsets is not None for _, p in found):
+        # Each segment's offsets shift by the occurrences of the segments before it
+        merged.occ_offsets = array("I")
+        shift = 0
+        for _, p in found:
+            if shift:
+                merged.occ_offsets.extend(o + shift for o in p.occ_offsets)
+            else:
+                merged.occ_offsets.frombytes(_raw(p.occ_offsets))
+            shift += len(p.positions) // 3
+    return merged
+
+
+def _raw(column) -> memoryview:
+    # Native uint32 column (array or cast memoryview) as bytes, for array.frombytes
+    return memoryview(column).cast("B")
+
+
+def _postings_bytes(p: Postings) -> int:
+    n = 2 * len(p.doc_ids)
+    for column in (p.positions, p.occ_offsets):
+        if column is not None:
+            n += len(column)
+    return 4 * n
+
+
+class MultiTermDictionary(Mapping):
+    # Term -> Postings across segments; docids are shifted by each segment's doc base
+    def __init__(self, parts: List[Tuple[int, Mapping]]):
+        self._parts = parts
+        self._len: Optional[int] = None
+        # Merged postings of recent lookups; this dictionary lives as long as one index
+        # generation, so entries never go stale
+        self._merged: "OrderedDict[str, Postings]" = OrderedDict()
+        self._merged_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, term: str, default=None):
+        found = [(base, p) for base, terms in self._parts if (p := terms.get(term)) is not None]
+        if not found:
+            return default
+        if len(found) == 1 and found[0][0] == 0:
+            return found[0][1]
+        with self._lock:
+            merged = self._merged.get(term)
+            if merged is not None:
+                self._merged.move_to_end(term)
+                return merged
+        merged = _merge_postings(found)
+        with self._lock:
+            if term not in self._merged:
+                self._merged[term] = merged
+                self._merged_bytes += _postings_bytes(merged)
+                while self._merged_bytes > _MERGED_CACHE_BYTES:
+                    _, old = self._merged.popitem(last=False)
+                    self._merged_bytes -= _postings_bytes(old)
+        return merged
+
+    def __getitem__(self, term: str):
+        postings = self.get(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+    def __contains__(self, term) -> bool:
+        return any(term in terms for _, terms in self._parts)
+
+    def __iter__(self) -> Iterator[str]:
+        last = None
+        for term in heapq.merge(*(iter(terms) for _, terms in self._parts), key=lambda t: t.encode("utf-8")):
+            if term != last:
+                yield term
+                last = term
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
+
+    def doc_freq(self, term: str) -> Optional[int]:
+        dfs = [df for _, terms in self._parts if (df := terms.doc_freq(term)) is not None]
+        return sum(dfs) if dfs else None
+
+
+def open_segments(seg_dirs: List[Path], sizes: List[int], impacts: Optional[Dict] = None) -> Dict:
+    # Returns Index fields over all segments in order; collection stats are global,
+    # so BM25 over several segments scores exactly like a single rebuilt index.
+    # `impacts` is the stamp of a single segment written with impact postings.
+    parts: List[Tuple[int, TermDictionary]] = []
+    lengths = []
+    documents = DocumentStore()
+    base = 0
+    for seg_dir, n in zip(seg_dirs, sizes):
+        parts.append((base, TermDictionary(seg_dir / TERMS_FILE, seg_dir / POSTINGS_FILE, seg_dir / POSITIONS_FILE)))
+        lengths.append(_u32_view(_map(seg_dir / DOCLENS_FILE), 0, n))
+        documents.add_segment(seg_dir)
+        base += n
+
+    if len(parts) == 1:
+        terms = parts[0][1]
+        doc_lengths = lengths[0]
+    else:
+        terms = MultiTermDictionary(parts)
+        doc_lengths = array("I")
+        for part in lengths:
+            doc_lengths.extend(part)
+    N = base
+    doc_freq = DocFreqView(terms)
+    return dict(
+        inverted_index=terms,
+        doc_lengths=doc_lengths,
+        documents=documents,
+        doc_paths=documents.doc_paths,
+        doc_freq=doc_freq,
+        idf=IdfView(doc_freq, N),
+        N=N,
+        avgdl=sum(doc_lengths) / N if N else 0.0,
+        impacts=ImpactIndex(seg_dirs[0], terms, impacts) if impacts and len(parts) == 1 and N else None,
+    )
+
+
+def merge_candidates(sizes: List[int], factor: int) -> Optional[Tuple[int, int]]:
+    # Log-structured policy: segments are levelled by log_factor(size); the newest run of
+    # `factor` or more adjacent same-level segments is merged into one of the next level.
+    # Otherwise, once the later segments together hold 1/factor of the first (base) segment's
+    # docs, everything is merged into one, so uploads eventually reach the base segment.
+    if factor < 2:
+        return None
+    levels = []
+    for n in sizes:
+        level = 0
+        while n >= factor:
+            n //= factor
+            level += 1
+        levels.append(level)
+    best = None
+    start = 0
+    for i in range(1, len(sizes) + 1):
+        if i == len(sizes) or levels[i] != levels[start]:
+            if i - start >= factor:
+                best = (start, i)
+            start = i
+    if best is None and len(sizes) > 1 and sum(sizes[1:]) * factor >= sizes[0]:
+        best = (0, len(sizes))
+    return best
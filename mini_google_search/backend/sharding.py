@@ -0,0 +1,360 @@
+import bisect
+import dataclasses
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import uuid
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..utils import config
+from .indexer import _MERGE_LOCK, _META_LOCK, SHARDS_FILE, Index, Indexer, _read_meta, _segment_entries
+from .query_engine import QueryEngine, fuse_rankings
+from .query_parser import ParsedQuery
+from .segment import IdfView
+from .suggest import build as build_suggestions, save_suggestions, segment_doc_freqs
+
+SHARDS_FORMAT = "mgs-shards"
+
+
+def _read_shards(index_dir: Path) -> Dict:
+    path = index_dir / SHARDS_FILE
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+
+def _write_shards(index_dir: Path, meta: Dict) -> None:
+    # Like meta.json, shards.json is the commit point for a whole set of shards
+    tmp = index_dir / f"{SHARDS_FILE}.tmp"
+    tmp.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    os.replace(tmp, index_dir / SHARDS_FILE)
+
+
+def shard_dirs(index_dir: str | Path | None = None) -> List[Path]:
+    index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+    return [index_dir / name for name in _read_shards(index_dir).get("shards", [])]
+
+
+def shards_generation(index_dir: str | Path | None = None) -> Optional[str]:
+    # Changes whenever any shard's contents do (rebuilds and uploads)
+    return _read_shards(Path(index_dir) if index_dir else Path(config.INDEX_DIR)).get("generation")
+
+
+def _build_suggestions(index_dir: Path, names: List[str]) -> Tuple[bytes, int]:
+    # One suggest.bin over every shard's segments, so the coordinator answers /suggest alone;
+    # returns it with the number of docs it covers
+    seg_dirs = []
+    docs = 0
+    for name in names:
+        meta = _read_meta(index_dir / name)
+        seg_dirs += [index_dir / name / e["name"] for e in _segment_entries(meta)]
+        docs += meta.get("N", 0)
+    return build_suggestions(segment_doc_freqs(seg_dirs)), docs
+
+
+def build_shards(
+    data_dir: str | Path, index_dir: str | Path | None = None, n_shards: int | None = None, workers: int | None = None
+) -> int:
+    # Document-partitioned: shard i indexes the i-th contiguous run of the sorted paths, so
+    # global docid = shard base + local docid follows the same order as an unsharded build
+    # and ties break identically. Returns the number of documents indexed. The root lock is
+    # held from the glob through the publish, so a concurrent upload is never lost.
+    data_dir = Path(data_dir)
+    index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+    n_shards = n_shards or config.SHARDS
+    with _META_LOCK.hold(index_dir):
+        paths = sorted(data_dir.glob("**/*.txt"))
+        size = max(1, -(-len(paths) // n_shards))
+        chunks = [paths[i : i + size] for i in range(0, len(paths), size)] or [[]]
+        old = _read_shards(index_dir)
+        first = int(old.get("next_shard", 1))
+        names = []
+        for i, chunk in enumerate(chunks):
+            name = f"shard_{first + i:06d}"
+            idx = Indexer()
+            idx.build_index(data_dir, workers=workers, paths=chunk)
+            idx.save_index(index_dir / name)
+            names.append(name)
+        buf, docs = _build_suggestions(index_dir, names)
+        save_suggestions(index_dir, buf)
+        meta = {
+            "format": SHARDS_FORMAT,
+            "version": 1,
+            "n_shards": n_shards,
+            "shards": names,
+            "next_shard": first + len(chunks),
+            "generation": uuid.uuid4().hex,
+            "suggest_docs": docs,
+        }
+        _write_shards(index_dir, meta)
+    # Engines still serving the old shards keep their mmaps; the files just go away
+    for name in old.get("shards", []):
+        shutil.rmtree(index_dir / name, ignore_errors=True)
+    return len(paths)
+
+
+def ensure_shards(data_dir: str | Path, index_dir: str | Path | None = None, n_shards: int | None = None) -> None:
+    # Builds the shards unless they exist with the configured count (once, when several workers start)
+    index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+    n_shards = n_shards or config.SHARDS
+    if _read_shards(index_dir).get("n_shards") == n_shards:
+        return
+    with _META_LOCK.hold(index_dir):
+        if _read_shards(index_dir).get("n_shards") != n_shards:
+            build_shards(data_dir, index_dir, n_shards)
+
+
+def add_to_shards(
+    paths: List[str | Path], data_dir: str | Path, index_dir: str | Path | None = None
+) -> Tuple[int, Path]:
+    # New documents go to the last shard as a new segment, so they keep the highest global
+    # docids exactly as they would in an unsharded index; returns (added, shard dir).
+    # Under the root lock, so a rebuild cannot replace the shard while the segment is added.
+    index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+    with _META_LOCK.hold(index_dir):
+        dirs = shard_dirs(index_dir)
+        assert dirs, f"No shards found in {index_dir}. Build them first."
+        added = Indexer().add_documents(paths, data_dir, dirs[-1])
+        if added:
+            # suggest.bin catches up in refresh_shard_suggestions, outside the upload path
+            meta = _read_shards(index_dir)
+            meta["generation"] = uuid.uuid4().hex
+            _write_shards(index_dir, meta)
+    return added, dirs[-1]
+
+
+def refresh_shard_suggestions(index_dir: str | Path | None = None) -> bool:
+    # Rebuilds the top-level suggest.bin once uploads have added docs it does not cover;
+    # returns True if a new one was published
+    index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+    with _MERGE_LOCK.hold(index_dir):
+        meta = _read_shards(index_dir)
+        names = meta.get("shards", [])
+        if not names or meta.get("suggest_docs") == sum(_read_meta(index_dir / n).get("N", 0) for n in names):
+            return False
+        try:
+            buf, docs = _build_suggestions(index_dir, names)
+        except FileNotFoundError:
+            return False  # a shard merge replaced segments meanwhile; the next upload retries
+        with _META_LOCK.hold(index_dir):
+            current = _read_shards(index_dir)
+            if current.get("shards") != names:
+                return False  # rebuilt meanwhile
+            save_suggestions(index_dir, buf)
+            _write_shards(index_dir, {**current, "suggest_docs": docs, "generation": uuid.uuid4().hex})
+    return True
+
+
+# ----- Shard processes -----
+
+
+def _serve_shard(shard_dir: str, conn) -> None:
+    # Runs in its own process: answers the coordinator's requests in order until it hangs up.
+    # Searches score with the collection-wide statistics sent along with each request.
+    engine = QueryEngine(shard_dir)
+    engine.scorer = None  # the NumPy accumulators are sized for the shard-local stats
+    local = engine.indexer.index
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        op, args = msg
+        try:
+            if op == "stats":
+                reply: Any = {"N": local.N, "total_length": sum(local.doc_lengths)}
+            elif op == "df":
+                reply = [local.doc_freq.get(t, 0) for t in args]
+            elif op == "search":
+                queries, mode, k, k1, b, N, avgdl, doc_freq = args
+                if mode == "hybrid":
+                    engine._ensure_vectors()  # from the shard's own docs, before the global stats go in
+                engine.indexer.index = dataclasses.replace(
+                    local, N=N, avgdl=avgdl, doc_freq=doc_freq, idf=IdfView(doc_freq, N)
+                )
+                run = _hybrid_local if mode == "hybrid" else _search_local
+                reply = [run(engine, parsed, mode, k, k1, b) for parsed in queries]
+            elif op == "render":
+                lookup = local.inverted_index
+                reply = [engine._render(ranked, terms, lookup) for terms, ranked in args]
+            else:
+                raise ValueError(f"Unknown shard op {op!r}")
+            conn.send(("ok", reply))
+        except Exception as exc:
+            conn.send(("error", f"{type(exc).__name__}: {exc}"))
+
+
+def _search_local(
+    engine: QueryEngine, parsed: ParsedQuery, mode: str, k: int, k1: float, b: float
+) -> List[Tuple[float, int, Dict]]:
+    # (unrounded score, local docid, rendered result) for the shard's own top k
+    lookup = engine.indexer.index.inverted_index
+    ranked = engine._rank(parsed, mode, k, k1, b, lookup)
+    results = engine._render(ranked, parsed.terms, lookup)
+    return [(score, doc_id, r) for (doc_id, score), r in zip(ranked, results)]
+
+
+def _hybrid_local(
+    engine: QueryEngine, parsed: ParsedQuery, mode: str, k: int, k1: float, b: float
+) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+    # The shard's BM25 and vector top lists (local docids), fused by the coordinator
+    depth = max(k, config.HYBRID_DEPTH)
+    lookup = engine.indexer.index.inverted_index
+    return engine._rank(parsed, "bm25", depth, k1, b, lookup), engine._dense_rank(parsed, depth, lookup)
+
+
+class _Shard:
+    def __init__(self, ctx, shard_dir: Path):
+        self.name = shard_dir.name
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_serve_shard, args=(str(shard_dir), child), name=self.name, daemon=True)
+        self.proc.start()
+        child.close()
+        self.lock = threading.Lock()  # one outstanding request per shard
+
+    def recv(self) -> Any:
+        try:
+            status, value = self.conn.recv()
+        except (EOFError, OSError):
+            raise RuntimeError(f"Shard {self.name} exited") from None
+        if status != "ok":
+            raise RuntimeError(f"Shard {self.name}: {value}")
+        return value
+
+
+def _stop(shards: List[_Shard]) -> None:
+    for shard in shards:
+        try:
+            shard.conn.send(None)
+        except OSError:
+            pass
+        shard.conn.close()
+    for shard in shards:
+        shard.proc.join(timeout=1)
+        if shard.proc.is_alive():
+            shard.proc.terminate()
+
+
+class ShardedEngine(QueryEngine):
+    # Coordinator over one local process per shard. Shards report N and total length once;
+    # each batch of misses then takes two rounds: summed doc_freq for its terms, and the
+    # search itself with those global stats. Per-shard top-k lists are merged on
+    # (-score, global docid), so results equal the unsharded index's. Hybrid ranking adds a
+    # third round in which each shard renders its docs of the fused top k; its vector scores
+    # use each shard's own idf, so those results can differ slightly from the unsharded ones.
+    def __init__(self, index_dir: str | Path | None = None):
+        super().__init__(index_dir)
+        self.scorer = None  # scoring happens in the shards
+
+    def _load(self, index_dir: str | Path | None) -> Indexer:
+        index_dir = Path(index_dir) if index_dir else Path(config.INDEX_DIR)
+        dirs = shard_dirs(index_dir)
+        assert dirs, f"No shards found in {index_dir}. Build them first."
+        ctx = multiprocessing.get_context("spawn")
+        self.shards = [_Shard(ctx, d) for d in dirs]
+        self._finalizer = weakref.finalize(self, _stop, self.shards)
+        stats = self._scatter("stats", None)
+        self.bases = [0, *itertools.accumulate(s["N"] for s in stats)][:-1]  # global docid of each shard's doc 0
+        N = sum(s["N"] for s in stats)
+        total = sum(s["total_length"] for s in stats)
+        indexer = Indexer()
+        # Collection stats only; postings and documents live in the shard processes
+        indexer.index = Index(
+            N=N, avgdl=total / N if N else 0.0, generation=shards_generation(index_dir) or uuid.uuid4().hex
+        )
+        return indexer
+
+    def close(self) -> None:
+        self._finalizer()
+
+    def _scatter(self, op: str, args: Any, per_shard: bool = False) -> List[Any]:
+        # Send to every shard (args[i] to shard i with per_shard), then collect every reply.
+        # Shard locks are taken in order, so concurrent rounds pipeline through the shards
+        # instead of deadlocking.
+        sent = []
+        for i, shard in enumerate(self.shards):
+            shard.lock.acquire()
+            try:
+                shard.conn.send((op, args[i] if per_shard else args))
+                sent.append(True)
+            except OSError:
+                sent.append(False)
+        replies: List[Any] = []
+        error: Optional[Exception] = None
+        for shard, ok in zip(self.shards, sent):
+            try:
+                if not ok:
+                    raise RuntimeError(f"Shard {shard.name} exited")
+                replies.append(shard.recv())
+            except RuntimeError as exc:
+                error = error or exc
+            finally:
+                shard.lock.release()
+        if error is not None:
+            raise error
+        return replies
+
+    def _compute(
+        self, misses: List[str], parsed: Dict[str, ParsedQuery], mode: str, k: int, k1: float, b: float
+    ) -> List[List[Dict]]:
+        # The whole batch goes to the shards in one round trip; a lone query is coalesced
+        # with concurrent identical ones first
+        if len(misses) == 1:
+            key = misses[0]
+            return [self.flights.do(key, lambda: self._gather([parsed[key]], mode, k, k1, b)[0])]
+        return self._gather([parsed[key] for key in misses], mode, k, k1, b)
+
+    def _doc_freqs(self, terms: List[str]) -> Dict[str, int]:
+        # Summed over the shards; terms no shard holds are left out
+        doc_freq: Dict[str, int] = {}
+        if terms:
+            for dfs in self._scatter("df", terms):
+                for term, df in zip(terms, dfs):
+                    doc_freq[term] = doc_freq.get(term, 0) + df
+        return {t: df for t, df in doc_freq.items() if df}
+
+    def _gather(self, queries: List[ParsedQuery], mode: str, k: int, k1: float, b: float) -> List[List[Dict]]:
+        doc_freq = self._doc_freqs(list(dict.fromkeys(t for parsed in queries for t in parsed.terms)))
+        if mode == "hybrid":
+            return self._gather_hybrid(queries, k, k1, b, doc_freq)
+        idx = self.indexer.index
+        replies = self._scatter("search", (queries, mode, k, k1, b, idx.N, idx.avgdl, doc_freq))
+        out: List[List[Dict]] = []
+        for i in range(len(queries)):
+            hits = [
+                (score, base + doc_id, r) for base, reply in zip(self.bases, replies) for score, doc_id, r in reply[i]
+            ]
+            out.append([r for _, _, r in heapq.nsmallest(k, hits, key=lambda h: (-h[0], h[1]))])
+        return out
+
+    def _gather_hybrid(
+        self, queries: List[ParsedQuery], k: int, k1: float, b: float, doc_freq: Dict[str, int]
+    ) -> List[List[Dict]]:
+        # Shards return their BM25 and vector lists; both are merged globally and fused here,
+        # then each shard renders its own docs of the fused top k in a second round
+        idx = self.indexer.index
+        replies = self._scatter("search", (queries, "hybrid", k, k1, b, idx.N, idx.avgdl, doc_freq))
+        depth = max(k, config.HYBRID_DEPTH)
+        fused = []
+        for i in range(len(queries)):
+            lists = []
+            for which in (0, 1):
+                hits = [(base + d, s) for base, reply in zip(self.bases, replies) for d, s in reply[i][which]]
+                lists.append(heapq.nsmallest(depth, hits, key=lambda h: (-h[1], h[0])))
+            fused.append(fuse_rankings(lists, k))
+        owners = [[bisect.bisect_right(self.bases, d) - 1 for d, _ in ranked] for ranked in fused]
+        requests = [
+            [
+                (parsed.terms, [(d - base, s) for (d, s), o in zip(ranked, owner) if o == n])
+                for parsed, ranked, owner in zip(queries, fused, owners)
+            ]
+            for n, base in enumerate(self.bases)
+        ]
+        rendered = [[iter(results) for results in reply] for reply in self._scatter("render", requests, per_shard=True)]
+        return [[next(rendered[o][i]) for o in owner] for i, owner in enumerate(owners)]
@@ -0,0 +1,380 @@
+import heapq
+import os
+import struct
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..utils import config
+from .segment import TERMS_FILE, TermDictionary, _map, _u32, _u32_view
+
+SUGGEST_FILE = "suggest.bin"
+
+# suggest.bin: every term of the index in byte order, front-coded in blocks of BLOCK terms,
+# with its doc freq, plus the TOP_K most frequent terms under every prefix of up to SHORT
+# bytes (precomputed, since those prefixes cover the most terms), plus a SymSpell deletion
+# index for spelling correction: every string obtained by deleting up to max_distance bytes
+# from the first SPELL_PREFIX bytes of a term is hashed to a bucket listing that term.
+# Layout: header | block offsets | doc freqs | prefix offsets (n_prefixes + 1) |
+#         prefix top-k ordinals (n_prefixes * top_k, padded with _NONE) |
+#         bucket offsets (n_buckets + 1) | bucket ordinals | term lengths (u8, capped at 255) |
+#         prefix blob | term blob
+# Block: first term as varint length + bytes, then per term varint shared-prefix length,
+# varint suffix length and the suffix bytes.
+_MAGIC = b"MGSS"
+_VERSION = 2
+# magic, version, n_terms, block size, n_blocks, n_prefixes, top_k, n_buckets, max_distance, spell prefix
+_HEADER = struct.Struct("<4sIIIIIIIII")
+_HEADER_V1 = struct.Struct("<4sIIIIII")  # no deletion index
+BLOCK = 16
+TOP_K = 10
+SHORT = 3
+SPELL_PREFIX = 7
+# Edits allowed when correcting a term of n characters (capped by the file's max distance):
+# none below CORRECT_MIN (any short word is an edit or two from some term), one below
+# TWO_EDITS_MIN, then two
+CORRECT_MIN = 3
+TWO_EDITS_MIN = 6
+_NONE = 0xFFFFFFFF
+
+
+def _put_varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(buf, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def edit_limit(term: str) -> int:
+    n = len(term)
+    return 0 if n < CORRECT_MIN else 1 if n < TWO_EDITS_MIN else 2
+
+
+def _delete_levels(word: bytes, distance: int) -> List[set]:
+    # [{word}, strings one byte shorter, ...]: everything reachable by up to distance deletions
+    levels = [{word}]
+    for _ in range(distance):
+        levels.append({w[:i] + w[i + 1 :] for w in levels[-1] for i in range(len(w))})
+    return levels
+
+
+def _deletes(word: bytes, distance: int) -> set:
+    return set().union(*_delete_levels(word, distance))
+
+
+def edit_distance(a: bytes, b: bytes, limit: int) -> int:
+    # Optimal string alignment (Levenshtein + adjacent transpositions); limit + 1 once it is exceeded
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Only the differing middle matters
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start : len(a) - end], b[start : len(b) - end]
+    if not a or not b:
+        return min(max(len(a), len(b)), limit + 1)
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if cost and prev2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d = min(d, prev2[j - 2] + 1)
+            cur[j] = d
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], limit + 1)
+
+
+def _bucket(key: bytes, mask: int) -> int:
+    return zlib.crc32(key) & mask
+
+
+def segment_doc_freqs(seg_dirs: List[Path]) -> Iterator[Tuple[bytes, int]]:
+    # (term bytes, doc freq summed over the segments) in byte order, streamed from terms.bin
+    streams = [TermDictionary(d / TERMS_FILE, d / "postings.bin").doc_freqs() for d in seg_dirs]
+    last, total = None, 0
+    for term, df in heapq.merge(*streams):
+        if term != last:
+            if last is not None:
+                yield last, total
+            last, total = term, 0
+        total += df
+    if last is not None:
+        yield last, total
+
+
+def build(items: Iterable[Tuple[bytes, int]], max_distance: int | None = None) -> bytes:
+    # items: (term bytes, doc freq), sorted by term bytes
+    max_distance = config.SPELL_DISTANCE if max_distance is None else max_distance
+    terms: List[bytes] = []
+    dfs = array("I")
+    for term, df in items:
+        terms.append(term)
+        dfs.append(df)
+    n = len(terms)
+
+    blob = bytearray()
+    offsets = array("I")
+    for i, term in enumerate(terms):
+        if i % BLOCK == 0:
+            offsets.append(len(blob))
+            _put_varint(blob, len(term))
+            blob += term
+            continue
+        prev = terms[i - 1]
+        shared = 0
+        limit = min(len(prev), len(term))
+        while shared < limit and prev[shared] == term[shared]:
+            shared += 1
+        _put_varint(blob, shared)
+        _put_varint(blob, len(term) - shared)
+        blob += term[shared:]
+
+    # Terms sharing a prefix form a contiguous run of the sorted list; the top k of each run
+    # is ordered by (-df, term), the same order suggest() uses for longer prefixes
+    prefixes: List[Tuple[bytes, List[int]]] = []
+    for length in range(1, SHORT + 1):
+        start = 0
+        while start < n:
+            if len(terms[start]) < length:
+                start += 1
+                continue
+            prefix = terms[start][:length]
+            end = start + 1
+            while end < n and terms[end][:length] == prefix:
+                end += 1
+            prefixes.append((prefix, heapq.nlargest(TOP_K, range(start, end), key=dfs.__getitem__)))
+            start = end
+    prefixes.sort()
+    prefix_blob = bytearray()
+    prefix_offsets = array("I", [0])
+    prefix_ords = array("I")
+    for prefix, ords in prefixes:
+        prefix_blob += prefix
+        prefix_offsets.append(len(prefix_blob))
+        prefix_ords.extend(ords + [_NONE] * (TOP_K - len(ords)))
+
+    # Deletion index: (bucket << 32 | ordinal) sorted, then cut into buckets. Hash collisions
+    # only add candidates, which correct() checks by their real edit distance.
+    pairs: List[int] = []
+    n_buckets = 0
+    if max_distance > 0 and n:
+        deletes = [_deletes(term[:SPELL_PREFIX], max_distance) for term in terms]
+        n_buckets = 1 << max(0, sum(map(len, deletes)) - 1).bit_length()
+        mask = n_buckets - 1
+        pairs = sorted({_bucket(d, mask) << 32 | i for i, ds in enumerate(deletes) for d in ds})
+    bucket_offsets = array("I", [0] * (n_buckets + 1))
+    for pair in pairs:
+        bucket_offsets[(pair >> 32) + 1] += 1
+    for i in range(n_buckets):
+        bucket_offsets[i + 1] += bucket_offsets[i]
+    bucket_ords = array("I", [pair & _NONE for pair in pairs])
+
+    lengths = bytes(min(len(term), 255) for term in terms) if n_buckets else b""
+
+    header = (_MAGIC, _VERSION, n, BLOCK, len(offsets), len(prefixes), TOP_K, n_buckets, max_distance, SPELL_PREFIX)
+    out = bytearray(_HEADER.pack(*header))
+    for part in (offsets, dfs, prefix_offsets, prefix_ords, bucket_offsets, bucket_ords):
+        out += _u32(part).tobytes()
+    return bytes(out + lengths + prefix_blob + blob)
+
+
+def write_suggestions(index_dir: Path, seg_dirs: List[Path]) -> None:
+    # Rebuilt from the segments' term dictionaries by full builds and by the background
+    # refresh after uploads
+    save_suggestions(index_dir, build(segment_doc_freqs(seg_dirs)))
+
+
+def save_suggestions(index_dir: Path, buf: bytes) -> None:
+    tmp = index_dir / f"{SUGGEST_FILE}.tmp"
+    tmp.write_bytes(buf)
+    os.replace(tmp, index_dir / SUGGEST_FILE)
+
+
+class Suggester:
+    # Prefix completion and spelling correction over suggest.bin (or bytes from build()):
+    # the most frequent terms first, ties in term order
+    def __init__(self, buf):
+        magic, version = struct.unpack_from("<4sI", buf, 0)
+        if magic != _MAGIC or version not in (1, _VERSION):
+            raise ValueError("Not a suggestion dictionary")
+        if version == 1:
+            _, _, n, block, n_blocks, n_prefixes, top_k = _HEADER_V1.unpack_from(buf, 0)
+            n_buckets, self.max_distance, self._spell_prefix = 0, 0, SPELL_PREFIX
+            pos = _HEADER_V1.size // 4
+        else:
+            _, _, n, block, n_blocks, n_prefixes, top_k, n_buckets, self.max_distance, self._spell_prefix = (
+                _HEADER.unpack_from(buf, 0)
+            )
+            pos = _HEADER.size // 4
+        self._buf = buf
+        self._n = n
+        self._block = block
+        self._top_k = top_k
+        self._offsets = _u32_view(buf, pos, n_blocks)
+        pos += n_blocks
+        self._dfs = _u32_view(buf, pos, n)
+        pos += n
+        self._prefix_offsets = _u32_view(buf, pos, n_prefixes + 1)
+        pos += n_prefixes + 1
+        self._prefix_ords = _u32_view(buf, pos, n_prefixes * top_k)
+        pos += n_prefixes * top_k
+        n_pairs = 0
+        self._bucket_offsets = array("I")
+        if version > 1:
+            self._bucket_offsets = _u32_view(buf, pos, n_buckets + 1)
+            n_pairs = self._bucket_offsets[n_buckets]
+            pos += n_buckets + 1
+        self._bucket_ords = _u32_view(buf, pos, n_pairs)
+        pos += n_pairs
+        self._mask = n_buckets - 1
+        self._lengths = memoryview(buf)[pos * 4 : pos * 4 + (n if n_buckets else 0)]
+        self._prefix_blob = pos * 4 + len(self._lengths)
+        self._n_prefixes = n_prefixes
+        self._blob = self._prefix_blob + (self._prefix_offsets[n_prefixes] if n_prefixes else 0)
+
+    @classmethod
+    def open(cls, index_dir: Path) -> Optional["Suggester"]:
+        path = index_dir / SUGGEST_FILE
+        return cls(_map(path)) if path.exists() and path.stat().st_size else None
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _head(self, b: int) -> bytes:
+        buf = self._buf
+        size, pos = _get_varint(buf, self._blob + self._offsets[b])
+        return bytes(buf[pos : pos + size])
+
+    def _decode_block(self, b: int, count: int) -> List[bytes]:
+        # The first count terms of block b
+        buf = self._buf
+        size, pos = _get_varint(buf, self._blob + self._offsets[b])
+        term = bytes(buf[pos : pos + size])
+        pos += size
+        terms = [term]
+        for _ in range(min(count, self._n - b * self._block) - 1):
+            # Terms are short: both varints are almost always a single byte
+            shared, size = buf[pos], buf[pos + 1]
+            if shared < 0x80 and size < 0x80:
+                pos += 2
+            else:
+                shared, pos = _get_varint(buf, pos)
+                size, pos = _get_varint(buf, pos)
+            term = term[:shared] + buf[pos : pos + size]
+            pos += size
+            terms.append(term)
+        return terms
+
+    def _term(self, ordinal: int) -> bytes:
+        b, i = divmod(ordinal, self._block)
+        return self._decode_block(b, i + 1)[i]
+
+    def _lower_bound(self, key: bytes) -> int:
+        # First ordinal whose term is >= key: binary search on block heads, then scan the block
+        lo, hi = 0, len(self._offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._head(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return 0
+        b = lo - 1
+        for i, term in enumerate(self._decode_block(b, self._block)):
+            if term >= key:
+                return b * self._block + i
+        return min(lo * self._block, self._n)
+
+    def _short_prefix(self, key: bytes) -> List[int]:
+        offsets, blob = self._prefix_offsets, self._prefix_blob
+        lo, hi = 0, self._n_prefixes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            cur = bytes(self._buf[blob + offsets[mid] : blob + offsets[mid + 1]])
+            if cur < key:
+                lo = mid + 1
+            elif cur > key:
+                hi = mid
+            else:
+                ords = self._prefix_ords[mid * self._top_k : (mid + 1) * self._top_k]
+                return [o for o in ords if o != _NONE]
+        return []
+
+    def suggest(self, prefix: str, k: int = TOP_K) -> List[Tuple[str, int]]:
+        # [(term, doc freq)] for up to k terms starting with prefix
+        key = prefix.encode("utf-8")
+        if not key or not self._n:
+            return []
+        if len(key) <= SHORT and k <= self._top_k:
+            ords = self._short_prefix(key)[:k]
+        else:
+            # Every term in [key, key + 0xff) has the prefix (0xff never occurs in UTF-8)
+            lo, hi = self._lower_bound(key), self._lower_bound(key + b"\xff")
+            ords = heapq.nlargest(k, range(lo, hi), key=self._dfs.__getitem__)
+        return [(self._term(o).decode("utf-8"), self._dfs[o]) for o in ords]
+
+    def doc_freq(self, term: str) -> int:
+        key = term.encode("utf-8")
+        i = self._lower_bound(key)
+        return self._dfs[i] if i < self._n and self._term(i) == key else 0
+
+    def correct(self, term: str, max_distance: int | None = None) -> Optional[Tuple[str, int, int]]:
+        # (term, doc freq, distance) of the closest indexed term, the most frequent among
+        # equally close ones; None if nothing is within max_distance (default: by the term's
+        # length, see edit_limit) or there is no deletion index (empty index, v1 file).
+        # A term within distance d shares a delete with the query at delete level <= d, so
+        # levels past the best distance found so far are never looked at.
+        limit = min(edit_limit(term) if max_distance is None else max_distance, self.max_distance)
+        key = term.encode("utf-8")
+        if limit <= 0 or not key or self._mask < 0:
+            return None
+        seen = set()
+        blocks: Dict[int, List[bytes]] = {}
+        best = None
+        for level, deletes in enumerate(_delete_levels(key[: self._spell_prefix], limit)):
+            if best is not None and level > best[0]:
+                break
+            for d in deletes:
+                b = _bucket(d, self._mask)
+                for o in self._bucket_ords[self._bucket_offsets[b] : self._bucket_offsets[b + 1]]:
+                    if o in seen:
+                        continue
+                    seen.add(o)
+                    bound = limit if best is None else best[0]
+                    if self._lengths[o] < 255 and abs(self._lengths[o] - len(key)) > bound:
+                        continue
+                    block, i = divmod(o, self._block)
+                    if block not in blocks:
+                        blocks[block] = self._decode_block(block, self._block)
+                    cand = blocks[block][i]
+                    dist = edit_distance(key, cand, bound)
+                    if dist > bound:
+                        continue
+                    rank = (dist, -self._dfs[o], cand)
+                    if best is None or rank < best:
+                        best = rank
+        if best is None:
+            return None
+        dist, neg_df, cand = best
+        return cand.decode("utf-8"), -neg_df, dist
@@ -0,0 +1,205 @@
+import hashlib
+import math
+import os
+import struct
+import uuid
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils import config
+from .segment import _map
+
+# Dense document vectors without a model: each term has a fixed sparse random direction
+# (_NNZ signed coordinates picked by hashing the term, so nothing vocabulary-sized is stored)
+# and a document is the normalised sum of its terms' directions weighted by
+# (1 + log tf) * idf. Dot products of these sparse random projections approximate the
+# TF-IDF cosine similarity.
+#
+# vectors_<id>.bin holds them behind an IVF index: k-means centroids over the vectors and
+# one contiguous list of docs per centroid. A query scores only the docs of its MGS_VECTOR_PROBES
+# nearest lists, about probes * sqrt(N) vectors with the default sqrt(N) lists.
+# Layout: header | centroids (f32, nlist * dim) | list offsets (u32, nlist + 1) |
+#         docids in list order (u32, N) | vectors in list order (f32, N * dim)
+_MAGIC = b"MGSV"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIIII")  # magic, version, N, dim, nlist
+_KMEANS_ITERS = 10
+_KMEANS_SAMPLE = 64  # training vectors per list
+_NNZ = 8  # nonzero coordinates per term direction
+_CHUNK_DOCS = 8192
+
+
+def _directions(terms: List[str], dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    # (coordinates, signs), each len(terms) x _NNZ; a coordinate may repeat within a term
+    digests = b"".join(hashlib.blake2b(t.encode("utf-8"), digest_size=2 * _NNZ).digest() for t in terms)
+    raw = np.frombuffer(digests, dtype="<u2").reshape(len(terms), _NNZ)
+    signs = np.where(raw & 0x8000, -1.0, 1.0) / math.sqrt(_NNZ)
+    return (raw & 0x7FFF).astype(np.int64) % dim, signs
+
+
+def _normalise(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1)
+
+
+def _idf(N: int, df: int) -> float:
+    # Same smoothing as the TF-IDF scorer
+    return math.log((N + 1) / df) + 1.0
+
+
+def doc_vectors(index, dim: int) -> np.ndarray:
+    N = index.N
+    terms: List[str] = []
+    doc_ids: List[np.ndarray] = []
+    weights: List[np.ndarray] = []
+    for term, postings in index.inverted_index.items():
+        ids = np.frombuffer(postings.doc_ids, dtype=np.uint32)
+        tfs = np.frombuffer(postings.tfs, dtype=np.uint32)
+        terms.append(term)
+        doc_ids.append(ids)
+        weights.append((1 + np.log(tfs)) * _idf(N, len(ids)))
+    out = np.zeros((N, dim), dtype=np.float32)
+    if not terms:
+        return out
+    coords, signs = _directions(terms, dim)
+    owner = np.repeat(np.arange(len(terms)), [len(ids) for ids in doc_ids])  # term of each posting
+    docs = np.concatenate(doc_ids)
+    w = np.concatenate(weights)
+    # Postings in docid order, scattered into float32 rows one run of docs at a time, so the
+    # float64 bincount temporaries stay at _CHUNK_DOCS * dim
+    order = np.argsort(docs, kind="stable")
+    docs, owner, w = docs[order], owner[order], w[order]
+    bounds = np.searchsorted(docs, np.arange(0, N + _CHUNK_DOCS, _CHUNK_DOCS))
+    for lo, start, end in zip(range(0, N, _CHUNK_DOCS), bounds, bounds[1:]):
+        rows = out[lo : lo + _CHUNK_DOCS]
+        cells = (docs[start:end].astype(np.int64) - lo) * dim
+        for j in range(_NNZ):
+            o = owner[start:end]
+            rows += np.bincount(
+                cells + coords[o, j], weights=w[start:end] * signs[o, j], minlength=rows.size
+            ).reshape(rows.shape)
+    return _normalise(out)
+
+
+def doc_count(path: Path) -> int:
+    # Documents covered by a vectors file (the first N docids), from its header
+    with path.open("rb") as f:
+        magic, version, N, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Not a vector index")
+    return N
+
+
+def query_vector(terms: List[str], doc_freq: Mapping[str, int], N: int, dim: int) -> Optional[np.ndarray]:
+    q_tf: Dict[str, int] = {}
+    for t in terms:
+        q_tf[t] = q_tf.get(t, 0) + 1
+    known = [(t, qf, df) for t, qf in q_tf.items() if (df := doc_freq.get(t, 0))]
+    if not known:
+        return None
+    coords, signs = _directions([t for t, _, _ in known], dim)
+    q = np.zeros(dim)
+    for i, (_, qf, df) in enumerate(known):
+        np.add.at(q, coords[i], (1 + math.log(qf)) * _idf(N, df) * signs[i])
+    norm = float(np.linalg.norm(q))
+    return (q / norm).astype(np.float32) if norm else None
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    # Index of each row's most similar centroid, in chunks to bound the len(x) * nlist matrix
+    out = np.zeros(len(x), dtype=np.int64)
+    for i in range(0, len(x), chunk):
+        out[i : i + chunk] = np.argmax(x[i : i + chunk] @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(x: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    # Spherical k-means (cosine) on a sample; a list that empties keeps its old centroid
+    rng = np.random.default_rng(seed)
+    sample = x[rng.choice(len(x), min(len(x), nlist * _KMEANS_SAMPLE), replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+    for _ in range(_KMEANS_ITERS):
+        assign = _nearest(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        centroids = np.where(counts[:, None] > 0, _normalise(sums), centroids)
+    return centroids
+
+
+def build(index, dim: int | None = None, nlist: int | None = None) -> bytes:
+    dim = dim or config.VECTOR_DIM
+    vecs = doc_vectors(index, dim)
+    N = len(vecs)
+    nlist = min(N, nlist or config.VECTOR_LISTS or max(1, round(math.sqrt(N))))
+    if nlist:
+        centroids = kmeans(vecs, nlist)
+        assign = _nearest(vecs, centroids)
+    else:
+        centroids = np.zeros((0, dim), dtype=np.float32)
+        assign = np.zeros(0, dtype=np.int64)
+    order = np.argsort(assign, kind="stable")  # each list keeps docid order
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assign, minlength=nlist), out=offsets[1:])
+    return b"".join(
+        [
+            _HEADER.pack(_MAGIC, _VERSION, N, dim, nlist),
+            centroids.astype("<f4").tobytes(),
+            offsets.astype("<u4").tobytes(),
+            order.astype("<u4").tobytes(),
+            vecs[order].astype("<f4").tobytes(),
+        ]
+    )
+
+
+def write_vectors(index_dir: Path, index) -> str:
+    # Returns the new file's name, which the manifest records
+    name = f"vectors_{uuid.uuid4().hex[:16]}.bin"
+    tmp = index_dir / f"{name}.tmp"
+    tmp.write_bytes(build(index))
+    os.replace(tmp, index_dir / name)
+    return name
+
+
+class VectorIndex:
+    def __init__(self, buf):
+        magic, version, N, dim, nlist = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a vector index")
+        self.N, self.dim, self.nlist = N, dim, nlist
+        pos = _HEADER.size
+        self.centroids = np.frombuffer(buf, dtype="<f4", count=nlist * dim, offset=pos).reshape(nlist, dim)
+        pos += nlist * dim * 4
+        self.offsets = np.frombuffer(buf, dtype="<u4", count=nlist + 1, offset=pos)
+        pos += (nlist + 1) * 4
+        self.doc_ids = np.frombuffer(buf, dtype="<u4", count=N, offset=pos)
+        pos += N * 4
+        self.vectors = np.frombuffer(buf, dtype="<f4", count=N * dim, offset=pos).reshape(N, dim)
+
+    @classmethod
+    def open(cls, path: Path) -> "VectorIndex":
+        return cls(_map(path))
+
+    def search(
+        self, q: np.ndarray, k: int, probes: int | None = None, allowed: Optional[Sequence[int]] = None
+    ) -> List[Tuple[int, float]]:
+        # (docid, cosine) of the k nearest docs in the probed lists, ties to the lower docid;
+        # allowed (sorted docids) restricts the result to those docs
+        if not self.nlist or k <= 0:
+            return []
+        probes = min(self.nlist, probes or config.VECTOR_PROBES)
+        near = np.argpartition(-(self.centroids @ q), probes - 1)[:probes]
+        ranges = [(int(self.offsets[c]), int(self.offsets[c + 1])) for c in near]
+        doc_ids = np.concatenate([self.doc_ids[s:e] for s, e in ranges])
+        sims = np.concatenate([self.vectors[s:e] @ q for s, e in ranges])
+        if allowed is not None:
+            keep = np.isin(doc_ids, np.asarray(allowed, dtype=np.uint32), assume_unique=True)
+            doc_ids, sims = doc_ids[keep], sims[keep]
+        if len(sims) > k:
+            top = np.argpartition(-sims, k - 1)[:k]
+            doc_ids, sims = doc_ids[top], sims[top]
+        order = np.lexsort((doc_ids, -sims))
+        return [(int(doc_ids[i]), float(sims[i])) for i in order]
+
@@ -0,0 +1,48 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from ..utils import config
+from ..utils.text_cleaning import Analyzer, lemmatize, remove_stopwords, tokenize
+
+
+def reference(text: str) -> List[str]:
+    # The pre-Analyzer pipeline: normalize, split, filter, stem, one list per stage
+    return lemmatize(remove_stopwords(tokenize(text)))
+
+
+def _throughput(fn: Callable[[str], List[str]], texts: List[str], repeat: int) -> Dict[str, float]:
+    best = float("inf")
+    tokens = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = sum(len(fn(t)) for t in texts)
+        best = min(best, time.perf_counter() - start)
+    mb = sum(len(t) for t in texts) / 1e6
+    return {"seconds": round(best, 4), "terms_per_sec": round(tokens / best), "mb_per_sec": round(mb / best, 2)}
+
+
+def run(data_dir: Path, repeat: int = 3) -> Dict:
+    texts = [p.read_text(encoding="utf-8", errors="ignore") for p in sorted(data_dir.glob("**/*.txt"))]
+    analyzer = Analyzer()
+    mismatches = sum(analyzer.analyze(t) != reference(t) for t in texts)
+    old = _throughput(reference, texts, repeat)
+    new = _throughput(Analyzer().analyze, texts, repeat)  # best of repeats, i.e. with a warm memo
+    return {
+        "docs": len(texts),
+        "mismatches": mismatches,
+        "reference": old,
+        "analyzer": new,
+        "speedup": round(old["seconds"] / new["seconds"], 2) if new["seconds"] else None,
+    }
+
+
+if __name__ == "__main__":
+    # python -m mini_google_search.benchmarks.analyzer [--data DIR] [--repeat N]
+    parser = argparse.ArgumentParser(description="Analyzer throughput vs the reference pipeline")
+    parser.add_argument("--data", type=Path, default=config.DATA_DIR)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.data, args.repeat), indent=2))
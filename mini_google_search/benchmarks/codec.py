@@ -0,0 +1,62 @@
+import argparse
+import json
+import pickle
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from ..backend.indexer import Indexer
+from ..backend.query_engine import QueryEngine
+from ..utils.caching import LRUCache, decode, encode
+from .corpus import generate_corpus, generate_queries
+
+
+def _timed(fn: Callable[[Any], Any], items: List[Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _codec(dumps: Callable, loads: Callable, values: List[Any], repeat: int) -> Dict[str, float]:
+    blobs = [dumps(v) for v in values]
+    return {
+        "encode_ms": round(_timed(dumps, values, repeat) * 1e3, 3),
+        "decode_ms": round(_timed(loads, blobs, repeat) * 1e3, 3),
+        "bytes": sum(len(b) for b in blobs),
+    }
+
+
+def run(n_docs: int = 2000, n_queries: int = 100, k: int = 10, repeat: int = 20, seed: int = 0) -> Dict:
+    # Result lists of real searches (snippets included), as the result cache stores them
+    with tempfile.TemporaryDirectory(prefix="mgs-codec-") as tmp:
+        vocab = generate_corpus(Path(tmp) / "data", n_docs=n_docs, seed=seed)
+        Indexer().rebuild_index(Path(tmp) / "data", Path(tmp) / "index")
+        engine = QueryEngine(Path(tmp) / "index")
+        engine.cache = LRUCache(maxsize=0)
+        values = [engine.search(q, k) for q in dict.fromkeys(generate_queries(vocab, n_queries * 2, seed=seed))]
+    values = [v for v in values if v][:n_queries]
+    pickled = _codec(lambda v: pickle.dumps(v, pickle.HIGHEST_PROTOCOL), pickle.loads, values, repeat)
+    ours = _codec(encode, decode, values, repeat)
+    return {
+        "values": len(values),
+        "k": k,
+        "pickle": pickled,
+        "marshal_rows": ours,
+        "vs_pickle": {m: round(ours[m] / pickled[m], 2) for m in ours if pickled[m]},
+    }
+
+
+if __name__ == "__main__":
+    # python -m mini_google_search.benchmarks.codec [--docs N] [--queries N] [--k 10] [--repeat N]
+    parser = argparse.ArgumentParser(description="Result cache encoding vs pickle")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.docs, args.queries, args.k, args.repeat), indent=2))
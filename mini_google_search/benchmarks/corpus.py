@@ -0,0 +1,76 @@
+import itertools
+import random
+from pathlib import Path
+from typing import List
+
+from ..utils.text_cleaning import ANALYZER
+
+_CONSONANTS = "bcdfghjklmnprstvwz"
+_VOWELS = "aeiou"
+
+
+def vocabulary(size: int, seed: int = 0) -> List[str]:
+    # Distinct pronounceable pseudo-words, most frequent first. Each word is its own analyzed
+    # term (no stopwords, nothing the stemmer would shorten), so term ranks survive indexing.
+    rnd = random.Random(seed)
+    words: List[str] = []
+    seen = set()
+    n_syllables = 2
+    while len(words) < size:
+        for _ in range(size * 4):  # then move on to longer words
+            word = "".join(rnd.choice(_CONSONANTS) + rnd.choice(_VOWELS) for _ in range(n_syllables))
+            if word not in seen and ANALYZER.term(word) == word:
+                seen.add(word)
+                words.append(word)
+                if len(words) == size:
+                    break
+        n_syllables += 1
+    return words
+
+
+def zipf_weights(size: int, s: float = 1.1) -> List[float]:
+    # Cumulative weights for rank r ~ 1 / r^s, ready for random.choices(cum_weights=...)
+    return list(itertools.accumulate(1.0 / (r**s) for r in range(1, size + 1)))
+
+
+def generate_corpus(
+    out_dir: str | Path,
+    n_docs: int = 2000,
+    doc_len: int = 200,
+    vocab_size: int = 20000,
+    zipf_s: float = 1.1,
+    seed: int = 0,
+) -> List[str]:
+    # Writes n_docs .txt files whose lengths vary uniformly in [doc_len / 2, doc_len * 3 / 2]
+    # and whose terms follow a Zipf distribution; the same arguments always give the same
+    # files. Returns the vocabulary, most frequent first.
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    vocab = vocabulary(vocab_size, seed)
+    cum = zipf_weights(vocab_size, zipf_s)
+    rnd = random.Random(seed + 1)
+    for i in range(n_docs):
+        n = rnd.randint(max(1, doc_len // 2), max(1, doc_len * 3 // 2))
+        words = rnd.choices(vocab, cum_weights=cum, k=n)
+        lines = [" ".join(words[j : j + 12]) for j in range(0, n, 12)]
+        (out_dir / f"doc_{i:06d}.txt").write_text(f"Doc {i}\n" + "\n".join(lines) + "\n", encoding="utf-8")
+    return vocab
+
+
+def generate_queries(
+    vocab: List[str], n_queries: int = 1000, head_share: float = 0.6, head_pool: int = 50, seed: int = 0
+) -> List[str]:
+    # A query log mixing head and tail traffic: head queries are drawn (with repeats) from a
+    # small pool of popular queries over the top 1% of terms; tail queries are one-offs over
+    # the rarer 90% of the vocabulary. Queries have 1-3 terms.
+    rnd = random.Random(seed + 2)
+    top = vocab[: max(1, len(vocab) // 100)]
+    rare = vocab[len(vocab) // 10 :] or vocab
+    pool = [" ".join(rnd.sample(top, min(len(top), rnd.randint(1, 3)))) for _ in range(head_pool)]
+    log = []
+    for _ in range(n_queries):
+        if rnd.random() < head_share:
+            log.append(rnd.choice(pool))
+        else:
+            log.append(" ".join(rnd.choice(rare) for _ in range(rnd.randint(1, 3))))
+    return log
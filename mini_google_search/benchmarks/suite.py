@@ -0,0 +1,185 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..utils import config
+from .corpus import generate_corpus, generate_queries
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    # Nearest-rank percentiles of latencies in seconds, reported in milliseconds
+    s = sorted(samples)
+    if not s:
+        return {}
+
+    def rank(p: float) -> float:
+        return round(s[max(0, math.ceil(p / 100 * len(s)) - 1)] * 1e3, 3)
+
+    return {
+        "p50_ms": rank(50),
+        "p95_ms": rank(95),
+        "p99_ms": rank(99),
+        "mean_ms": round(sum(s) / len(s) * 1e3, 3),
+        "qps": round(len(s) / sum(s), 1) if sum(s) else None,
+    }
+
+
+def bench_build(data_dir: Path, index_dir: Path, workers: Optional[int]) -> Dict[str, Any]:
+    from ..backend.indexer import Indexer
+
+    idx = Indexer()
+    start = time.perf_counter()
+    idx.build_index(data_dir, workers=workers)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    idx.save_index(index_dir)
+    saved = time.perf_counter() - start
+    return {
+        "docs": idx.index.N,
+        "terms": len(idx.index.inverted_index),
+        "build_s": round(built, 3),
+        "docs_per_sec": round(idx.index.N / built, 1) if built else None,
+        "save_s": round(saved, 3),
+        "index_bytes": sum(p.stat().st_size for p in index_dir.rglob("*") if p.is_file()),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_serve(index_dir: str, queries: List[str], k: int) -> Dict[str, Any]:
+    # Runs in a fresh process, so load time and peak RSS reflect serving only (not the build)
+    from ..backend.indexer import Indexer
+    from ..backend.query_engine import QueryEngine
+    from ..utils.caching import LRUCache
+
+    start = time.perf_counter()
+    Indexer().load_index(index_dir)
+    load_s = time.perf_counter() - start
+    start = time.perf_counter()
+    engine = QueryEngine(index_dir)
+    engine_s = time.perf_counter() - start
+    out: Dict[str, Any] = {"load_index_s": round(load_s, 4), "engine_init_s": round(engine_s, 4)}
+    for ranking in ("bm25", "tfidf"):
+        for cached in (False, True):
+            # A local LRU either way (never Redis), emptied per run; maxsize=0 disables it
+            engine.cache = LRUCache(maxsize=config.CACHE_SIZE if cached else 0)
+            samples = []
+            for q in queries:
+                start = time.perf_counter()
+                engine.search(q, k, ranking=ranking)
+                samples.append(time.perf_counter() - start)
+            out[f"{ranking}_{'cache' if cached else 'nocache'}"] = percentiles(samples)
+    out["peak_rss_mb"] = peak_rss_mb()
+    return out
+
+
+def run(
+    n_docs: int = 2000,
+    doc_len: int = 200,
+    vocab_size: int = 20000,
+    n_queries: int = 1000,
+    seed: int = 0,
+    k: int = 10,
+    workers: Optional[int] = None,
+    work_dir: str | Path | None = None,
+) -> Dict[str, Any]:
+    params = {
+        "n_docs": n_docs,
+        "doc_len": doc_len,
+        "vocab_size": vocab_size,
+        "n_queries": n_queries,
+        "seed": seed,
+        "k": k,
+        "workers": workers,
+    }
+    tmp = Path(work_dir) if work_dir else Path(tempfile.mkdtemp(prefix="mgs-bench-"))
+    try:
+        data_dir, index_dir = tmp / "data", tmp / "index"
+        shutil.rmtree(data_dir, ignore_errors=True)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        vocab = generate_corpus(data_dir, n_docs, doc_len, vocab_size, seed=seed)
+        queries = generate_queries(vocab, n_queries, seed=seed)
+        build = bench_build(data_dir, index_dir, workers)
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            serve = pool.submit(bench_serve, str(index_dir), queries, k).result()
+    finally:
+        if not work_dir:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "params": params,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scoring_backend": config.SCORING_BACKEND,
+            "topk_pruning": config.TOPK_PRUNING,
+            "positions": config.POSITIONS,
+        },
+        "build": build,
+        "serve": serve,
+    }
+
+
+def _number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    # result / baseline for every numeric metric both runs have (< 1 is faster/smaller
+    # for times and sizes, > 1 is better for throughputs)
+    out: Dict[str, Any] = {}
+    for key, value in result.items():
+        base = baseline.get(key)
+        if isinstance(value, dict) and isinstance(base, dict):
+            nested = compare(value, base)
+            if nested:
+                out[key] = nested
+        elif _number(value) and _number(base) and base:
+            out[key] = round(value / base, 3)
+    return out
+
+
+if __name__ == "__main__":
+    # python -m mini_google_search.benchmarks.suite [--docs N] ... [--out run.json] [--baseline base.json]
+    parser = argparse.ArgumentParser(description="Indexing throughput, query latency and memory benchmark")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--doc-len", type=int, default=200)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None, help="index build processes (default MGS_INDEX_WORKERS)")
+    parser.add_argument("--work-dir", type=Path, default=None, help="keep the corpus and index here")
+    parser.add_argument("--out", type=Path, default=None, help="also write the JSON result here")
+    parser.add_argument("--baseline", type=Path, default=None, help="earlier result to compare against")
+    args = parser.parse_args()
+    result = run(args.docs, args.doc_len, args.vocab, args.queries, args.seed, args.k, args.workers, args.work_dir)
+    if args.baseline:
+        result["vs_baseline"] = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")))
+    text = json.dumps(result, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    print(text)
@@ -23,11 +23,39 @@ def search_via_api(query: str, k: int):
     return resp.json()["results"]
 
 
-def search_local(query: str, k: int):
+@st.cache_resource(max_entries=1)
+def _engine_for(generation):
+    # One engine per published index generation, shared by every rerun and session;
+    # a local upload or rebuild publishes a new generation and so a fresh engine
     from mini_google_search.backend.query_engine import QueryEngine
 
-    engine = QueryEngine()
-    return engine.search(query, k)
+    return QueryEngine()
+
+
+def local_engine():
+    from mini_google_search.backend.indexer import current_generation
+
+    return _engine_for(current_generation())
+
+
+def search_local(query: str, k: int):
+    engine = local_engine()
+    results = engine.search(query, k)
+    return results, None if results else engine.did_you_mean(query)
+
+
+def suggest(prefix: str, k: int = 5):
+    # Completions of the last word typed, from the index's term dictionary
+    try:
+        if API_BASE:
+            import requests
+
+            resp = requests.get(f"{API_BASE}/suggest", params={"prefix": prefix, "k": k}, timeout=2)
+            resp.raise_for_status()
+            return resp.json()["suggestions"]
+        return local_engine().suggest(prefix, k)
+    except Exception:
+        return []
 
 
 def extract_pdf_text(file) -> str:
@@ -72,7 +100,7 @@ def ingest_files(uploaded_files) -> tuple[int, int]:
             content_type = "application/pdf" if uf.name.lower().endswith(".pdf") else "text/plain"
             files.append(("files", (uf.name, data, content_type)))
         try:
-            resp = requests.post(f"{API_BASE}/upload", files=files, timeout=60)
+            resp = requests.post(f"{API_BASE}/upload", params={"wait": "true"}, files=files, timeout=60)
             resp.raise_for_status()
             j = resp.json()
             saved = int(j.get("saved", 0))
@@ -82,11 +110,12 @@ def ingest_files(uploaded_files) -> tuple[int, int]:
                 uf.close()
         return saved, total
 
-    # Local path (no API): write to data dir and rebuild
+    # Local path (no API): write to data dir and index the new files as a segment
     data_dir = Path(config.DATA_DIR)
     data_dir.mkdir(parents=True, exist_ok=True)
 
     saved = 0
+    saved_paths: list[Path] = []
     for uf in uploaded_files:
         name = Path(uf.name).name
         suffix = Path(name).suffix.lower()
@@ -110,12 +139,14 @@ def ingest_files(uploaded_files) -> tuple[int, int]:
                 content = f"{stem}\n" + content
             target.write_text(content, encoding="utf-8", errors="ignore")
             saved += 1
+            saved_paths.append(target)
         finally:
             uf.close()
 
-    idx = Indexer()
-    idx.build_index(data_dir)
-    idx.save_index()
+    if saved_paths:
+        idx = Indexer()
+        idx.add_documents(saved_paths, data_dir)
+        idx.merge_in_background()
     try:
         from mini_google_search.backend.indexer import Indexer as _I
 
@@ -133,7 +164,7 @@ st.caption("Upload .txt/.pdf, then search with BM25/TF‑IDF")
 
 with st.sidebar:
     st.header("Settings")
-    ranking_mode = st.radio("Ranking", options=["bm25", "tfidf"], index=0, horizontal=False)
+    ranking_mode = st.radio("Ranking", options=["bm25", "tfidf", "hybrid"], index=0, horizontal=False)
 
 # Corpus status panel
 from mini_google_search.utils import config as _cfg
@@ -173,15 +204,19 @@ if st.button("Rebuild index"):
             import requests
 
             try:
-                requests.post(f"{API_BASE}/index", timeout=20)
+                # Runs as a background job; the API keeps serving the old index until it is done
+                requests.post(f"{API_BASE}/index", timeout=20).raise_for_status()
+                st.success("Index rebuild started.")
             except Exception as e:
                 st.error(f"API rebuild failed: {e}")
         else:
-            idx.build_index(data_dir)
-            idx.save_index()
-    st.success("Index rebuilt.")
+            idx.rebuild_index(data_dir)
+            st.success("Index rebuilt.")
 
 query = st.text_input("Search query", "machine learning")
+suggestions = [s["text"] for s in suggest(query)] if query.strip() else []
+if suggestions:
+    st.caption("Suggestions: " + "  •  ".join(suggestions))
 topk = st.slider("Top K", min_value=1, max_value=50, value=10)
 
 if st.button("Search"):
@@ -200,11 +235,15 @@ if st.button("Search"):
                     )
                     resp.raise_for_status()
                     results = resp.json()["results"]
+                    did_you_mean = resp.json().get("did_you_mean")
                 else:
-                    results = search_local(query, topk)
+                    results, did_you_mean = search_local(query, topk)
             except Exception as e:
                 st.error(f"Search failed: {e}")
-                results = []
+                results, did_you_mean = [], None
+
+        if did_you_mean:
+            st.info(f"Did you mean: {did_you_mean}")
 
         if not results:
             st.info("No results found.")
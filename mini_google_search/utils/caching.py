@@ -1,56 +1,279 @@
+import marshal
+import sys
+import threading
+import time
+import zlib
 from collections import OrderedDict
-from typing import Any, Optional
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from . import config
+from . import config, metrics
+
+
+def approx_size(value: Any) -> int:
+    # Rough in-memory footprint of cached results (lists/dicts of str/float), in bytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approx_size(v) for v in value)
+    return size
 
 
 class LRUCache:
-    def __init__(self, maxsize: int = 256):
+    # Bounded by entry count and by an approximate byte budget; entries may expire after a TTL
+    def __init__(self, maxsize: int = 256, max_bytes: int | None = None, ttl: float | None = None):
         self.maxsize = maxsize
-        self._store: OrderedDict[str, Any] = OrderedDict()
+        self.max_bytes = config.CACHE_BYTES if max_bytes is None else max_bytes
+        self.ttl = config.CACHE_TTL if ttl is None else ttl
+        self._store: OrderedDict[str, Tuple[Any, int, float]] = OrderedDict()  # value, size, expiry (0 = never)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
 
     def get(self, key: str) -> Optional[Any]:
-        if key in self._store:
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expiry = entry
+            if expiry and expiry <= time.monotonic():
+                del self._store[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
             self._store.move_to_end(key)
-            return self._store[key]
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        size = approx_size(key) + approx_size(value)
+        with self._lock:
+            old = self._store.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if self.max_bytes and size > self.max_bytes:
+                return  # larger than the whole budget: not worth caching
+            self._store[key] = (value, size, time.monotonic() + ttl if ttl else 0.0)
+            self._bytes += size
+            while len(self._store) > self.maxsize or (self.max_bytes and self._bytes > self.max_bytes):
+                _, (_, evicted, _) = self._store.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return [self.get(key) for key in keys]
+
+    def set_many(self, items: List[Tuple[str, Any]], ttl: float | None = None) -> None:
+        for key, value in items:
+            self.set(key, value, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._store),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    # Concurrent do() calls with the same key share one execution of fn; the others
+    # block until it finishes and get its result (or exception). Waiters are counted in
+    # the process-wide mgs_search_coalesced_total, which outlives any one engine.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            metrics.inc("mgs_search_coalesced_total")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+
+# Compact L2 encoding: result dicts become marshalled positional tuples (the keys are
+# implied), within microseconds of pickle and a little smaller; only values past
+# _COMPRESS_MIN (e.g. k=100 result lists) are zlib-compressed, since zlib costs about ten
+# times the encoding itself. The tag byte names the layout.
+_RESULT_KEYS = ("doc_id", "title", "url", "score", "snippet")
+_result_row = itemgetter(*_RESULT_KEYS)
+_TAG_ROWS, _TAG_VALUE, _TAG_ZIP = b"R", b"V", b"Z"
+_MARSHAL_VERSION = bytes([marshal.version])
+_COMPRESS_MIN = 16 * 1024
+
+
+def encode(value: Any) -> bytes:
+    body = None
+    if type(value) is list:
+        try:
+            rows = list(map(_result_row, value))
+            # Every key was found, so equal sizes mean no other keys
+            if sum(map(len, value)) == len(_RESULT_KEYS) * len(value):
+                body = _TAG_ROWS + marshal.dumps(rows)
+        except (KeyError, TypeError):
+            pass  # not result dicts: stored as is
+    if body is None:
+        body = _TAG_VALUE + marshal.dumps(value)
+    if len(body) >= _COMPRESS_MIN:
+        body = _TAG_ZIP + zlib.compress(body, 1)
+    return _MARSHAL_VERSION + body
+
+
+def decode(data: bytes) -> Any:
+    # None for anything this process cannot read (e.g. written by another Python version)
+    if data[:1] != _MARSHAL_VERSION:
         return None
+    body = data[1:]
+    if body[:1] == _TAG_ZIP:
+        body = zlib.decompress(body[1:])
+    if body[:1] == _TAG_ROWS:
+        return [
+            {"doc_id": doc_id, "title": title, "url": url, "score": score, "snippet": snippet}
+            for doc_id, title, url, score, snippet in marshal.loads(body[1:])
+        ]
+    if body[:1] == _TAG_VALUE:
+        return marshal.loads(body[1:])
+    return None
 
-    def set(self, key: str, value: Any) -> None:
-        if key in self._store:
-            self._store.move_to_end(key)
-        self._store[key] = value
-        if len(self._store) > self.maxsize:
-            self._store.popitem(last=False)
 
+class RedisCache:
+    # Memory bounds and eviction are left to Redis (maxmemory policy); TTL maps to EX.
+    # Redis errors degrade to cache misses rather than failing the search.
+    def __init__(self, client, ttl: float | None = None):
+        self.client = client
+        self.ttl = config.CACHE_TTL if ttl is None else ttl
+        self.hits = self.misses = self.errors = 0
 
-def get_cache_backend():
-    # Optional Redis support if environment and package are available
-    if config.REDIS_URL:
+    def _ex(self, ttl: float | None) -> Optional[int]:
+        ttl = self.ttl if ttl is None else ttl
+        return max(1, int(ttl)) if ttl else None
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        # One MGET round trip for the whole batch
         try:
-            import redis  # type: ignore
+            raw = self.client.mget(keys) if keys else []
+        except Exception:
+            self.errors += 1
+            raw = [None] * len(keys)
+        values = [decode(v) if v is not None else None for v in raw]
+        found = sum(v is not None for v in values)
+        self.hits += found
+        self.misses += len(keys) - found
+        return values
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self.set_many([(key, value)], ttl)
+
+    def set_many(self, items: List[Tuple[str, Any]], ttl: float | None = None) -> None:
+        ex = self._ex(ttl)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in items:
+                pipe.set(key, encode(value), ex=ex)
+            pipe.execute()
+        except Exception:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            info = self.client.info("stats")
+        except Exception:
+            info = {}
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "evictions": info.get("evicted_keys", 0),
+            "expirations": info.get("expired_keys", 0),
+        }
 
-            client = redis.from_url(config.REDIS_URL)
-            client.ping()
 
-            class RedisCache:
-                def __init__(self, client):
-                    self.client = client
+class TieredCache:
+    # Process-local L1 in front of a shared L2: hot queries never leave the process,
+    # L2 hits are copied into L1, writes go to both
+    def __init__(self, l1: LRUCache, l2: RedisCache):
+        self.l1 = l1
+        self.l2 = l2
 
-                def get(self, key: str):
-                    val = self.client.get(key)
-                    if val is None:
-                        return None
-                    import pickle
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key])[0]
 
-                    return pickle.loads(val)
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        values = self.l1.get_many(keys)
+        missing = [i for i, v in enumerate(values) if v is None]
+        if missing:
+            for i, value in zip(missing, self.l2.get_many([keys[i] for i in missing])):
+                if value is not None:
+                    values[i] = value
+                    self.l1.set(keys[i], value)
+        return values
 
-                def set(self, key: str, value: Any):
-                    import pickle
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self.set_many([(key, value)], ttl)
 
-                    self.client.set(key, pickle.dumps(value))
+    def set_many(self, items: List[Tuple[str, Any]], ttl: float | None = None) -> None:
+        self.l1.set_many(items, ttl)
+        self.l2.set_many(items, ttl)
 
-            return RedisCache(client)
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "tiered", "l1": self.l1.stats(), "l2": self.l2.stats()}
+
+
+# Connection pools outlive QueryEngine reloads, keyed by URL
+_POOLS: Dict[str, Any] = {}
+
+
+def get_cache_backend():
+    l1 = LRUCache(maxsize=config.CACHE_SIZE)
+    # Optional Redis L2 if environment and package are available
+    if config.REDIS_URL:
+        try:
+            import redis  # type: ignore
+
+            pool = _POOLS.get(config.REDIS_URL)
+            if pool is None:
+                pool = redis.ConnectionPool.from_url(config.REDIS_URL, max_connections=config.REDIS_POOL_SIZE)
+            client = redis.Redis(connection_pool=pool)
+            client.ping()
+            _POOLS[config.REDIS_URL] = pool
+            return TieredCache(l1, RedisCache(client))
         except Exception:
             pass
-    return LRUCache(maxsize=config.CACHE_SIZE)
-
+    return l1
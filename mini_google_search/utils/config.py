@@ -9,18 +9,66 @@ INDEX_DIR = Path(os.getenv("MGS_INDEX_DIR", ROOT_DIR / "mini_google_search" / "b
 
 
 # Ranking
-RANKING_MODE = os.getenv("MGS_RANKING", "bm25").lower()  # options: "bm25", "tfidf"
+RANKING_MODE = os.getenv("MGS_RANKING", "bm25").lower()  # options: "bm25", "tfidf", "hybrid"
 MAX_RESULTS = int(os.getenv("MGS_MAX_RESULTS", "10"))
 
 
 # BM25 parameters
 BM25_K1 = float(os.getenv("MGS_BM25_K1", "1.5"))
 BM25_B = float(os.getenv("MGS_BM25_B", "0.75"))
+# MaxScore dynamic pruning for BM25 top-k (1); off by default, scoring every candidate
+TOPK_PRUNING = os.getenv("MGS_TOPK_PRUNING", "0").lower() not in {"0", "false", "no"}
+# Scoring backend: "python" or "numpy" (vectorized; falls back to python without NumPy)
+SCORING_BACKEND = os.getenv("MGS_SCORING_BACKEND", "python").lower()
+# Threads scoring the cache misses of one /search/batch request
+BATCH_WORKERS = int(os.getenv("MGS_BATCH_WORKERS", "4"))
+# Recent queries replayed to warm a freshly loaded engine before it is swapped in
+WARM_QUERIES = int(os.getenv("MGS_WARM_QUERIES", "32"))
+# Seconds between checks for index generations published by other worker processes (0 = off)
+RELOAD_INTERVAL = float(os.getenv("MGS_RELOAD_INTERVAL", "2"))
+# Impact-ordered index: full builds also store 8-bit quantized BM25 impacts for K1/B
+IMPACT_INDEX = os.getenv("MGS_IMPACT_INDEX", "0").lower() in {"1", "true", "yes"}
+# Postings processed before an impact-ordered query stops early (0 = until the top k is exact)
+IMPACT_BUDGET = int(os.getenv("MGS_IMPACT_BUDGET", "0"))
+# Dense vectors (needs NumPy) for ranking=hybrid: dimensions written with each build (0 = none,
+# hybrid falls back to BM25), IVF lists (0 = sqrt of the doc count) and lists scanned per query
+VECTOR_DIM = int(os.getenv("MGS_VECTOR_DIM", "0"))
+VECTOR_LISTS = int(os.getenv("MGS_VECTOR_LISTS", "0"))
+VECTOR_PROBES = int(os.getenv("MGS_VECTOR_PROBES", "16"))
+# ranking=hybrid fuses the BM25 and vector top HYBRID_DEPTH with reciprocal rank fusion
+HYBRID_DEPTH = int(os.getenv("MGS_HYBRID_DEPTH", "50"))
+RRF_K = int(os.getenv("MGS_RRF_K", "60"))
+
+
+# Record token positions and character offsets in the index (snippets, phrase queries)
+POSITIONS = os.getenv("MGS_POSITIONS", "1").lower() not in {"0", "false", "no"}
+# Spelling correction: max edit distance of the deletion index each build writes (0 = none)
+SPELL_DISTANCE = int(os.getenv("MGS_SPELL_DISTANCE", "2"))
+
+
+# Segments: uploads add small segments; this many same-sized segments get merged
+MERGE_FACTOR = int(os.getenv("MGS_MERGE_FACTOR", "10"))
+# Index build processes; 1 = serial, 0 = one per CPU
+INDEX_WORKERS = int(os.getenv("MGS_INDEX_WORKERS", "1"))
+# Upload text/PDF extraction processes (0 = one per CPU) and per-file time limit in seconds (0 = none)
+EXTRACT_WORKERS = int(os.getenv("MGS_EXTRACT_WORKERS", "2"))
+EXTRACT_TIMEOUT = float(os.getenv("MGS_EXTRACT_TIMEOUT", "60"))
+# Document-partitioned shards, each searched by its own local process (1 = unsharded)
+SHARDS = int(os.getenv("MGS_SHARDS", "1"))
+
+
+# Stage timings, cache and query counters for GET /metrics (0 = hooks do nothing)
+METRICS = os.getenv("MGS_METRICS", "1").lower() not in {"0", "false", "no"}
 
 
 # Caching
 CACHE_SIZE = int(os.getenv("MGS_CACHE_SIZE", "256"))
-REDIS_URL = os.getenv("REDIS_URL")  # optional
+# Approximate memory budget for cached results (0 = entry count only)
+CACHE_BYTES = int(os.getenv("MGS_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Seconds before a cached result expires (0 = never)
+CACHE_TTL = float(os.getenv("MGS_CACHE_TTL", "0"))
+REDIS_URL = os.getenv("REDIS_URL")  # optional; results are then cached in Redis behind the local LRU
+REDIS_POOL_SIZE = int(os.getenv("MGS_REDIS_POOL_SIZE", "16"))
 
 
 # API/UI
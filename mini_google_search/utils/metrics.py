@@ -0,0 +1,183 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import config
+
+# Process-wide histograms and counters, rendered in the Prometheus text format by render().
+# Each uvicorn worker keeps its own; builds in other processes are merged in via drain/merge.
+ENABLED = config.METRICS
+
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+_HELP = {
+    "mgs_query_stage_seconds": "Time per search stage (analyze/cache/candidates/score/sort/snippet, search = all; dense/fuse for hybrid; suggest, spell)",
+    "mgs_index_stage_seconds": "Time per indexing stage (read/analyze/invert per document, stats/merge/write/vectors per build)",
+    "mgs_query_candidates": "Documents scored per query, where the scorer materialises them",
+    "mgs_query_postings": "Postings in the lists of each query's terms (scanned at most that many)",
+    "mgs_cache_hits_total": "Result cache hits",
+    "mgs_cache_misses_total": "Result cache misses",
+    "mgs_search_coalesced_total": "Searches that waited on an identical in-flight query instead of running it",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last = above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+
+
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, Labels], Histogram] = {}
+_counters: Dict[Tuple[str, Labels], float] = {}
+# Stage seconds of the current request, while a trace() is active
+_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("mgs_trace", default=None)
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels: str) -> None:
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram(buckets)
+        hist.observe(value)
+
+
+def inc(name: str, n: float = 1, **labels: str) -> None:
+    if not ENABLED or not n:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def counter(name: str, **labels: str) -> float:
+    # Current value of a counter in this process (0 if never incremented)
+    with _lock:
+        return _counters.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def record(kind: str, stage: str, seconds: float) -> None:
+    observe(f"mgs_{kind}_stage_seconds", seconds, stage=stage)
+    spans = _trace.get()
+    if spans is not None:
+        spans[stage] = spans.get(stage, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ("kind", "name", "start")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.kind, self.name, time.perf_counter() - self.start)
+        return False
+
+
+_NULL = nullcontext()
+
+
+def stage(kind: str, name: str):
+    # `with stage("query", "score"):` times the block; a shared no-op when nothing listens
+    if not ENABLED and _trace.get() is None:
+        return _NULL
+    return _Stage(kind, name)
+
+
+@contextmanager
+def trace() -> Iterator[Dict[str, float]]:
+    # Collects this request's stage seconds (summed per stage), even with metrics disabled
+    spans: Dict[str, float] = {}
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+def drain() -> Tuple[Dict, Dict]:
+    # Takes everything recorded so far (e.g. in a build subprocess) for merge() elsewhere
+    global _histograms, _counters
+    with _lock:
+        out = (_histograms, _counters)
+        _histograms, _counters = {}, {}
+    return out
+
+
+def merge(drained: Tuple[Dict, Dict]) -> None:
+    histograms, counters = drained
+    with _lock:
+        for key, other in histograms.items():
+            hist = _histograms.get(key)
+            if hist is None:
+                hist = _histograms[key] = Histogram(other.buckets)
+            hist.merge(other)
+        for key, n in counters.items():
+            _counters[key] = _counters.get(key, 0) + n
+
+
+def _labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _number(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render() -> str:
+    lines: List[str] = []
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    seen = set()
+    for (name, labels), hist in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, n in zip(hist.buckets + (float("inf"),), hist.counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(f"{name}_bucket{_labels(labels, (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(hist.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+    for (name, labels), n in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {_number(n)}")
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,6 @@
 import re
-from typing import List
+import sys
+from typing import Callable, Dict, Iterable, List, Tuple
 
 
 _STOPWORDS = {
@@ -21,6 +22,22 @@ def tokenize(text: str) -> List[str]:
     return text.split()
 
 
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize_with_offsets(text: str) -> List[Tuple[str, int, int]]:
+    # Same tokens as tokenize(), each with its [start, end) character span in `text`
+    low = text.lower()
+    if len(low) == len(text):
+        return [(m.group(), m.start(), m.end()) for m in _TOKEN_RE.finditer(low)]
+    # Lowercasing changed the length (e.g. "İ" -> "i̇"): map lowered chars back to sources
+    origin: List[int] = []
+    for i, ch in enumerate(text):
+        origin.extend([i] * len(ch.lower()))
+    low = "".join(ch.lower() for ch in text)
+    return [(m.group(), origin[m.start()], origin[m.end() - 1] + 1) for m in _TOKEN_RE.finditer(low)]
+
+
 def remove_stopwords(tokens: List[str]) -> List[str]:
     return [t for t in tokens if t not in _STOPWORDS]
 
@@ -37,6 +54,73 @@ def lemmatize(tokens: List[str]) -> List[str]:
     return [simple_stem(t) for t in tokens]
 
 
+class Analyzer:
+    # Single pass over the lowered text: every token is looked up once in a memo that maps it
+    # to its interned stem, or to "" for a stopword, so stemming runs once per distinct token
+    # and all occurrences of a term share one string. Stopwords and stemmer are pluggable;
+    # the defaults give exactly lemmatize(remove_stopwords(tokenize(text))).
+    def __init__(
+        self,
+        stopwords: Iterable[str] = _STOPWORDS,
+        stem: Callable[[str], str] = simple_stem,
+        max_memo: int = 500_000,
+    ):
+        self.stopwords = frozenset(stopwords)
+        self.stem = stem
+        self.max_memo = max_memo
+        self._memo: Dict[str, str] = {}
+
+    def term(self, token: str) -> str:
+        # Interned stem of a lowercased token, "" for stopwords
+        term = self._memo.get(token)
+        if term is None:
+            if len(self._memo) >= self.max_memo:
+                self._memo.clear()  # bounded: rare tokens are cheap to recompute
+            term = self._memo[token] = "" if token in self.stopwords else sys.intern(self.stem(token))
+        return term
+
+    def analyze(self, text: str) -> List[str]:
+        memo = self._memo
+        out: List[str] = []
+        for token in _TOKEN_RE.findall(text.lower()):
+            term = memo.get(token)
+            if term is None:
+                term = self.term(token)
+            if term:
+                out.append(term)
+        return out
+
+    def analyze_with_positions(self, text: str) -> List[Tuple[str, int, int, int]]:
+        low = text.lower()
+        if len(low) != len(text):
+            # Length-changing lowercase: offsets need the slow mapping in tokenize_with_offsets
+            return [
+                (term, pos, start, end)
+                for pos, (token, start, end) in enumerate(tokenize_with_offsets(text))
+                if (term := self.term(token))
+            ]
+        memo = self._memo
+        out: List[Tuple[str, int, int, int]] = []
+        for pos, m in enumerate(_TOKEN_RE.finditer(low)):
+            token = m.group()
+            term = memo.get(token)
+            if term is None:
+                term = self.term(token)
+            if term:
+                start, end = m.span()
+                out.append((term, pos, start, end))
+        return out
+
+
+# Used by preprocess/preprocess_with_positions, i.e. by indexing and query parsing alike
+ANALYZER = Analyzer()
+
+
 def preprocess(text: str) -> List[str]:
-    return lemmatize(remove_stopwords(tokenize(text)))
+    return ANALYZER.analyze(text)
+
 
+def preprocess_with_positions(text: str) -> List[Tuple[str, int, int, int]]:
+    # (term, token position, char start, char end); the terms equal preprocess(text).
+    # Positions count stopwords too, so phrase gaps survive stopword removal.
+    return ANALYZER.analyze_with_positions(text)
@@ -0,0 +1,38 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from mini_google_search.backend.indexer import Indexer
+from mini_google_search.benchmarks.corpus import generate_corpus, generate_queries, vocabulary
+
+_VOCAB = 1500
+_SEED = 3
+
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory) -> Path:
+    # Small deterministic Zipfian corpus shared by every test; tests must not modify it
+    data_dir = tmp_path_factory.mktemp("corpus")
+    generate_corpus(data_dir, n_docs=400, doc_len=80, vocab_size=_VOCAB, seed=_SEED)
+    return data_dir
+
+
+@pytest.fixture(scope="session")
+def vocab(corpus) -> List[str]:
+    # The corpus vocabulary, most frequent first
+    return vocabulary(_VOCAB, seed=_SEED)
+
+
+@pytest.fixture(scope="session")
+def queries(vocab) -> List[str]:
+    # Head and tail queries of 1-3 terms
+    return generate_queries(vocab, n_queries=150, head_pool=30, seed=_SEED)
+
+
+@pytest.fixture(scope="session")
+def index_dir(corpus, tmp_path_factory) -> Path:
+    # A full build of the corpus; tests must not modify it
+    index_dir = tmp_path_factory.mktemp("index")
+    Indexer().rebuild_index(corpus, index_dir)
+    return index_dir
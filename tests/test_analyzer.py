@@ -0,0 +1,33 @@
+import pytest
+
+from mini_google_search.benchmarks.analyzer import reference
+from mini_google_search.utils.text_cleaning import Analyzer
+
+_EDGE_CASES = [
+    "",
+    "   \n\t ",
+    "The THE the and a",
+    "Indexing indexed quickly; dogs, cats & bees!!",
+    "ing ed ly s sing bed fly gas",  # suffixes on words too short to stem
+    "v2.0 of x86_64, e-mail: USER@Example.COM (2024-01-31)",
+    "Café naïve résumé — “quoted” ‘text’",
+    "İstanbul KELVIN K ß ﬁ straße",  # lowercasing changes length or maps to ASCII
+    "tab\tnew\nline\u00a0nbsp\u2003em",
+]
+
+
+@pytest.mark.parametrize("text", _EDGE_CASES)
+def test_analyzer_matches_the_old_pipeline(text):
+    analyzer = Analyzer()
+    assert analyzer.analyze(text) == reference(text)
+    assert [t for t, _, _, _ in analyzer.analyze_with_positions(text)] == reference(text)
+
+
+def test_analyzer_matches_the_old_pipeline_on_the_corpus(corpus):
+    analyzer = Analyzer(max_memo=50)  # the memo is cleared many times over
+    for path in sorted(corpus.glob("*.txt")):
+        text = path.read_text(encoding="utf-8")
+        assert analyzer.analyze(text) == reference(text), path.name
+        with_positions = analyzer.analyze_with_positions(text)
+        assert [t for t, _, _, _ in with_positions] == reference(text), path.name
+        assert all(analyzer.term(text[s:e].lower()) == t for t, _, s, e in with_positions)
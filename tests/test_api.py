@@ -0,0 +1,49 @@
+import shutil
+
+import pytest
+
+from mini_google_search.utils import config
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+
+@pytest.fixture
+def client(corpus, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from mini_google_search.backend import api
+    from mini_google_search.backend.jobs import JobQueue
+
+    shutil.copytree(corpus, tmp_path / "data")
+    monkeypatch.setattr(config, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(config, "INDEX_DIR", tmp_path / "index")
+    monkeypatch.setattr(config, "RELOAD_INTERVAL", 0)
+    monkeypatch.setattr(api, "_jobs", JobQueue(state_dir=tmp_path / "index" / "jobs"))
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_index_returns_202_while_queued(client):
+    from mini_google_search.backend import api
+
+    r = client.post("/index")
+    assert r.status_code == 202
+    assert r.json()["status"] in ("queued", "running", "succeeded")
+    assert api._jobs.wait(r.json()["id"]).status == "succeeded"  # done before the tmp dir goes
+
+
+def test_index_wait_returns_the_finished_job(client, monkeypatch):
+    from mini_google_search.backend import api
+
+    r = client.post("/index", params={"wait": "true"})
+    assert r.status_code == 200
+    assert r.json()["status"] == "succeeded" and r.json()["result"] == {"indexed": 400}
+
+    def broken(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(api, "rebuild_in_subprocess", broken)
+    r = client.post("/index", params={"wait": "true"})
+    assert r.status_code == 500
+    assert r.json()["status"] == "failed" and "disk full" in r.json()["error"]
@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.utils import config
+from mini_google_search.utils.caching import LRUCache
+
+
+@pytest.fixture
+def engine(index_dir) -> QueryEngine:
+    engine = QueryEngine(index_dir)
+    engine.cache = LRUCache(maxsize=0)  # every search is scored
+    return engine
+
+
+@pytest.mark.parametrize("ranking", ["bm25", "tfidf"])
+def test_search_many_equals_repeated_search(engine, queries, vocab, ranking):
+    assert config.BATCH_WORKERS > 1  # misses go through the thread pool
+    batch = queries[:80] + queries[:10] + [f"{vocab[3]} AND {vocab[10]}", f'"{vocab[3]} {vocab[10]}"', "", "zzzqqq"]
+    for k in (1, 10):
+        assert engine.search_many(batch, k, ranking=ranking) == [engine.search(q, k, ranking=ranking) for q in batch]
+
+
+def test_batches_share_one_pool(engine, queries, monkeypatch):
+    # The same MGS_BATCH_WORKERS threads score every batch, of this engine and of new ones
+    threads = set()
+    execute = QueryEngine._execute
+
+    def recorded(self, *args):
+        threads.add(threading.current_thread())
+        return execute(self, *args)
+
+    monkeypatch.setattr(QueryEngine, "_execute", recorded)
+    for i in range(5):
+        engine.search_many(queries[i * 20 : (i + 1) * 20], 10)
+        QueryEngine(engine.index_dir).search_many(queries[i * 20 : (i + 1) * 20], 10, ranking="tfidf")
+    assert 1 < len(threads) <= config.BATCH_WORKERS
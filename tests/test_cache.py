@@ -0,0 +1,113 @@
+import pytest
+
+from mini_google_search.utils.caching import LRUCache, RedisCache, TieredCache, decode, encode
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def _results(n: int, snippet: str = "a <mark>term</mark> in context") -> list:
+    return [
+        {"doc_id": f"doc_{i:06d}.txt", "title": f"Doc {i}", "url": "", "score": 1.0 / (i + 1), "snippet": snippet}
+        for i in range(n)
+    ]
+
+
+class _Counting:
+    # Wraps a client to count round trips: MGET calls and executed pipelines
+    def __init__(self, client):
+        self.client = client
+        self.mgets = self.pipelines = 0
+
+    def mget(self, keys):
+        self.mgets += 1
+        return self.client.mget(keys)
+
+    def pipeline(self, transaction=True):
+        pipe = self.client.pipeline(transaction=transaction)
+        execute = pipe.execute
+
+        def counted():
+            self.pipelines += 1
+            return execute()
+
+        pipe.execute = counted
+        return pipe
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.fixture
+def client():
+    return _Counting(fakeredis.FakeRedis())
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        _results(10),
+        _results(100, "x" * 300),  # past the compression threshold
+        [],
+        [{"doc_id": "a", "score": 1.0}],  # not result rows
+        [{"doc_id": "a", "title": "", "url": "", "score": 1.0, "extra": 1}],
+        {"answer": [1, 2.5, "three"]},
+    ],
+)
+def test_encode_round_trips(value):
+    assert decode(encode(value)) == value
+
+
+def test_rows_are_smaller_than_pickle_and_foreign_data_is_a_miss():
+    import pickle
+
+    value = _results(10)
+    assert len(encode(value)) < len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    assert decode(b"\x00" + encode(value)[1:]) is None  # another marshal version
+
+
+def test_redis_batches_use_one_round_trip(client):
+    cache = RedisCache(client, ttl=0)
+    cache.set_many([(f"k{i}", _results(i)) for i in range(5)])
+    assert client.pipelines == 1
+    assert cache.get_many(["k1", "missing", "k4"]) == [_results(1), None, _results(4)]
+    assert client.mgets == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_redis_ttl_maps_to_ex(client):
+    cache = RedisCache(client, ttl=30)
+    cache.set("default", _results(1))
+    cache.set("short", _results(1), ttl=2.5)
+    cache.set("forever", _results(1), ttl=0)
+    assert 0 < client.ttl("default") <= 30
+    assert 0 < client.ttl("short") <= 2
+    assert client.ttl("forever") == -1
+    RedisCache(client, ttl=0).set("none", _results(1))
+    assert client.ttl("none") == -1
+
+
+def test_redis_errors_are_misses():
+    class Down:
+        def mget(self, keys):
+            raise ConnectionError("down")
+
+        def pipeline(self, transaction=True):
+            raise ConnectionError("down")
+
+    cache = RedisCache(Down())
+    cache.set("k", _results(1))
+    assert cache.get_many(["k", "j"]) == [None, None]
+    assert cache.errors == 2 and cache.misses == 2
+
+
+def test_tiered_cache_fills_l1_from_l2(client):
+    shared = RedisCache(client, ttl=0)
+    writer = TieredCache(LRUCache(maxsize=8, max_bytes=0, ttl=0), shared)
+    writer.set_many([("a", _results(2)), ("b", _results(3))])
+    assert writer.l1.get("a") == _results(2)
+
+    reader = TieredCache(LRUCache(maxsize=8, max_bytes=0, ttl=0), RedisCache(client, ttl=0))
+    assert reader.get_many(["a", "b", "c"]) == [_results(2), _results(3), None]
+    assert client.mgets == 1
+    assert reader.get_many(["a", "b"]) == [_results(2), _results(3)]
+    assert client.mgets == 1  # served by L1
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from mini_google_search.backend.indexer import Indexer
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.utils import config
+from mini_google_search.utils.caching import LRUCache
+from mini_google_search.utils.text_cleaning import preprocess
+
+
+@pytest.fixture(scope="module")
+def engine(corpus, tmp_path_factory) -> QueryEngine:
+    index_dir = tmp_path_factory.mktemp("index")
+    indexer = Indexer()
+    indexer.build_index(corpus)
+    indexer.save_index(index_dir, impacts=True)
+    engine = QueryEngine(index_dir)
+    engine.cache = LRUCache(maxsize=0)
+    return engine
+
+
+def _term_queries(queries, vocab):
+    # The generated queries plus head-term ones, whose low idf made a global step round
+    # every posting to the floor impact
+    rnd = random.Random(5)
+    out = [preprocess(q) for q in queries]
+    out += [[rnd.choice(vocab[:30]) for _ in range(rnd.randint(1, 3))] for _ in range(100)]
+    return [t for t in out if t]
+
+
+def test_impact_top_k_tracks_exact_bm25(engine, queries, vocab, monkeypatch):
+    monkeypatch.setattr(config, "IMPACT_BUDGET", 0)
+    impacts = engine._impacts_for(config.BM25_K1, config.BM25_B)
+    assert impacts is not None and impacts.params["per_term"]
+    overlaps = []
+    for terms in _term_queries(queries, vocab):
+        exact = dict(engine._top_k(engine._bm25_scores(terms), 10))
+        if not exact:
+            continue
+        ranked = engine._bm25_impact_top_k(terms, 10, impacts)
+        overlaps.append(len(exact.keys() & {d for d, _ in ranked}) / len(exact))
+        # Each query term is off by at most half of its own step
+        slack = sum(impacts.get(t)[2] / 2 for t in terms if impacts.get(t) is not None) + 1e-12
+        scores = engine._bm25_scores(terms)
+        assert all(abs(s - scores[d]) <= slack for d, s in ranked), terms
+    assert sum(overlaps) / len(overlaps) >= 0.97
+    assert min(overlaps) >= 0.5
+
@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import pytest
+
+from mini_google_search.backend.indexer import Indexer
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.backend.segment import merge_candidates
+from mini_google_search.utils.caching import LRUCache
+
+
+def _engine(index_dir: Path) -> QueryEngine:
+    engine = QueryEngine(index_dir)
+    engine.cache = LRUCache(maxsize=0)  # every search is scored
+    return engine
+
+
+def _upload_in_segments(corpus: Path, index_dir: Path, first: int, step: int) -> None:
+    # The first `first` docs as a full build, the rest as one segment per `step` docs
+    paths = sorted(corpus.glob("*.txt"))
+    idx = Indexer()
+    idx.build_index(corpus, paths=paths[:first])
+    idx.save_index(index_dir)
+    for i in range(first, len(paths), step):
+        assert Indexer().add_documents(paths[i : i + step], corpus, index_dir) == len(paths[i : i + step])
+
+
+@pytest.mark.parametrize("ranking", ["bm25", "tfidf"])
+def test_segments_score_like_a_rebuild(corpus, queries, tmp_path, ranking):
+    Indexer().rebuild_index(corpus, tmp_path / "full")
+    _upload_in_segments(corpus, tmp_path / "multi", first=250, step=30)
+    full, multi = _engine(tmp_path / "full"), _engine(tmp_path / "multi")
+    assert len(list((tmp_path / "multi").glob("seg_*"))) == 6
+    for q in queries:
+        assert multi.search(q, 10, ranking=ranking) == full.search(q, 10, ranking=ranking), q
+
+    while Indexer().maybe_merge(tmp_path / "multi", factor=3):
+        pass
+    merged = _engine(tmp_path / "multi")
+    assert merged.indexer.index.generation != multi.indexer.index.generation
+    for q in queries:
+        assert merged.search(q, 10, ranking=ranking) == full.search(q, 10, ranking=ranking), q
+
+
+def test_merge_policy_folds_tail_into_base():
+    assert merge_candidates([1000] + [1] * 10, 10) == (1, 11)  # a run of same-level segments
+    assert merge_candidates([1000, 50, 20], 10) is None
+    assert merge_candidates([1000, 60, 40], 10) == (0, 3)  # the tail holds 1/10 of the base
+    assert merge_candidates([1000], 10) is None
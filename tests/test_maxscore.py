@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from mini_google_search.backend.indexer import Indexer
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.utils.caching import LRUCache
+
+
+@pytest.fixture(scope="module")
+def engine(corpus, tmp_path_factory) -> QueryEngine:
+    index_dir = tmp_path_factory.mktemp("index")
+    Indexer().rebuild_index(corpus, index_dir)
+    engine = QueryEngine(index_dir)
+    engine.cache = LRUCache(maxsize=0)  # every search is scored
+    return engine
+
+
+def _random_queries(vocab, n: int, seed: int):
+    # 1-6 terms mixing head and tail terms, some repeated, with varying k and BM25 parameters
+    rnd = random.Random(seed)
+    for _ in range(n):
+        terms = [rnd.choice(vocab[:30] if rnd.random() < 0.5 else vocab) for _ in range(rnd.randint(1, 6))]
+        if rnd.random() < 0.3:
+            terms.append(terms[0])
+        yield terms, rnd.choice([1, 3, 10, 50]), *rnd.choice([(1.5, 0.75), (1.2, 0.3), (2.0, 1.0)])
+
+
+def test_maxscore_matches_exhaustive(engine, vocab):
+    for terms, k, k1, b in _random_queries(vocab, 500, seed=7):
+        exhaustive = engine._top_k(engine._bm25_scores(terms, k1, b), k)
+        assert engine._bm25_top_k(terms, k, k1, b) == exhaustive, (terms, k, k1, b)
+
+
+def test_pruned_search_matches_exhaustive_search(engine, queries):
+    exhaustive = [engine.search(q, 10) for q in queries]
+    engine.pruning = True
+    try:
+        assert [engine.search(q, 10) for q in queries] == exhaustive
+    finally:
+        engine.pruning = False
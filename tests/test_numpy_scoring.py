@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.utils import config
+from mini_google_search.utils.caching import LRUCache
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def engines(index_dir, monkeypatch):
+    python = QueryEngine(index_dir)
+    monkeypatch.setattr(config, "SCORING_BACKEND", "numpy")
+    numpy = QueryEngine(index_dir)
+    assert python.scorer is None and numpy.scorer is not None
+    python.cache = LRUCache(maxsize=0)
+    numpy.cache = LRUCache(maxsize=0)
+    return python, numpy
+
+
+def test_numpy_scores_match_python_bit_for_bit(engines, vocab):
+    python, numpy = engines
+    rnd = random.Random(11)
+    for _ in range(300):
+        terms = [rnd.choice(vocab[:30] if rnd.random() < 0.5 else vocab) for _ in range(rnd.randint(1, 5))]
+        k = rnd.choice([1, 10, 50])
+        k1, b = rnd.choice([(1.5, 0.75), (1.2, 0.3), (2.0, 1.0)])
+        assert numpy.scorer.bm25_top_k(terms, k, k1, b) == python._top_k(python._bm25_scores(terms, k1, b), k), terms
+        assert numpy.scorer.tfidf_top_k(terms, k) == python._top_k(python._tfidf_scores(terms), k), terms
+
+
+@pytest.mark.parametrize("ranking", ["bm25", "tfidf"])
+def test_numpy_backend_ranks_like_python(engines, queries, ranking):
+    python, numpy = engines
+    assert numpy.search_many(queries, 10, ranking=ranking) == python.search_many(queries, 10, ranking=ranking)
@@ -0,0 +1,19 @@
+from pathlib import Path
+
+from mini_google_search.backend.indexer import Indexer
+
+
+def _files(root: Path) -> dict:
+    return {str(p.relative_to(root)): p.read_bytes() for p in sorted(root.rglob("*")) if p.is_file()}
+
+
+def test_parallel_build_writes_identical_segment(corpus, tmp_path):
+    serial, parallel = Indexer(), Indexer()
+    serial.build_index(corpus, workers=1)
+    serial.save_index(tmp_path / "serial")
+    parallel.build_index(corpus, workers=3)
+    parallel.save_index(tmp_path / "parallel")
+    a, b = _files(tmp_path / "serial" / "seg_000001"), _files(tmp_path / "parallel" / "seg_000001")
+    assert a.keys() == b.keys()
+    assert {name for name, data in a.items() if data != b[name]} == set()
+    assert (tmp_path / "serial" / "suggest.bin").read_bytes() == (tmp_path / "parallel" / "suggest.bin").read_bytes()
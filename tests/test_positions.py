@@ -0,0 +1,24 @@
+from mini_google_search.backend.indexer import Indexer
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.backend.segment import Postings
+
+
+def test_occurrences_across_segments(corpus, vocab, tmp_path):
+    # A full build plus two uploaded segments, so postings are merged at read time
+    paths = sorted(corpus.glob("*.txt"))
+    idx = Indexer()
+    idx.build_index(corpus, paths=paths[:300])
+    idx.save_index(tmp_path)
+    for i in range(300, len(paths), 50):
+        Indexer().add_documents(paths[i : i + 50], corpus, tmp_path)
+    index = QueryEngine(tmp_path).indexer.index.inverted_index
+    for term in vocab[:20] + vocab[-20:]:
+        p = index.get(term)
+        if p is None:
+            continue
+        lazy = Postings(doc_ids=p.doc_ids, tfs=p.tfs, positions=p.positions)  # no stored offsets
+        for i in range(len(p)):
+            first = sum(p.tfs[:i])
+            expected = list(p.positions[3 * first : 3 * (first + p.tfs[i])])
+            assert list(p.occurrences(i)) == expected
+            assert list(lazy.occurrences(i)) == expected
@@ -0,0 +1,61 @@
+from mini_google_search.backend.query_parser import Bool, Near, Phrase, Term, parse_query
+
+
+def test_chained_near_keeps_every_link():
+    q = parse_query("alpha NEAR/2 beta NEAR/3 gamma")
+    assert q.root == Bool(must=[Near("alpha", "beta", 2), Near("beta", "gamma", 3)])
+    assert q.terms == ["alpha", "beta", "gamma"]
+
+
+def test_phrase_operand_of_near_stays_required():
+    phrase = Phrase([("machine", 0), ("learn", 1)])
+    assert parse_query('"machine learning" NEAR/3 model').root == Bool(must=[phrase, Near("learn", "model", 3)])
+    assert parse_query('model NEAR/3 "machine learning"').root == Bool(must=[Near("model", "machine", 3), phrase])
+
+
+def test_negated_near_chain_is_excluded_as_a_whole():
+    q = parse_query('data -"machine learning" NEAR/3 model')
+    assert q.root == Bool(
+        should=[Term("data")],
+        must_not=[Bool(must=[Phrase([("machine", 0), ("learn", 1)]), Near("learn", "model", 3)])],
+    )
+    assert parse_query("data -alpha NEAR beta").root == Bool(should=[Term("data")], must_not=[Near("alpha", "beta", 10)])
+
+
+def test_near_with_a_stopword_operand_is_dropped():
+    assert parse_query("alpha NEAR the").root == Bool(should=[Term("alpha")])
+
+
+def test_plain_query_is_a_bag_of_terms():
+    q = parse_query("The indexing of documents")
+    assert q.root == Bool(should=[Term("index"), Term("document")])
+    assert q.terms == ["index", "document"] and not q.constrained
+
+
+def test_signs_and_not():
+    assert parse_query("+data -model table").root == Bool(
+        must=[Term("data")], should=[Term("table")], must_not=[Term("model")]
+    )
+    q = parse_query("data NOT model")
+    assert q.root == Bool(should=[Term("data")], must_not=[Term("model")])
+    assert q.terms == ["data"]  # negated terms do not score
+    assert parse_query('NOT "data model"').root == Bool(must_not=[Phrase([("data", 0), ("model", 1)])])
+    # A sign only counts at the start of a unit
+    assert parse_query("foo - bar e-mail").root == Bool(should=[Term("foo"), Term("bar"), Term("e"), Term("mail")])
+
+
+def test_and_binds_tighter_than_or():
+    q = parse_query("data model AND system OR table")
+    assert q.root == Bool(should=[Bool(must=[Term("model"), Term("system")], should=[Term("data")]), Term("table")])
+    assert parse_query("data OR model OR system").root == Bool(should=[Term("data"), Term("model"), Term("system")])
+
+
+def test_parentheses_group():
+    assert parse_query("(data OR model) AND system").root == Bool(
+        must=[Bool(should=[Term("data"), Term("model")]), Term("system")]
+    )
+    assert parse_query("-(data model) system").root == Bool(
+        should=[Term("system")], must_not=[Bool(should=[Term("data"), Term("model")])]
+    )
+    assert parse_query("data AND (model").root == Bool(must=[Term("data"), Bool(should=[Term("model")])])
+    assert parse_query("data) OR model").root == Bool(should=[Term("data"), Term("model")])  # unmatched ")"
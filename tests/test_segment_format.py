@@ -0,0 +1,57 @@
+import json
+import pickle
+
+import pytest
+
+from mini_google_search.backend.indexer import Indexer
+
+
+@pytest.fixture(scope="module")
+def built(corpus) -> Indexer:
+    indexer = Indexer()
+    indexer.build_index(corpus)
+    return indexer
+
+
+def _assert_same_index(loaded, built):
+    assert (loaded.N, loaded.avgdl) == (built.N, built.avgdl)
+    assert list(loaded.doc_lengths) == list(built.doc_lengths)
+    assert list(loaded.doc_paths) == list(built.doc_paths)
+    assert [loaded.documents[i] for i in range(loaded.N)] == list(built.documents)
+    assert sorted(loaded.inverted_index) == sorted(built.inverted_index)
+    for term, p in built.inverted_index.items():
+        q = loaded.inverted_index[term]
+        assert (list(q.doc_ids), list(q.tfs)) == (list(p.doc_ids), list(p.tfs)), term
+        assert list(q.positions) == list(p.positions), term
+        assert loaded.doc_freq[term] == built.doc_freq[term]
+        assert loaded.idf[term] == built.idf[term]
+
+
+def test_segment_round_trips_the_built_index(built, tmp_path):
+    built.save_index(tmp_path)
+    meta = json.loads((tmp_path / "meta.json").read_text())
+    assert (meta["format"], meta["version"]) == ("mgs-segment", 2)
+    loaded = Indexer()
+    loaded.load_index(tmp_path)
+    _assert_same_index(loaded.index, built.index)
+
+
+def test_legacy_pickle_loads_and_migrates(built, tmp_path):
+    with (tmp_path / "index.pkl").open("wb") as f:
+        pickle.dump(built.index, f)
+    legacy = Indexer()
+    legacy.load_index(tmp_path)
+    assert legacy.index.generation.startswith("pkl-")
+    assert Indexer().migrate_index(tmp_path)
+    assert not Indexer().migrate_index(tmp_path)  # already migrated
+    migrated = Indexer()
+    migrated.load_index(tmp_path)
+    _assert_same_index(migrated.index, built.index)
+
+
+def test_unknown_versions_are_rejected(built, tmp_path):
+    built.save_index(tmp_path)
+    meta = json.loads((tmp_path / "meta.json").read_text())
+    (tmp_path / "meta.json").write_text(json.dumps({**meta, "version": 99}))
+    with pytest.raises(ValueError, match="Unsupported"):
+        Indexer().load_index(tmp_path)
@@ -0,0 +1,78 @@
+import heapq
+import shutil
+
+import pytest
+
+from mini_google_search.backend.indexer import Indexer
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.backend.query_parser import parse_query
+from mini_google_search.backend.sharding import ShardedEngine, add_to_shards, build_shards
+from mini_google_search.utils import config
+from mini_google_search.utils.caching import LRUCache
+
+
+def _boolean_queries(vocab):
+    a, b, c = vocab[3], vocab[10], vocab[40]
+    return [f'"{a} {b}"', f"{a} AND {b}", f"{a} -{c}", f"({a} OR {c}) AND {b}", f"{a} NEAR/5 {b}", "zzzqqq"]
+
+
+def _raw_top_k(sharded, parsed, mode, k):
+    # (score, global docid) before rendering, i.e. without the rounding of result dicts
+    idx = sharded.indexer.index
+    doc_freq = sharded._doc_freqs(parsed.terms)
+    replies = sharded._scatter("search", ([parsed], mode, k, config.BM25_K1, config.BM25_B, idx.N, idx.avgdl, doc_freq))
+    hits = [(base + d, score) for base, reply in zip(sharded.bases, replies) for score, d, _ in reply[0]]
+    return heapq.nsmallest(k, hits, key=lambda h: (-h[1], h[0]))
+
+
+@pytest.fixture
+def data_dir(corpus, tmp_path):
+    # A copy of the corpus with its last 40 docs held back for upload
+    data_dir = tmp_path / "data"
+    shutil.copytree(corpus, data_dir)
+    held = tmp_path / "held"
+    held.mkdir()
+    for path in sorted(data_dir.glob("*.txt"))[-40:]:
+        path.rename(held / path.name)
+    return data_dir
+
+
+def _assert_same(plain, sharded, queries):
+    assert (sharded.indexer.index.N, sharded.indexer.index.avgdl) == (plain.indexer.index.N, plain.indexer.index.avgdl)
+    for mode in ("bm25", "tfidf"):
+        for k in (1, 10):
+            assert sharded.search_many(queries, k, ranking=mode) == plain.search_many(queries, k, ranking=mode)
+    for q in queries:
+        parsed = parse_query(q)
+        lookup = plain.indexer.index.inverted_index
+        expected = plain._rank(parsed, "bm25", 10, config.BM25_K1, config.BM25_B, lookup)
+        assert _raw_top_k(sharded, parsed, "bm25", 10) == expected, q
+
+
+def test_sharded_results_equal_single_index(data_dir, tmp_path, queries, vocab):
+    queries = list(dict.fromkeys(queries[:60])) + _boolean_queries(vocab)
+    Indexer().rebuild_index(data_dir, tmp_path / "plain")
+    build_shards(data_dir, tmp_path / "sharded", 3)
+    plain, sharded = QueryEngine(tmp_path / "plain"), ShardedEngine(tmp_path / "sharded")
+    try:
+        plain.cache = LRUCache(maxsize=0)
+        sharded.cache = LRUCache(maxsize=0)
+        assert len(sharded.shards) == 3
+        _assert_same(plain, sharded, queries)
+    finally:
+        sharded.close()
+
+    # Uploads go to the last shard and keep the docids an unsharded index gives them
+    uploaded = []
+    for path in sorted((tmp_path / "held").glob("*.txt")):
+        uploaded.append(data_dir / path.name)
+        path.rename(uploaded[-1])
+    Indexer().add_documents(uploaded, data_dir, tmp_path / "plain")
+    add_to_shards(uploaded, data_dir, tmp_path / "sharded")
+    plain, sharded = QueryEngine(tmp_path / "plain"), ShardedEngine(tmp_path / "sharded")
+    try:
+        plain.cache = LRUCache(maxsize=0)
+        sharded.cache = LRUCache(maxsize=0)
+        _assert_same(plain, sharded, queries)
+    finally:
+        sharded.close()
@@ -0,0 +1,85 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.utils import metrics
+from mini_google_search.utils.caching import LRUCache, SingleFlight
+
+_N = 8
+
+
+@pytest.fixture(autouse=True)
+def counting(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+
+
+def _wait_for_waiters(before: float, n: int) -> None:
+    deadline = time.monotonic() + 10
+    while metrics.counter("mgs_search_coalesced_total") - before < n:
+        assert time.monotonic() < deadline, "callers were not coalesced"
+        time.sleep(0.001)
+
+
+def _run_concurrently(call, release: threading.Event):
+    # _N callers at once; the leader's computation is held until every other caller waits on it
+    before = metrics.counter("mgs_search_coalesced_total")
+    with ThreadPoolExecutor(max_workers=_N) as pool:
+        futures = [pool.submit(call) for _ in range(_N)]
+        try:
+            _wait_for_waiters(before, _N - 1)
+        finally:
+            release.set()
+        return futures
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait()
+        return ["result"]
+
+    futures = _run_concurrently(lambda: flights.do("q", compute), release)
+    results = [f.result() for f in futures]
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert flights.do("q", compute) == ["result"] and len(calls) == 2  # finished flights are not reused
+
+
+def test_waiters_get_the_leaders_exception():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait()
+        raise ValueError("boom")
+
+    futures = _run_concurrently(lambda: flights.do("q", fail), release)
+    for f in futures:
+        with pytest.raises(ValueError, match="boom"):
+            f.result()
+
+
+def test_identical_searches_are_computed_once(index_dir, queries, monkeypatch):
+    engine = QueryEngine(index_dir)
+    engine.cache = LRUCache(maxsize=0)  # nothing is served from the cache
+    release = threading.Event()
+    execute = engine._execute
+    calls = []
+
+    def counted(*args):
+        calls.append(1)
+        release.wait()
+        return execute(*args)
+
+    monkeypatch.setattr(engine, "_execute", counted)
+    futures = _run_concurrently(lambda: engine.search(queries[0], 10), release)
+    results = [f.result() for f in futures]
+    assert len(calls) == 1
+    assert results == [results[0]] * _N and results[0]
@@ -0,0 +1,53 @@
+import pytest
+
+from mini_google_search.backend.indexer import Indexer
+from mini_google_search.backend.query_engine import QueryEngine
+from mini_google_search.backend.suggest import edit_limit
+from mini_google_search.utils import config
+
+
+_DOCS = {
+    "ir.txt": "Retrieval\nInformation retrieval ranks documents with an inverted index.\n",
+    "ml.txt": "Learning\nMachine learning models learn from data.\n",
+    "fn.txt": "Functions\nA hash function maps keys to buckets of a table.\n",
+}
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory) -> QueryEngine:
+    data_dir = tmp_path_factory.mktemp("spelling")
+    for name, text in _DOCS.items():
+        (data_dir / name).write_text(text, encoding="utf-8")
+    index_dir = data_dir / "index"
+    Indexer().rebuild_index(data_dir, index_dir)
+    return QueryEngine(index_dir)
+
+
+def test_typos_are_corrected(engine):
+    assert engine.did_you_mean("retrival of fuctions") == "retrieval of functions"
+    assert engine.did_you_mean("machne lerning") == "machine learning"
+    assert engine.did_you_mean("tabel") == "table"  # one edit on a short word
+    assert engine.did_you_mean("tbel") is None  # two edits on a short word
+
+
+def test_short_tokens_are_not_corrected(engine):
+    assert [edit_limit(w) for w in ("x", "ab", "abc", "abcde", "abcdef")] == [0, 0, 1, 1, 2]
+    assert engine.did_you_mean("x NEAR/3 y") is None
+    assert engine.corrections(["q", "zz"]) == {}
+
+
+def test_search_on_an_empty_index_returns_no_results(tmp_path, monkeypatch):
+    # did_you_mean runs whenever nothing matched; an empty index has no deletion index
+    from fastapi.testclient import TestClient
+
+    from mini_google_search.backend import api
+
+    (tmp_path / "data").mkdir()
+    monkeypatch.setattr(config, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(config, "INDEX_DIR", tmp_path / "index")
+    monkeypatch.setattr(config, "RELOAD_INTERVAL", 0)
+    with TestClient(api.app) as client:
+        for params in ({"q": "hello"}, {"q": "hello wrld", "fuzzy": "true"}):
+            r = client.get("/search", params=params)
+            assert r.status_code == 200
+            assert r.json()["results"] == [] and r.json()["did_you_mean"] is None